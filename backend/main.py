@@ -3,7 +3,9 @@ Lab Co-Pilot — FastAPI application entry point.
 """
 
 import json
+import logging
 import math
+from contextlib import asynccontextmanager
 
 import numpy as np
 from fastapi import FastAPI
@@ -41,11 +43,32 @@ class SafeJSONResponse(JSONResponse):
 
 load_dotenv()
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pre-fork the sandbox workers before the server starts handling requests
+    from services.sandbox import get_pool, shutdown_pool
+    from services.knowledge_base import flush, warmup
+    from services.doc_processor import shutdown_extract_pool
+    from services.history import remove_stale_payloads
+    get_pool()
+    remove_stale_payloads()
+    try:
+        warmup()
+    except Exception as e:  # search still works, it just pays the cost lazily
+        logging.getLogger("lab-copilot").warning("Knowledge base warmup failed: %s", e)
+    yield
+    shutdown_pool()
+    shutdown_extract_pool()
+    flush()
+
+
 app = FastAPI(
     title="Lab Co-Pilot API",
     description="Natural-language lab assistant for data analysis, document Q&A, and visualization.",
     version="0.1.0",
     default_response_class=SafeJSONResponse,
+    lifespan=lifespan,
 )
 
 # ── CORS ─────────────────────────────────────────────────────────────────────
@@ -76,3 +99,10 @@ def root():
 @app.get("/health")
 def health():
     return {"status": "ok"}
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Process-wide counters and histograms (sandbox, search, ingestion, chat)."""
+    from services.metrics import snapshot
+    return snapshot()
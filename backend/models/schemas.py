@@ -82,40 +82,140 @@ class DocUploadResponse(BaseModel):
     filename: str
     num_chunks: int
     entities: list[dict[str, str]]
+    chunks_embedded: Optional[int] = None
+    chunks_reused: Optional[int] = None
+    chunks_deleted: Optional[int] = None
 
 
 class DocSearchRequest(BaseModel):
-    query: str
+    query: Optional[str] = None
+    queries: Optional[list[str]] = None  # several queries searched in one batch
     top_k: int = 5
+    mode: str = "vector"  # vector, lexical, hybrid
+    dedupe: bool = False  # with queries: return each chunk only once
+    documents: Optional[list[str]] = None  # doc ids or names to search within
+    chunk_start: Optional[int] = None  # first chunk index (inclusive)
+    chunk_end: Optional[int] = None  # last chunk index (inclusive)
+    page_start: Optional[int] = None  # first page (inclusive)
+    page_end: Optional[int] = None  # last page (inclusive)
 
 
 class DocSearchResult(BaseModel):
     text: str
     document: str
     score: float
+    doc_id: Optional[str] = None
+    page: Optional[int] = None
+    start: Optional[int] = None  # offsets in the document text, for /{doc_id}/context
+    end: Optional[int] = None
 
 
-class DocSearchResponse(BaseModel):
+class DocSearchGroup(BaseModel):
+    query: str
     results: list[DocSearchResult]
 
 
+class DocSearchResponse(BaseModel):
+    results: list[DocSearchResult] = []
+    groups: Optional[list[DocSearchGroup]] = None  # one per query when `queries` is used
+
+
+class DocContextResponse(BaseModel):
+    doc_id: str
+    document: str
+    start: int
+    end: int
+    before: str
+    text: str
+    after: str
+
+
 class DocListItem(BaseModel):
     doc_id: str
     name: str
     num_chunks: int
 
 
+class DocDeleteResponse(BaseModel):
+    doc_id: str
+    deleted_chunks: int
+
+
+class IngestJobStatus(BaseModel):
+    job_id: str
+    filename: str
+    status: str  # queued, running, done, failed
+    doc_id: Optional[str] = None
+    pages_total: Optional[int] = None
+    pages_processed: int = 0
+    num_chunks: int = 0
+    chunks_indexed: int = 0  # newly embedded
+    chunks_reused: int = 0
+    chunks_deleted: int = 0
+    entity_seconds_per_page: Optional[float] = None
+    error: Optional[str] = None
+    elapsed_seconds: Optional[float] = None
+
+
+class BulkIngestStatus(BaseModel):
+    job_id: str
+    status: str  # queued, running, done
+    files_total: int = 0
+    files_done: int = 0
+    files_failed: int = 0
+    chunks_indexed: int = 0
+    files: list[IngestJobStatus] = []  # one per PDF, including rejected files
+    elapsed_seconds: Optional[float] = None
+
+
+class ReindexRequest(BaseModel):
+    reembed: bool = False  # embed every chunk again (after an embedding-model change)
+
+
+class ReindexFailure(BaseModel):
+    doc_id: str
+    name: str
+    error: str
+
+
+class ReindexJobStatus(BaseModel):
+    job_id: str
+    status: str  # queued, running, done, failed
+    reembed: bool = False
+    chunk_size: int
+    chunk_overlap: int
+    docs_total: int = 0
+    docs_done: int = 0
+    docs_skipped: int = 0  # no cached text; re-upload the PDF once to cache it
+    docs_failed: int = 0
+    num_chunks: int = 0
+    chunks_indexed: int = 0  # newly embedded
+    chunks_reused: int = 0
+    chunks_deleted: int = 0
+    failures: list[ReindexFailure] = []
+    error: Optional[str] = None
+    elapsed_seconds: Optional[float] = None
+
+
 # ── Chat Module ──────────────────────────────────────────────────────────────
 
 class ChatMessageRequest(BaseModel):
     message: str
 
 
+class ToolTiming(BaseModel):
+    name: str
+    seconds: float
+    error: Optional[str] = None
+
+
 class ChatMessageResponse(BaseModel):
     text: str
     plot_json: Optional[str] = None
     table_data: Optional[list[dict[str, Any]]] = None
     table_columns: Optional[list[str]] = None
+    tool_timings: list[ToolTiming] = []  # in the order the model called them
+    tools_seconds: Optional[float] = None  # wall time of the (concurrent) tool phase
 
 
 class ChatHistoryItem(BaseModel):
@@ -124,3 +224,11 @@ class ChatHistoryItem(BaseModel):
     plot_json: Optional[str] = None
     table_data: Optional[list[dict[str, Any]]] = None
     table_columns: Optional[list[str]] = None
+    payload_id: Optional[str] = None  # plot/table stored on disk; GET /payloads/{payload_id}
+
+
+class ChatPayloadResponse(BaseModel):
+    payload_id: str
+    plot_json: Optional[str] = None
+    table_data: Optional[list[dict[str, Any]]] = None
+    table_columns: Optional[list[str]] = None
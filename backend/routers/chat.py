@@ -1,17 +1,22 @@
 """
-Chat router — message handling, history, clear.
+Chat router — message handling (plain and streamed), history, clear.
 """
 
 from __future__ import annotations
 
+import json
+from typing import Any
+
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 
-import store
-from services.llm import chat
+from services import history
+from services.llm import chat_async, chat_stream
 from models.schemas import (
     ChatMessageRequest,
     ChatMessageResponse,
     ChatHistoryItem,
+    ChatPayloadResponse,
 )
 
 router = APIRouter()
@@ -20,12 +25,12 @@ router = APIRouter()
 # send message
 
 @router.post("/message", response_model=ChatMessageResponse)
-def send_message(req: ChatMessageRequest):
+async def send_message(req: ChatMessageRequest):
     """Send a message to the Lab Co-Pilot and get a response."""
     if not req.message.strip():
         raise HTTPException(status_code=400, detail="Message cannot be empty.")
     try:
-        result = chat(req.message)
+        result = await chat_async(req.message)
     except RuntimeError as e:
         raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
@@ -36,30 +41,82 @@ def send_message(req: ChatMessageRequest):
         plot_json=result.get("plot_json"),
         table_data=result.get("table_data"),
         table_columns=result.get("table_columns"),
+        tool_timings=result.get("tool_timings") or [],
+        tools_seconds=result.get("tools_seconds"),
+    )
+
+
+# stream message
+
+def _sse(event: dict[str, Any]) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+@router.post("/stream")
+async def stream_message(req: ChatMessageRequest):
+    """
+    Send a message and receive the response as Server-Sent Events:
+    tool_call / tool_result / plot / table events while tools run, token
+    events as the answer is generated, and a final done event with the
+    full response and time_to_first_token.
+    """
+    if not req.message.strip():
+        raise HTTPException(status_code=400, detail="Message cannot be empty.")
+    events = chat_stream(req.message)
+    try:
+        # Configuration errors become a normal HTTP error, not a broken stream
+        first = await anext(events)
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def body():
+        yield _sse(first)
+        async for event in events:
+            yield _sse(event)
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
 # history
 
 @router.get("/history")
-def get_history():
-    """Return conversation history."""
+def get_history(payloads: bool = True):
+    """
+    Return conversation history. Plots and tables are read back from disk;
+    with payloads=false only their payload_id is returned.
+    """
     items = []
-    for h in store.conversation_history:
+    for h in history.messages():
+        payload = history.get_payload(h["payload_id"]) if payloads and h.get("payload_id") else None
+        payload = payload or {}
         items.append(ChatHistoryItem(
             role=h["role"],
             content=h["content"],
-            plot_json=h.get("plot_json"),
-            table_data=h.get("table_data"),
-            table_columns=h.get("table_columns"),
+            plot_json=payload.get("plot_json"),
+            table_data=payload.get("table_data"),
+            table_columns=payload.get("table_columns"),
+            payload_id=h.get("payload_id"),
         ))
     return {"history": items}
 
 
+@router.get("/payloads/{payload_id}", response_model=ChatPayloadResponse)
+def get_payload(payload_id: str):
+    """The plot and/or table an assistant message showed."""
+    payload = history.get_payload(payload_id)
+    if payload is None:
+        raise HTTPException(status_code=404, detail="Payload not found.")
+    return ChatPayloadResponse(payload_id=payload_id, **payload)
+
+
 # clear
 
 @router.post("/clear")
 def clear_history():
     """Clear conversation history."""
-    store.conversation_history.clear()
+    history.clear()
     return {"status": "cleared"}
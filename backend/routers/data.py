@@ -21,6 +21,8 @@ from services.data_engine import (
     describe_data,
     generate_plot,
 )
+from services import metrics
+from services.sandbox import snippet_stats
 from models.schemas import (
     UploadDataResponse,
     UploadedFileInfo,
@@ -107,12 +109,11 @@ async def upload_data(file: UploadFile = File(...)):
     for fname, df in loaded_frames:
         try:
             file_id = uuid.uuid4().hex[:12]
-            store.data_frames[file_id] = df
-            store.data_meta[file_id] = {
+            store.put_data_frame(file_id, df, {
                 "filename": fname,
                 "columns": list(df.columns),
                 "row_count": len(df),
-            }
+            })
             store.active_dataset_id = file_id  # last one becomes active
 
             col_info = get_column_info(df)
@@ -212,3 +213,16 @@ def plot_endpoint(req: PlotRequest):
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Plot error: {e}")
     return PlotResponse(plot_json=plot_json, plot_type=req.plot_type)
+
+
+# ── Sandbox accounting ───────────────────────────────────────────────────────
+
+@router.get("/sandbox/stats")
+def sandbox_stats(limit: int = 20):
+    """Aggregated sandbox resource usage and the most CPU-hungry snippets."""
+    snap = metrics.snapshot()
+    return {
+        "counters": {k: v for k, v in snap["counters"].items() if k.startswith("sandbox.")},
+        "histograms": {k: v for k, v in snap["histograms"].items() if k.startswith("sandbox.")},
+        "top_snippets": snippet_stats(limit),
+    }
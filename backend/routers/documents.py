@@ -1,25 +1,46 @@
 """
-Documents router — PDF upload, search, and listing.
+Documents router — PDF upload, background and bulk ingestion, library re-index,
+search, and listing.
 """
 
 from __future__ import annotations
 
-import uuid
+import os
+import shutil
+import tempfile
+
 from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi.concurrency import run_in_threadpool
 
-import store
-from services.doc_processor import extract_text_from_pdf, chunk_text, extract_entities_simple
+from services import doc_catalog, text_cache
+from services.ingest import (
+    ingest_pdf,
+    submit as submit_ingest,
+    get_job,
+    submit_bulk,
+    get_bulk_job,
+    submit_reindex,
+    get_reindex_job,
+)
 from services.knowledge_base import (
-    add_document,
+    KB_CONTEXT_CHARS,
+    delete_document as kb_delete_document,
+    get_context as kb_get_context,
     search as kb_search,
-    list_documents,
 )
 from models.schemas import (
     DocUploadResponse,
     DocSearchRequest,
     DocSearchResponse,
     DocSearchResult,
+    DocSearchGroup,
+    DocContextResponse,
     DocListItem,
+    DocDeleteResponse,
+    IngestJobStatus,
+    BulkIngestStatus,
+    ReindexRequest,
+    ReindexJobStatus,
 )
 
 router = APIRouter()
@@ -27,62 +48,215 @@ router = APIRouter()
 
 # upload PDF
 
-@router.post("/upload", response_model=DocUploadResponse)
-async def upload_document(file: UploadFile = File(...)):
-    """Upload a PDF, extract text, chunk, embed, and index."""
+def _require_pdf(file: UploadFile) -> None:
     if not file.filename or not file.filename.lower().endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Only PDF files are supported.")
-    try:
-        contents = await file.read()
-        text = extract_text_from_pdf(contents)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Failed to read PDF: {e}")
 
-    if not text.strip():
-        raise HTTPException(status_code=400, detail="Could not extract any text from the PDF.")
 
-    chunks = chunk_text(text)
-    entities = extract_entities_simple(text)
+def _require_revision_target(revision_of: str | None) -> None:
+    if revision_of is not None and doc_catalog.get_document(revision_of) is None:
+        raise HTTPException(status_code=404, detail=f"Document not found: {revision_of}")
 
-    doc_id = uuid.uuid4().hex[:12]
-    num_chunks = add_document(doc_id, file.filename, chunks)
 
-    store.document_meta[doc_id] = {
-        "name": file.filename,
-        "num_chunks": num_chunks,
-        "entities": entities,
-    }
+@router.post("/upload", response_model=DocUploadResponse)
+async def upload_document(file: UploadFile = File(...), revision_of: str | None = None):
+    """
+    Upload a PDF, extract text, chunk, embed, and index.
+
+    Identical content is not re-indexed; other content is a new document,
+    even under an existing filename. Pass ?revision_of=<doc_id> to replace
+    that document instead: it keeps its doc_id and only changed chunks are
+    embedded.
+    """
+    _require_pdf(file)
+    _require_revision_target(revision_of)
+    contents = await file.read()
+
+    try:
+        # Extraction and embedding are CPU-bound; keep them off the event loop
+        result = await run_in_threadpool(ingest_pdf, contents, file.filename, revision_of=revision_of)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     return DocUploadResponse(
-        doc_id=doc_id,
-        filename=file.filename,
-        num_chunks=num_chunks,
-        entities=entities[:20],
+        doc_id=result["doc_id"],
+        filename=result["filename"],
+        num_chunks=result["num_chunks"],
+        entities=result["entities"][:20],
+        chunks_embedded=result["embedded"],
+        chunks_reused=result["reused"],
+        chunks_deleted=result["deleted"],
     )
 
 
+# background ingestion
+
+@router.post("/ingest", response_model=IngestJobStatus, status_code=202)
+async def ingest_document(file: UploadFile = File(...), revision_of: str | None = None):
+    """
+    Queue a PDF for background ingestion and return its job immediately.
+    Poll /jobs/{job_id} for progress; the document is searchable as soon
+    as its first chunks are indexed. ?revision_of=<doc_id> works as for /upload.
+    """
+    _require_pdf(file)
+    _require_revision_target(revision_of)
+    contents = await file.read()
+    job = submit_ingest(contents, file.filename, revision_of=revision_of)
+    return IngestJobStatus(**job.snapshot())
+
+
+@router.get("/jobs/{job_id}", response_model=IngestJobStatus)
+def get_ingest_job(job_id: str):
+    """Progress of a background ingestion job."""
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found.")
+    return IngestJobStatus(**job.snapshot())
+
+
+# bulk ingestion
+
+def _save_uploads(files: list[UploadFile], workdir: str) -> list[tuple[str, str]]:
+    saved = []
+    for i, file in enumerate(files):
+        path = os.path.join(workdir, f"{i}.upload")
+        with open(path, "wb") as out:
+            shutil.copyfileobj(file.file, out, 1 << 20)
+        saved.append((os.path.basename(file.filename or f"upload-{i}"), path))
+    return saved
+
+
+@router.post("/bulk", response_model=BulkIngestStatus, status_code=202)
+async def bulk_ingest(files: list[UploadFile] = File(...)):
+    """
+    Queue several PDFs and/or ZIP files of PDFs for ingestion as one job.
+    Files are extracted in parallel and embedded together; poll
+    /bulk/{job_id} for per-file progress, results and errors.
+    """
+    workdir = tempfile.mkdtemp(prefix="lab-copilot-bulk-")
+    try:
+        # Spooled to disk, so a large library is not held in memory
+        uploads = await run_in_threadpool(_save_uploads, files, workdir)
+    except BaseException:
+        shutil.rmtree(workdir, ignore_errors=True)
+        raise
+    job = submit_bulk(uploads, workdir)
+    return BulkIngestStatus(**job.snapshot())
+
+
+@router.get("/bulk/{job_id}", response_model=BulkIngestStatus)
+def get_bulk_status(job_id: str):
+    """Per-file progress of a bulk ingestion job."""
+    job = get_bulk_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found.")
+    return BulkIngestStatus(**job.snapshot())
+
+
+# re-index
+
+@router.post("/reindex", response_model=ReindexJobStatus, status_code=202)
+def reindex_library(req: ReindexRequest = ReindexRequest()):
+    """
+    Rebuild chunks and embeddings for every document from the cached
+    extracted text (current CHUNK_SIZE / CHUNK_OVERLAP, embedding model and
+    vector backend). Runs in the background; poll /reindex/{job_id}.
+    """
+    try:
+        job = submit_reindex(reembed=req.reembed)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return ReindexJobStatus(**job.snapshot())
+
+
+@router.get("/reindex/{job_id}", response_model=ReindexJobStatus)
+def get_reindex_status(job_id: str):
+    """Progress of a library re-index."""
+    job = get_reindex_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found.")
+    return ReindexJobStatus(**job.snapshot())
+
+
 # search
 
 @router.post("/search", response_model=DocSearchResponse)
 def search_documents(req: DocSearchRequest):
-    """Semantic search across all indexed documents."""
-    results = kb_search(req.query, top_k=req.top_k)
+    """
+    Semantic, lexical or hybrid search across all indexed documents.
+    Pass `queries` to run several searches in one batch (grouped per query),
+    and `documents` / `chunk_start` / `chunk_end` / `page_start` / `page_end`
+    to search only part of the library.
+    """
+    queries = ([req.query] if req.query else []) + (req.queries or [])
+    if not queries:
+        raise HTTPException(status_code=400, detail="Provide query or queries.")
+    try:
+        grouped = kb_search(
+            queries,
+            top_k=req.top_k,
+            mode=req.mode,
+            dedupe=req.dedupe,
+            documents=req.documents,
+            chunk_range=(req.chunk_start, req.chunk_end),
+            page_range=(req.page_start, req.page_end),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if req.queries is None:
+        return DocSearchResponse(
+            results=[DocSearchResult(**r) for r in grouped[0]]
+        )
     return DocSearchResponse(
-        results=[DocSearchResult(**r) for r in results]
+        groups=[
+            DocSearchGroup(query=q, results=[DocSearchResult(**r) for r in results])
+            for q, results in zip(queries, grouped)
+        ]
     )
 
 
+# context
+
+@router.get("/{doc_id}/context", response_model=DocContextResponse)
+def get_chunk_context(doc_id: str, start: int, end: int, chars: int = KB_CONTEXT_CHARS):
+    """
+    Text around a search hit: pass the hit's doc_id, start and end; up to
+    `chars` characters either side are read from the extracted-text cache.
+    """
+    if doc_catalog.get_document(doc_id) is None:
+        raise HTTPException(status_code=404, detail=f"Document not found: {doc_id}")
+    try:
+        return DocContextResponse(**kb_get_context(doc_id, start, end, chars))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 # list 
 
 @router.get("/list")
 def list_docs():
     """Return all indexed documents."""
-    doc_names = list_documents()
     items = []
-    for doc_id, meta in store.document_meta.items():
+    for doc in doc_catalog.list_documents():
         items.append(DocListItem(
-            doc_id=doc_id,
-            name=meta["name"],
-            num_chunks=meta["num_chunks"],
+            doc_id=doc["doc_id"],
+            name=doc["name"],
+            num_chunks=doc["num_chunks"],
         ))
     return {"documents": items}
+
+
+# delete
+
+@router.delete("/{doc_id}", response_model=DocDeleteResponse)
+def delete_doc(doc_id: str):
+    """Remove a document and all of its chunks from the index."""
+    doc = doc_catalog.get_document(doc_id)
+    if doc is None:
+        raise HTTPException(status_code=404, detail=f"Document not found: {doc_id}")
+    deleted = kb_delete_document(doc_id, doc["name"])
+    doc_catalog.delete_document(doc_id)
+    if doc["content_hash"]:
+        text_cache.delete(doc["content_hash"])
+    return DocDeleteResponse(doc_id=doc_id, deleted_chunks=deleted)
@@ -0,0 +1,89 @@
+"""
+Small thread-safe LRU cache shared by the services.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class LRUCache:
+    """
+    Least-recently-used cache bounded by entry count and, optionally, by a
+    total weight (e.g. bytes) computed with `weigh(value)`. `on_evict(key,
+    value)` is called, outside the lock, for entries pushed out by the bounds.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 128,
+        max_weight: int | None = None,
+        weigh: Callable[[Any], int] | None = None,
+        on_evict: Callable[[Hashable, Any], None] | None = None,
+    ):
+        self.maxsize = maxsize
+        self.max_weight = max_weight
+        self._weigh = weigh or (lambda _value: 0)
+        self._on_evict = on_evict
+        self._data: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self._weight = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        weight = self._weigh(value)
+        evicted = []
+        with self._lock:
+            if self.max_weight is not None and weight > self.max_weight:
+                return  # would evict everything else; not worth caching
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._weight -= old[1]
+            self._data[key] = (value, weight)
+            self._weight += weight
+            while self._data and (
+                len(self._data) > self.maxsize
+                or (self.max_weight is not None and self._weight > self.max_weight)
+            ):
+                old_key, (old_value, w) = self._data.popitem(last=False)
+                self._weight -= w
+                evicted.append((old_key, old_value))
+        if self._on_evict is not None:
+            for old_key, old_value in evicted:
+                self._on_evict(old_key, old_value)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None:
+                return default
+            self._weight -= entry[1]
+            return entry[0]
+
+    def values(self) -> list[Any]:
+        with self._lock:
+            return [value for value, _ in self._data.values()]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._weight = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
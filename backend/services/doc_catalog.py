@@ -0,0 +1,135 @@
+"""
+Document catalog — persistent per-document metadata in SQLite.
+
+One row per indexed document (name, chunk count, entities, content hash),
+stored next to the Chroma data so it survives restarts along with the
+vectors. Listing documents reads this table instead of scanning the
+metadata of every chunk in the collection.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any
+
+_catalog_path = os.getenv(
+    "DOC_CATALOG_PATH",
+    os.path.join(os.getenv("CHROMA_DB_PATH", "./chroma_db"), "catalog.sqlite3"),
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id       TEXT PRIMARY KEY,
+    name         TEXT NOT NULL,
+    num_chunks   INTEGER NOT NULL DEFAULT 0,
+    entities     TEXT NOT NULL DEFAULT '[]',
+    content_hash TEXT,
+    created_at   REAL NOT NULL,
+    updated_at   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS documents_content_hash ON documents (content_hash);
+CREATE INDEX IF NOT EXISTS documents_name ON documents (name);
+"""
+
+_lock = threading.Lock()
+_conn: sqlite3.Connection | None = None
+# Bumped on every change; lets callers cache anything derived from the catalog
+_version = 0
+
+
+def _get_conn() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(_catalog_path) or ".", exist_ok=True)
+        conn = sqlite3.connect(_catalog_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        _conn = conn
+    return _conn
+
+
+def _row_to_dict(row: sqlite3.Row) -> dict[str, Any]:
+    doc = dict(row)
+    doc["entities"] = json.loads(doc["entities"])
+    return doc
+
+
+def version() -> int:
+    return _version
+
+
+def _changed() -> None:
+    global _version
+    _version += 1
+
+
+# ── Writes ───────────────────────────────────────────────────────────────────
+
+def upsert_document(
+    doc_id: str,
+    name: str,
+    num_chunks: int,
+    entities: list[dict[str, str]],
+    content_hash: str | None = None,
+) -> None:
+    now = time.time()
+    with _lock:
+        conn = _get_conn()
+        with conn:
+            conn.execute(
+                """
+                INSERT INTO documents (doc_id, name, num_chunks, entities, content_hash, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (doc_id) DO UPDATE SET
+                    name = excluded.name,
+                    num_chunks = excluded.num_chunks,
+                    entities = excluded.entities,
+                    content_hash = excluded.content_hash,
+                    updated_at = excluded.updated_at
+                """,
+                (doc_id, name, num_chunks, json.dumps(entities), content_hash, now, now),
+            )
+        _changed()
+
+
+def delete_document(doc_id: str) -> bool:
+    with _lock:
+        conn = _get_conn()
+        with conn:
+            deleted = conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,)).rowcount
+        if deleted:
+            _changed()
+    return bool(deleted)
+
+
+# ── Reads ────────────────────────────────────────────────────────────────────
+
+def get_document(doc_id: str) -> dict[str, Any] | None:
+    with _lock:
+        row = _get_conn().execute("SELECT * FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+    return _row_to_dict(row) if row else None
+
+
+def find_by_hash(content_hash: str) -> dict[str, Any] | None:
+    with _lock:
+        row = _get_conn().execute(
+            "SELECT * FROM documents WHERE content_hash = ? LIMIT 1", (content_hash,)
+        ).fetchone()
+    return _row_to_dict(row) if row else None
+
+
+def count() -> int:
+    with _lock:
+        return _get_conn().execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+
+def list_documents() -> list[dict[str, Any]]:
+    """All documents, oldest first."""
+    with _lock:
+        rows = _get_conn().execute("SELECT * FROM documents ORDER BY created_at").fetchall()
+    return [_row_to_dict(r) for r in rows]
@@ -1,73 +1,410 @@
 """
 Document processing — PDF text extraction, chunking, entity extraction.
+
+Pages are extracted in ranges of PDF_PAGES_PER_TASK. Documents with at
+least PDF_PARALLEL_MIN_PAGES pages are spread over a pool of
+PDF_EXTRACT_WORKERS processes, and results come back in page order with
+their page numbers. Plain text comes from pdfium (pypdfium2, C++). Pass
+layout=True to use pdfplumber's character-level layout analysis instead,
+which is much slower.
+
+Entities come from a spaCy NER pipeline that is loaded once per process
+(all other components disabled) and run with `nlp.pipe` over every chunk
+of a document.
 """
 
 from __future__ import annotations
 
+import atexit
+import bisect
 import io
-from typing import Any
+import logging
+import multiprocessing as mp
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Iterable, Iterator, NamedTuple
 
 import pdfplumber
 
+from services import metrics
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # pdfplumber's layout path still works
+    pdfium = None
+
+logger = logging.getLogger("lab-copilot.docs")
+
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "32"))
+
+# Changing these takes effect for existing documents after a library re-index
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "500"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "50"))
+
+SPACY_MODEL = os.getenv("SPACY_MODEL", "")  # default: en_core_sci_sm, then en_core_web_sm
+SPACY_BATCH_SIZE = int(os.getenv("SPACY_BATCH_SIZE", "64"))
+SPACY_PROCESSES = int(os.getenv("SPACY_PROCESSES", str(min(4, os.cpu_count() or 1))))
+# nlp.pipe worker processes each unpickle the model; only worth it for long documents
+SPACY_PARALLEL_MIN_PAGES = int(os.getenv("SPACY_PARALLEL_MIN_PAGES", "50"))
+
+_RATE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# pdfium is not thread-safe; serialize in-process use (pool workers are single-threaded)
+_pdfium_lock = threading.Lock()
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
 
 # ── PDF text extraction ──────────────────────────────────────────────────────
 
-def extract_text_from_pdf(file_bytes: bytes) -> str:
-    """Extract plain text from a PDF file."""
-    buf = io.BytesIO(file_bytes)
-    text_parts: list[str] = []
-    with pdfplumber.open(buf) as pdf:
+def _use_pdfium(layout: bool) -> bool:
+    return not layout and pdfium is not None
+
+
+def page_count(source: str | bytes, layout: bool) -> int:
+    if _use_pdfium(layout):
+        with _pdfium_lock:
+            pdf = pdfium.PdfDocument(source)
+            try:
+                return len(pdf)
+            finally:
+                pdf.close()
+    with pdfplumber.open(io.BytesIO(source) if isinstance(source, bytes) else source) as pdf:
+        return len(pdf.pages)
+
+
+def _extract_range(source: str | bytes, start: int, end: int, layout: bool) -> list[tuple[int, str]]:
+    """
+    Text of pages [start, end) as (1-based page number, text). `source` is
+    PDF bytes, or a file path when running in a pool worker.
+    """
+    pages: list[tuple[int, str]] = []
+    if _use_pdfium(layout):
+        with _pdfium_lock:
+            pdf = pdfium.PdfDocument(source)
+            try:
+                for i in range(start, end):
+                    page = pdf[i]
+                    textpage = page.get_textpage()
+                    text = textpage.get_text_range()
+                    textpage.close()
+                    page.close()
+                    pages.append((i + 1, text.replace("\r\n", "\n").strip()))
+            finally:
+                pdf.close()
+        return pages
+
+    buf = io.BytesIO(source) if isinstance(source, bytes) else source
+    with pdfplumber.open(buf, pages=list(range(start + 1, end + 1))) as pdf:
         for page in pdf.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text_parts.append(page_text)
-    return "\n\n".join(text_parts)
+            pages.append((page.page_number, (page.extract_text() or "").strip()))
+    return pages
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            ctx = mp.get_context("forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn")
+            _pool = ProcessPoolExecutor(max_workers=max(PDF_EXTRACT_WORKERS, 1), mp_context=ctx)
+    return _pool
+
+
+def shutdown_extract_pool() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+atexit.register(shutdown_extract_pool)
+
+
+def iter_pages(
+    file_bytes: bytes,
+    layout: bool = False,
+    parallel: bool | None = None,
+) -> Iterator[tuple[int, str]]:
+    """
+    Yield (page number, text) for every page, in page order.
+
+    parallel: None decides by page count; True/False forces the process pool
+    on or off. Ranges are submitted at most 2 × PDF_EXTRACT_WORKERS ahead of
+    the consumer, so a slow consumer does not buffer the whole document.
+    """
+    t0 = time.perf_counter()
+    n = page_count(file_bytes, layout)
+    step = max(PDF_PAGES_PER_TASK, 1)
+    ranges = [(start, min(start + step, n)) for start in range(0, n, step)]
+    if parallel is None:
+        parallel = n >= PDF_PARALLEL_MIN_PAGES and PDF_EXTRACT_WORKERS > 1
+
+    if not parallel:
+        for start, end in ranges:
+            yield from _extract_range(file_bytes, start, end, layout)
+    else:
+        # Workers read the PDF from a temp file rather than each receiving a copy
+        fd, path = tempfile.mkstemp(suffix=".pdf")
+        pending: deque = deque()
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(file_bytes)
+            pool = _get_pool()
+            todo = iter(ranges)
+
+            def submit_next() -> bool:
+                page_range = next(todo, None)
+                if page_range is not None:
+                    pending.append(pool.submit(_extract_range, path, *page_range, layout))
+                return page_range is not None
+
+            while len(pending) < max(PDF_EXTRACT_WORKERS, 1) * 2 and submit_next():
+                pass
+            while pending:
+                pages = pending.popleft().result()
+                submit_next()
+                yield from pages
+        finally:
+            for future in pending:
+                future.cancel()
+            os.unlink(path)
+
+    elapsed = time.perf_counter() - t0
+    metrics.increment("pdf.pages_extracted", n)
+    metrics.observe("pdf.extract_seconds", elapsed)
+    if n:
+        metrics.observe("pdf.pages_per_second", n / elapsed if elapsed > 0 else float(n), _RATE_BUCKETS)
+    logger.info("Extracted %d pages in %.2fs (%s%s)", n, elapsed,
+                "pdfplumber" if not _use_pdfium(layout) else "pdfium",
+                ", parallel" if parallel else "")
+
+
+def extract_text_from_pdf(file_bytes: bytes, layout: bool = False) -> str:
+    """Extract plain text from a PDF file."""
+    return "\n\n".join(text for _, text in iter_pages(file_bytes, layout=layout) if text)
 
 
 # ── Text chunking ────────────────────────────────────────────────────────────
 
+_PAGE_SEPARATOR = "\n\n"
+# Preferred chunk ends, best first; a chunk ends after the first character
+_BREAKS = (
+    ("\n\n",),
+    (". ", "? ", "! ", ".\n", "?\n", "!\n", '." ', ".) "),
+    (" ", "\n", "\t"),
+)
+
+
+class Span(NamedTuple):
+    """A chunk and where it came from: [start, end) in the blank-line-joined page texts."""
+
+    text: str
+    page: int  # page the chunk starts on
+    page_end: int  # page it ends on
+    start: int
+    end: int
+
+    def metadata(self) -> dict[str, int]:
+        return {"page": self.page, "page_end": self.page_end, "start": self.start, "end": self.end}
+
+
+def _chunk_end(buf: str, start: int, limit: int) -> int:
+    """
+    Where the chunk starting at `start` should end: the last paragraph,
+    sentence or word break in the second half of the window, else `limit`.
+    `buf` must extend past `limit`.
+    """
+    floor = start + (limit - start) // 2
+    for breaks in _BREAKS:
+        best = max(buf.rfind(b, floor, limit + 1) for b in breaks)
+        if best >= 0:
+            return best + 1
+    return limit
+
+
+def _overlap_start(buf: str, start: int, end: int, overlap: int) -> int:
+    """
+    Start of the next chunk: at most `overlap` characters back from `end`,
+    at the first sentence (else word) start in that stretch.
+    """
+    # At most half the chunk, so every chunk moves forward by half its length
+    back = min(overlap, (end - start) // 2)
+    if back <= 0:
+        return end
+    at = end - back
+    for breaks in _BREAKS:
+        found = [i for i in (buf.find(b, at, end) for b in breaks) if i >= 0]
+        if found:
+            return min(found) + 1
+    return at
+
+
+def iter_spans(
+    pages: Iterable[tuple[int, str]],
+    chunk_size: int = CHUNK_SIZE,
+    overlap: int = CHUNK_OVERLAP,
+) -> Iterator[Span]:
+    """
+    Chunk a stream of (page number, text) pairs into spans of at most
+    `chunk_size` characters.
+
+    Chunks end at a paragraph, sentence or word break where one falls in
+    the second half of the window, and the next one starts `overlap`
+    characters earlier on a word. Offsets are into the page texts joined by
+    blank lines — the layout of the text cache — so a span can be read back
+    with its surroundings without the PDF. Each boundary search only looks
+    inside one window, so the whole pass is linear in the text length, and
+    only the unfinished tail is kept in memory.
+    """
+    if not 0 <= overlap < chunk_size:
+        raise ValueError(f"Chunk overlap ({overlap}) must be smaller than chunk size ({chunk_size}).")
+    buf = ""
+    base = 0  # document offset of buf[0]
+    pos = 0  # start of the next chunk in buf
+    page_starts: list[int] = []
+    page_numbers: list[int] = []
+
+    def page_at(offset: int) -> int:
+        return page_numbers[bisect.bisect_right(page_starts, offset) - 1]
+
+    def cut(final: bool) -> Iterator[Span]:
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos].isspace():
+                pos += 1
+            remaining = len(buf) - pos
+            if remaining == 0 or (remaining <= chunk_size and not final):
+                return
+            last = remaining <= chunk_size
+            end = len(buf) if last else _chunk_end(buf, pos, pos + chunk_size)
+            stop = end
+            while buf[stop - 1].isspace():
+                stop -= 1
+            yield Span(buf[pos:stop], page_at(base + pos), page_at(base + stop - 1), base + pos, base + stop)
+            pos = len(buf) if last else _overlap_start(buf, pos, stop, overlap)
+
+    for page_number, text in pages:
+        if page_numbers:
+            buf += _PAGE_SEPARATOR
+        page_starts.append(base + len(buf))
+        page_numbers.append(page_number)
+        buf += text
+        yield from cut(final=False)
+        buf = buf[pos:]
+        base += pos
+        pos = 0
+    if page_numbers:
+        yield from cut(final=True)
+
+
+def iter_chunks(
+    texts: Iterable[str],
+    chunk_size: int = CHUNK_SIZE,
+    overlap: int = CHUNK_OVERLAP,
+) -> Iterator[str]:
+    """Chunk a stream of texts (e.g. pages) as `iter_spans` does, yielding only the text."""
+    for span in iter_spans(enumerate(texts, 1), chunk_size, overlap):
+        yield span.text
+
+
 def chunk_text(
     text: str,
-    chunk_size: int = 500,
-    overlap: int = 50,
+    chunk_size: int = CHUNK_SIZE,
+    overlap: int = CHUNK_OVERLAP,
 ) -> list[str]:
     """
-    Split text into overlapping chunks of roughly `chunk_size` characters.
+    Split text into overlapping chunks of at most `chunk_size` characters,
+    on sentence or word boundaries where possible.
     """
-    if not text:
-        return []
-    chunks: list[str] = []
-    start = 0
-    while start < len(text):
-        end = start + chunk_size
-        chunk = text[start:end]
-        chunks.append(chunk.strip())
-        start = end - overlap
-    return [c for c in chunks if c]
+    return list(iter_chunks([text], chunk_size, overlap))
 
 
-# ── Entity extraction (lightweight, no spaCy required) ───────────────────────
+# ── Entity extraction (spaCy, optional) ─────────────────────────────────────
 
-def extract_entities_simple(text: str) -> list[dict[str, str]]:
+# Only NER (and the embedding layer it may listen to) is needed
+_NER_PIPES = ("tok2vec", "transformer", "ner")
+_nlp: Any = None  # loaded pipeline, False if spaCy or its models are missing
+_nlp_lock = threading.Lock()
+
+
+def load_nlp() -> Any:
     """
-    Lightweight keyword-based entity extraction.
-    Returns a list of {'text': ..., 'label': ...} dicts.
-    Falls back gracefully if spaCy or the sci model isn't installed.
+    Return the shared spaCy pipeline, loading it on first use with every
+    component except NER disabled. Returns None if spaCy or a model is not
+    installed.
     """
+    global _nlp
+    if _nlp is None:
+        with _nlp_lock:
+            if _nlp is None:
+                _nlp = _load_nlp()
+    return _nlp or None
+
+
+def _load_nlp() -> Any:
     try:
         import spacy
+    except ImportError:
+        logger.info("spaCy not installed; entity extraction disabled")
+        return False
+    models = [SPACY_MODEL] if SPACY_MODEL else ["en_core_sci_sm", "en_core_web_sm"]
+    for name in models:
+        t0 = time.perf_counter()
         try:
-            nlp = spacy.load("en_core_sci_sm")
+            nlp = spacy.load(name)
         except OSError:
-            nlp = spacy.load("en_core_web_sm")
-        doc = nlp(text[:10000])  # limit to avoid OOM on huge docs
-        seen: set[str] = set()
-        entities: list[dict[str, str]] = []
+            continue
+        if "ner" not in nlp.pipe_names:
+            logger.warning("spaCy model %s has no NER component; skipping", name)
+            continue
+        nlp.select_pipes(enable=[p for p in nlp.pipe_names if p in _NER_PIPES])
+        elapsed = time.perf_counter() - t0
+        metrics.observe("nlp.load_seconds", elapsed)
+        logger.info("Loaded spaCy model %s in %.2fs (pipes: %s)", name, elapsed, ", ".join(nlp.pipe_names))
+        return nlp
+    logger.info("No spaCy model found (tried %s); entity extraction disabled", ", ".join(models))
+    return False
+
+
+def extract_entities(
+    texts: Iterable[str],
+    parallel: bool = False,
+    limit: int = 50,
+) -> list[dict[str, str]]:
+    """
+    Named entities over a stream of texts (e.g. all chunks of a document),
+    run through `nlp.pipe` in batches of SPACY_BATCH_SIZE, on SPACY_PROCESSES
+    processes when `parallel`. Returns up to `limit` distinct
+    {'text': ..., 'label': ...} dicts, most frequent first.
+    """
+    nlp = load_nlp()
+    if nlp is None:
+        for _ in texts:  # still drain the stream so producers do not stall
+            pass
+        return []
+    n_process = max(SPACY_PROCESSES, 1) if parallel else 1
+    counts: dict[tuple[str, str], int] = {}
+    first_seen: dict[tuple[str, str], str] = {}
+    for doc in nlp.pipe(texts, batch_size=max(SPACY_BATCH_SIZE, 1), n_process=n_process):
         for ent in doc.ents:
             key = (ent.text.lower(), ent.label_)
-            if key not in seen:
-                seen.add(key)
-                entities.append({"text": ent.text, "label": ent.label_})
-        return entities[:50]  # cap at 50
-    except ImportError:
-        return []
+            counts[key] = counts.get(key, 0) + 1
+            first_seen.setdefault(key, ent.text)
+    ranked = sorted(counts, key=lambda key: -counts[key])  # stable: ties keep first-seen order
+    return [{"text": first_seen[key], "label": key[1]} for key in ranked[:limit]]
+
+
+def extract_entities_simple(text: str) -> list[dict[str, str]]:
+    """
+    Entities in one piece of text, split into chunks for the NER pipeline.
+    Returns a list of {'text': ..., 'label': ...} dicts, or [] if spaCy or
+    a model isn't installed.
+    """
+    return extract_entities(iter_chunks([text], chunk_size=5000, overlap=100))
@@ -0,0 +1,250 @@
+"""
+Conversation history — bounded in memory, budgeted in the prompt.
+
+Each chat message is kept as {"role", "content", "payload_id", "payload_note"}.
+The plot / table an assistant turn showed (a Plotly figure can be megabytes)
+is written to disk under HISTORY_PAYLOAD_PATH and referenced by id; the
+message keeps only a one-line note of what was shown, which is also what the
+model is told about it.
+
+At most HISTORY_MAX_MESSAGES messages stay in memory. Older ones are folded
+into a rolling abbreviated summary (capped at HISTORY_SUMMARY_CHARS) and their
+payload files are deleted, so a long session holds a bounded amount of memory
+and disk.
+
+`context()` assembles the history part of a prompt under a token budget:
+the newest messages verbatim while they fit in HISTORY_TOKEN_BUDGET, and
+everything older as one abbreviated summary message. Tokens are estimated
+at ~4 characters each, which is close for English text with Mistral's
+tokenizer and needs no extra dependency.
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import logging
+import os
+import threading
+import uuid
+from typing import Any
+
+import store
+from services import metrics
+
+logger = logging.getLogger("lab-copilot.history")
+
+HISTORY_PAYLOAD_PATH = os.getenv(
+    "HISTORY_PAYLOAD_PATH",
+    os.path.join(os.getenv("CHROMA_DB_PATH", "./chroma_db"), "chat_payloads"),
+)
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "100"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "6000"))
+HISTORY_SUMMARY_CHARS = int(os.getenv("HISTORY_SUMMARY_CHARS", "4000"))
+
+_CHARS_PER_TOKEN = 4
+_SUMMARY_USER_CHARS = 200
+_SUMMARY_ASSISTANT_CHARS = 300
+
+# Token counts, 64 … 128k
+_TOKEN_BUCKETS = tuple(float(2 ** p) for p in range(6, 18))
+
+_lock = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // _CHARS_PER_TOKEN + 1
+
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 3] + "..."
+
+
+# ── Payloads ─────────────────────────────────────────────────────────────────
+
+def _payload_path(payload_id: str) -> str:
+    return os.path.join(HISTORY_PAYLOAD_PATH, f"{payload_id}.json.gz")
+
+
+def _save_payload(payload: dict[str, Any]) -> str:
+    payload_id = uuid.uuid4().hex
+    os.makedirs(HISTORY_PAYLOAD_PATH, exist_ok=True)
+    data = json.dumps(payload, default=str).encode()
+    # Level 1: a figure compresses well even at the fastest level
+    with gzip.open(_payload_path(payload_id), "wb", compresslevel=1) as f:
+        f.write(data)
+    metrics.observe("history.payload_bytes", len(data), metrics.BYTES_BUCKETS)
+    return payload_id
+
+
+def get_payload(payload_id: str) -> dict[str, Any] | None:
+    """The plot / table stored for a message, or None if it is gone."""
+    if not payload_id.isalnum():
+        return None
+    try:
+        with gzip.open(_payload_path(payload_id), "rb") as f:
+            return json.loads(f.read())
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning("Unreadable chat payload %s: %s", payload_id, e)
+        return None
+
+
+def _delete_payload(payload_id: str | None) -> None:
+    if payload_id:
+        try:
+            os.unlink(_payload_path(payload_id))
+        except FileNotFoundError:
+            pass
+
+
+def _payload_note(plot_json: str | None, table_data: list[dict[str, Any]] | None,
+                  table_columns: list[str] | None) -> str | None:
+    shown = []
+    if plot_json:
+        try:
+            figure = json.loads(plot_json)
+            title = (figure.get("layout") or {}).get("title")
+            title = title.get("text") if isinstance(title, dict) else title
+            kinds = sorted({t.get("type", "scatter") for t in figure.get("data") or []})
+            shown.append(f"a {'/'.join(kinds) or 'plot'} chart" + (f" titled '{title}'" if title else ""))
+        except (TypeError, ValueError, AttributeError):
+            shown.append("a chart")
+    if table_data is not None:
+        columns = table_columns or (list(table_data[0]) if table_data else [])
+        listed = ", ".join(map(str, columns[:10])) + (", ..." if len(columns) > 10 else "")
+        shown.append(f"a table of {len(table_data)} rows ({listed})")
+    return f"[Shown to the user: {' and '.join(shown)}]" if shown else None
+
+
+# ── Recording ────────────────────────────────────────────────────────────────
+
+def _summary_line(message: dict[str, Any]) -> str:
+    if message["role"] == "user":
+        return f"- User: {_clip(message['content'], _SUMMARY_USER_CHARS)}"
+    line = f"- Assistant: {_clip(message['content'], _SUMMARY_ASSISTANT_CHARS)}"
+    return f"{line} {message['payload_note']}" if message.get("payload_note") else line
+
+
+def _trim_summary(lines: list[str], limit: int) -> list[str]:
+    """The newest lines whose total length fits in `limit` characters."""
+    kept, used = [], 0
+    for line in reversed(lines):
+        used += len(line) + 1
+        if used > limit:
+            break
+        kept.append(line)
+    return kept[::-1]
+
+
+def _append(message: dict[str, Any]) -> None:
+    with _lock:
+        store.conversation_history.append(message)
+        overflow = len(store.conversation_history) - max(HISTORY_MAX_MESSAGES, 2)
+        evicted = store.conversation_history[:overflow] if overflow > 0 else []
+        if evicted:
+            del store.conversation_history[:len(evicted)]
+            store.conversation_summary[:] = _trim_summary(
+                store.conversation_summary + [_summary_line(m) for m in evicted], HISTORY_SUMMARY_CHARS,
+            )
+    for m in evicted:
+        _delete_payload(m.get("payload_id"))
+    if evicted:
+        metrics.increment("history.evicted_messages", len(evicted))
+
+
+def add_user(content: str) -> None:
+    _append({"role": "user", "content": content, "payload_id": None, "payload_note": None})
+
+
+def add_assistant(content: str, plot_json: str | None = None,
+                  table_data: list[dict[str, Any]] | None = None,
+                  table_columns: list[str] | None = None) -> None:
+    """Record an assistant turn. Writes its plot / table to disk, so it blocks."""
+    payload_id = note = None
+    if plot_json or table_data is not None:
+        note = _payload_note(plot_json, table_data, table_columns)
+        try:
+            payload_id = _save_payload({
+                "plot_json": plot_json, "table_data": table_data, "table_columns": table_columns,
+            })
+        except OSError as e:  # the answer is still recorded, just without its payload
+            logger.warning("Could not store chat payload: %s", e)
+    _append({"role": "assistant", "content": content, "payload_id": payload_id, "payload_note": note})
+
+
+def messages() -> list[dict[str, Any]]:
+    with _lock:
+        return list(store.conversation_history)
+
+
+def clear() -> None:
+    with _lock:
+        removed = list(store.conversation_history)
+        store.conversation_history.clear()
+        store.conversation_summary.clear()
+    for m in removed:
+        _delete_payload(m.get("payload_id"))
+
+
+def remove_stale_payloads() -> int:
+    """Delete payload files left by a previous process (history is in memory)."""
+    with _lock:
+        live = {m["payload_id"] for m in store.conversation_history if m.get("payload_id")}
+    removed = 0
+    try:
+        names = os.listdir(HISTORY_PAYLOAD_PATH)
+    except FileNotFoundError:
+        return 0
+    for name in names:
+        if name.endswith(".json.gz") and name[:-len(".json.gz")] not in live:
+            _delete_payload(name[:-len(".json.gz")])
+            removed += 1
+    return removed
+
+
+# ── Prompt context ───────────────────────────────────────────────────────────
+
+def _model_content(message: dict[str, Any]) -> str:
+    note = message.get("payload_note")
+    return f"{message['content']}\n{note}" if note else message["content"]
+
+
+def context(budget: int = HISTORY_TOKEN_BUDGET) -> list[dict[str, str]]:
+    """
+    History messages for a prompt within `budget` estimated tokens: recent
+    messages verbatim, older ones (and evicted ones) as one summary message.
+    """
+    with _lock:
+        history = list(store.conversation_history)
+        summary = list(store.conversation_summary)
+
+    # Up to a quarter of the budget is kept for the summary of older turns
+    recent_budget = budget - budget // 4
+    recent: list[dict[str, str]] = []
+    used = 0
+    for message in reversed(history):
+        content = _model_content(message)
+        tokens = estimate_tokens(content)
+        if used + tokens > recent_budget:
+            break
+        recent.append({"role": message["role"], "content": content})
+        used += tokens
+    recent.reverse()
+    while recent and recent[0]["role"] != "user":  # start on a user turn
+        used -= estimate_tokens(recent.pop(0)["content"])
+
+    older = history[:len(history) - len(recent)]
+    if older:
+        metrics.increment("history.summarized_messages", len(older))
+    lines = _trim_summary(
+        summary + [_summary_line(m) for m in older],
+        (budget - used) * _CHARS_PER_TOKEN,
+    )
+    metrics.observe("history.context_tokens", used, _TOKEN_BUCKETS)
+    if not lines:
+        return recent
+    header = "Earlier in this conversation (older turns, abbreviated):"
+    return [{"role": "system", "content": "\n".join([header, *lines])}, *recent]
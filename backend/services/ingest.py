@@ -0,0 +1,751 @@
+"""
+Document ingestion — PDF → pages → chunks → embeddings → index as one
+streaming pipeline.
+
+Pages are extracted on a producer thread (which itself uses the extraction
+process pool for long documents) and handed over through a bounded queue of
+INGEST_PAGE_QUEUE pages. Chunks are cut from the page stream as it arrives,
+embedded in batches on the knowledge base's embedding pool, and each batch
+is written to the index as soon as it is ready. The same chunks are fed
+through a bounded queue to a spaCy NER thread. Extraction, embedding,
+indexing and entity extraction overlap; memory holds a few pages and
+batches rather than the whole text; and the document is searchable from
+its first batch.
+
+`ingest_pdf` runs the pipeline in the calling thread (used by /upload).
+`submit` runs it as a background job on INGEST_WORKERS threads; `get_job`
+reports its progress. `submit_bulk` ingests many PDFs (or ZIPs of PDFs) as
+one job: BULK_WORKERS files at a time, every file's pages extracted on the
+process pool so extraction spreads over all cores, and all of their chunks
+embedded through the knowledge base's shared batching queue. Files are
+read from disk only when their turn comes.
+
+Extracted pages are also streamed into the text cache (services.text_cache)
+under the PDF's content hash, and every chunk is stored with its page and
+offsets into that text. `submit_reindex` rebuilds chunks and
+embeddings for the whole library from that cache — after changing
+CHUNK_SIZE / CHUNK_OVERLAP, the embedding model or the vector backend —
+on REINDEX_WORKERS threads, without the original PDFs.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import itertools
+import logging
+import os
+import posixpath
+import queue
+import shutil
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterator
+
+from services import doc_catalog, doc_processor, knowledge_base, metrics, text_cache
+from services.cache import LRUCache
+
+logger = logging.getLogger("lab-copilot.ingest")
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_PAGE_QUEUE = int(os.getenv("INGEST_PAGE_QUEUE", "32"))
+INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", "200"))
+REINDEX_WORKERS = int(os.getenv("REINDEX_WORKERS", str(INGEST_WORKERS)))
+BULK_WORKERS = int(os.getenv("BULK_WORKERS", str(max(INGEST_WORKERS, doc_processor.PDF_EXTRACT_WORKERS))))
+BULK_MAX_FILES = int(os.getenv("BULK_MAX_FILES", "500"))
+BULK_MAX_FILE_BYTES = int(os.getenv("BULK_MAX_FILE_BYTES", str(200 * 2**20)))
+
+_END = object()
+
+_jobs = LRUCache(maxsize=INGEST_JOB_HISTORY)
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+_inflight: dict[str, threading.Event] = {}
+_inflight_lock = threading.Lock()
+_bulk_jobs = LRUCache(maxsize=20)
+_reindex_jobs = LRUCache(maxsize=20)
+_reindex_lock = threading.Lock()
+_reindex_active: ReindexJob | None = None
+
+
+class IngestJob:
+    """Progress of one document ingestion; updated in place by the pipeline."""
+
+    def __init__(self, filename: str):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.filename = filename
+        self.status = "queued"  # queued, running, done, failed
+        self.doc_id: str | None = None
+        self.pages_total: int | None = None
+        self.pages_processed = 0
+        self.num_chunks = 0
+        self.chunks_indexed = 0
+        self.chunks_reused = 0
+        self.chunks_deleted = 0
+        self.entities: list[dict[str, str]] = []
+        self.entity_seconds_per_page: float | None = None
+        self.error: str | None = None
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+
+    def snapshot(self) -> dict[str, Any]:
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = round((self.finished_at or time.time()) - self.started_at, 3)
+        return {
+            "job_id": self.job_id,
+            "filename": self.filename,
+            "status": self.status,
+            "doc_id": self.doc_id,
+            "pages_total": self.pages_total,
+            "pages_processed": self.pages_processed,
+            "num_chunks": self.num_chunks,
+            "chunks_indexed": self.chunks_indexed,
+            "chunks_reused": self.chunks_reused,
+            "chunks_deleted": self.chunks_deleted,
+            "entity_seconds_per_page": self.entity_seconds_per_page,
+            "error": self.error,
+            "elapsed_seconds": elapsed,
+        }
+
+
+# ── Pipeline ─────────────────────────────────────────────────────────────────
+
+def _threaded(items: Iterator[Any], maxsize: int, name: str) -> Iterator[Any]:
+    """
+    Run the `items` iterator on a producer thread and yield its results
+    through a bounded queue. Producer errors are re-raised here; if the
+    consumer stops early, the producer stops and closes `items`.
+    """
+    handoff: queue.Queue = queue.Queue(maxsize=max(maxsize, 1))
+    stop = threading.Event()
+
+    def put(entry: tuple[bool, Any]) -> bool:
+        while not stop.is_set():
+            try:
+                handoff.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce() -> None:
+        try:
+            for item in items:
+                if not put((True, item)):
+                    return
+            put((False, None))
+        except BaseException as e:  # handed to the consumer
+            put((False, e))
+        finally:
+            close = getattr(items, "close", None)
+            if close is not None:
+                close()
+
+    threading.Thread(target=produce, name=name, daemon=True).start()
+    try:
+        while True:
+            more, item = handoff.get()
+            if not more:
+                if item is not None:
+                    raise item
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+class _Sink:
+    """
+    Feed items to `consume(items)` running on its own thread through a
+    bounded queue; `close()` ends the stream and returns its result.
+    `busy_seconds` excludes the time the consumer spent waiting for input.
+    """
+
+    def __init__(self, consume, maxsize: int, name: str):
+        self._queue: queue.Queue = queue.Queue(maxsize=max(maxsize, 1))
+        self._result: Any = None
+        self._error: BaseException | None = None
+        self._waited = 0.0
+        self._started = time.perf_counter()
+        self.busy_seconds = 0.0
+        self._thread = threading.Thread(target=self._run, args=(consume,), name=name, daemon=True)
+        self._thread.start()
+
+    def _items(self) -> Iterator[Any]:
+        while True:
+            t0 = time.perf_counter()
+            item = self._queue.get()
+            self._waited += time.perf_counter() - t0
+            if item is _END:
+                return
+            yield item
+
+    def _run(self, consume) -> None:
+        try:
+            self._result = consume(self._items())
+        except BaseException as e:
+            self._error = e
+        self.busy_seconds = time.perf_counter() - self._started - self._waited
+
+    def send(self, item: Any) -> None:
+        # Blocks while the consumer is behind; drops items if it has died
+        while self._thread.is_alive():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def close(self) -> Any:
+        self.send(_END)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+def ingest_pdf(
+    contents: bytes,
+    filename: str,
+    job: IngestJob | None = None,
+    parallel: bool | None = None,
+    revision_of: str | None = None,
+    flush: bool = True,
+) -> dict[str, Any]:
+    """
+    Extract, chunk, embed and index a PDF, streaming between the stages.
+
+    Identical content already in the catalog (or being ingested) is not
+    re-indexed. Other content is a new document, whatever its filename,
+    unless `revision_of` names the doc_id it replaces: the revision keeps
+    that doc_id and only embeds changed chunks. `parallel` is passed to
+    `doc_processor.iter_pages`; `flush=False` leaves saving the search
+    indexes to `knowledge_base.flush()`. Raises ValueError for unreadable
+    or empty PDFs and an unknown `revision_of`. Returns {doc_id, filename,
+    num_chunks, entities, embedded, reused, deleted}.
+    """
+    job = job or IngestJob(filename)
+    job.status = "running"
+    job.started_at = job.started_at or time.time()
+    content_hash = hashlib.sha256(contents).hexdigest()
+    with _claim(content_hash):
+        return _ingest(contents, filename, job, parallel, content_hash, revision_of, flush)
+
+
+@contextlib.contextmanager
+def _claim(content_hash: str) -> Iterator[None]:
+    """
+    Run one ingestion of the same content at a time; the others wait and
+    then find it in the catalog (a ZIP with a paper twice, a double submit).
+    """
+    while True:
+        with _inflight_lock:
+            running = _inflight.get(content_hash)
+            if running is None:
+                mine = _inflight[content_hash] = threading.Event()
+                break
+        running.wait()
+    try:
+        yield
+    finally:
+        with _inflight_lock:
+            del _inflight[content_hash]
+        mine.set()
+
+
+def _ingest(
+    contents: bytes,
+    filename: str,
+    job: IngestJob,
+    parallel: bool | None,
+    content_hash: str,
+    revision_of: str | None,
+    flush: bool,
+) -> dict[str, Any]:
+    previous = None
+    if revision_of is not None:
+        previous = doc_catalog.get_document(revision_of)
+        if previous is None:
+            raise ValueError(f"Document not found: {revision_of}")
+
+    existing = doc_catalog.find_by_hash(content_hash)
+    if existing:
+        if not text_cache.contains(content_hash):
+            _backfill_text_cache(contents, content_hash)
+        job.doc_id = existing["doc_id"]
+        job.num_chunks = job.chunks_reused = existing["num_chunks"]
+        job.entities = existing["entities"]
+        return {
+            "doc_id": existing["doc_id"],
+            "filename": existing["name"],
+            "num_chunks": existing["num_chunks"],
+            "entities": existing["entities"],
+            "embedded": 0,
+            "reused": existing["num_chunks"],
+            "deleted": 0,
+        }
+
+    try:
+        job.pages_total = doc_processor.page_count(contents, layout=False)
+    except Exception as e:
+        raise ValueError(f"Failed to read PDF: {e}") from e
+
+    # Identity is the content hash; only an explicit revision reuses a doc_id
+    doc_id = previous["doc_id"] if previous else uuid.uuid4().hex[:12]
+    job.doc_id = doc_id
+
+    def pages() -> Iterator[tuple[int, str]]:
+        pages_iter = doc_processor.iter_pages(contents, parallel=parallel)
+        for page_number, text in _threaded(pages_iter, INGEST_PAGE_QUEUE, f"ingest-pages-{job.job_id}"):
+            job.pages_processed = page_number
+            cache.add(page_number, text)
+            yield page_number, text
+
+    parallel_ner = job.pages_total >= doc_processor.SPACY_PARALLEL_MIN_PAGES
+    ner = _Sink(
+        lambda texts: doc_processor.extract_entities(texts, parallel=parallel_ner),
+        maxsize=INGEST_PAGE_QUEUE * 4,
+        name=f"ingest-ner-{job.job_id}",
+    )
+
+    def chunks_for_ner() -> Iterator[tuple[str, dict[str, int]]]:
+        # Chunk offsets index the text being cached alongside
+        for span in doc_processor.iter_spans(pages()):
+            ner.send(span.text)
+            yield span.text, span.metadata()
+
+    registered = previous is not None
+
+    def on_progress(stats: dict[str, int]) -> None:
+        nonlocal registered
+        job.num_chunks = stats["num_chunks"]
+        job.chunks_indexed = stats["embedded"]
+        job.chunks_reused = stats["reused"]
+        if not registered:
+            # Listed (and searchable by name) while the rest is still indexing
+            doc_catalog.upsert_document(doc_id, filename, stats["num_chunks"], [])
+            registered = True
+
+    cache = text_cache.Writer(content_hash)
+    chunks = chunks_for_ner()
+    try:
+        first = next(chunks, None)
+        if first is None:
+            raise ValueError("Could not extract any text from the PDF.")
+        stats = knowledge_base.index_document(
+            doc_id, filename, itertools.chain([first], chunks), on_progress=on_progress, flush=flush
+        )
+    except Exception:
+        cache.abort()
+        try:
+            ner.close()
+        except Exception:
+            pass  # the indexing error is the one to report
+        if previous is None and registered:  # do not leave half a new document behind
+            knowledge_base.delete_document(doc_id)
+            doc_catalog.delete_document(doc_id)
+        elif previous is not None:
+            _restore(previous, flush)
+        raise
+
+    try:
+        cache.commit()
+    except OSError as e:  # the document is indexed; only a later re-index needs this
+        logger.warning("Could not cache the text of %s: %s", filename, e)
+    if previous and previous["content_hash"] and previous["content_hash"] != content_hash:
+        text_cache.delete(previous["content_hash"])
+
+    try:
+        entities = ner.close()
+    except Exception as e:  # entities are optional; the document is indexed
+        logger.warning("Entity extraction for %s failed: %s", filename, e)
+        entities = []
+    if job.pages_total:
+        job.entity_seconds_per_page = round(ner.busy_seconds / job.pages_total, 4)
+        metrics.observe("nlp.seconds_per_page", ner.busy_seconds / job.pages_total)
+        logger.info("Entities for %s: %d in %.2fs (%.1f ms/page)", filename, len(entities),
+                    ner.busy_seconds, 1000 * ner.busy_seconds / job.pages_total)
+    doc_catalog.upsert_document(doc_id, filename, stats["num_chunks"], entities, content_hash=content_hash)
+
+    job.num_chunks = stats["num_chunks"]
+    job.chunks_indexed = stats["embedded"]
+    job.chunks_reused = stats["reused"]
+    job.chunks_deleted = stats["deleted"]
+    job.entities = entities
+    return {"doc_id": doc_id, "filename": filename, "entities": entities, **stats}
+
+
+def _restore(previous: dict[str, Any], flush: bool) -> None:
+    """
+    Put a document back as it was after a failed revision. index_document
+    already removed the chunks the revision added; re-indexing the previous
+    text re-labels the unchanged chunks it moved. Without cached text only
+    the added chunks are undone.
+    """
+    try:
+        reindex_document(previous, flush=flush)
+    except Exception:
+        logger.exception("Could not restore %s after a failed revision", previous["name"])
+
+
+def _backfill_text_cache(contents: bytes, content_hash: str) -> None:
+    """Cache the text of a document indexed before the text cache existed."""
+    try:
+        text_cache.put(content_hash, doc_processor.iter_pages(contents))
+    except Exception as e:
+        logger.warning("Could not cache the text of %s: %s", content_hash[:12], e)
+
+
+# ── Background jobs ──────────────────────────────────────────────────────────
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=max(INGEST_WORKERS, 1),
+                thread_name_prefix="ingest",
+            )
+    return _executor
+
+
+def _flush_indexes() -> None:
+    try:
+        knowledge_base.flush()
+    except Exception:
+        logger.exception("Saving the search indexes failed")
+
+
+def _run(
+    job: IngestJob,
+    load: Callable[[], bytes],
+    parallel: bool | None = None,
+    revision_of: str | None = None,
+    flush: bool = True,
+) -> None:
+    try:
+        ingest_pdf(load(), job.filename, job, parallel=parallel, revision_of=revision_of, flush=flush)
+        job.status = "done"
+    except ValueError as e:
+        job.status, job.error = "failed", str(e)
+    except Exception as e:
+        logger.exception("Ingestion of %s failed", job.filename)
+        job.status, job.error = "failed", f"Ingestion error: {e}"
+    finally:
+        job.finished_at = time.time()
+        metrics.increment(f"ingest.jobs_{job.status}")
+        if job.started_at is not None:
+            metrics.observe("ingest.job_seconds", job.finished_at - job.started_at)
+
+
+def submit(contents: bytes, filename: str, revision_of: str | None = None) -> IngestJob:
+    """Queue a PDF (optionally a revision of document `revision_of`) for background ingestion."""
+    job = IngestJob(filename)
+    _jobs.put(job.job_id, job)
+    metrics.increment("ingest.jobs_submitted")
+    _get_executor().submit(_run, job, lambda: contents, None, revision_of)
+    return job
+
+
+def get_job(job_id: str) -> IngestJob | None:
+    return _jobs.get(job_id)
+
+
+# ── Bulk ingestion ───────────────────────────────────────────────────────────
+
+class BulkJob:
+    """Several files ingested as one job; one IngestJob per PDF."""
+
+    def __init__(self):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.status = "queued"  # queued, running, done
+        self.files: list[IngestJob] = []
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+
+    def reject(self, filename: str, error: str) -> None:
+        job = IngestJob(filename)
+        job.status, job.error = "failed", error
+        self.files.append(job)
+
+    def snapshot(self) -> dict[str, Any]:
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = round((self.finished_at or time.time()) - self.started_at, 3)
+        files = [f.snapshot() for f in self.files]
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "files_total": len(files),
+            "files_done": sum(f["status"] == "done" for f in files),
+            "files_failed": sum(f["status"] == "failed" for f in files),
+            "chunks_indexed": sum(f["chunks_indexed"] for f in files),
+            "files": files,
+            "elapsed_seconds": elapsed,
+        }
+
+
+def _read_file(path: str) -> Callable[[], bytes]:
+    def load() -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+    return load
+
+
+def _read_member(path: str, member: str) -> Callable[[], bytes]:
+    def load() -> bytes:
+        with zipfile.ZipFile(path) as zf:
+            return zf.read(member)
+    return load
+
+
+def _collect(bulk: BulkJob, uploads: list[tuple[str, str]]) -> list[tuple[IngestJob, Callable[[], bytes]]]:
+    """
+    Expand the uploaded files (PDFs and ZIPs of PDFs) into one job per PDF.
+    Unsupported and oversized files are recorded as failed; every PDF is a
+    new document (identical content is still indexed only once).
+    """
+    work: list[tuple[IngestJob, Callable[[], bytes]]] = []
+    names: set[str] = set()
+
+    def add(name: str, size: int, load: Callable[[], bytes]) -> None:
+        if len(work) >= BULK_MAX_FILES:
+            bulk.reject(name, f"Too many files; at most {BULK_MAX_FILES} per upload.")
+        elif size > BULK_MAX_FILE_BYTES:
+            bulk.reject(name, f"File is larger than {BULK_MAX_FILE_BYTES // 2**20} MB.")
+        else:
+            names.add(name)
+            job = IngestJob(name)
+            bulk.files.append(job)
+            work.append((job, load))
+
+    for filename, path in uploads:
+        lower = filename.lower()
+        if lower.endswith(".pdf"):
+            add(filename, os.path.getsize(path), _read_file(path))
+        elif lower.endswith(".zip"):
+            try:
+                with zipfile.ZipFile(path) as zf:
+                    members = [
+                        m for m in zf.infolist()
+                        if not m.is_dir() and m.filename.lower().endswith(".pdf")
+                        and not m.filename.startswith("__MACOSX/")
+                        and not posixpath.basename(m.filename).startswith(".")
+                    ]
+            except zipfile.BadZipFile as e:
+                bulk.reject(filename, f"Invalid ZIP file: {e}")
+                continue
+            if not members:
+                bulk.reject(filename, "ZIP file contains no PDFs.")
+            for m in members:
+                name = posixpath.basename(m.filename)
+                if name in names:
+                    name = m.filename  # same name in another folder of the archive
+                add(name, m.file_size, _read_member(path, m.filename))
+        else:
+            bulk.reject(filename, "Only PDF and ZIP files are supported.")
+    return work
+
+
+def _run_bulk(bulk: BulkJob, work: list[tuple[IngestJob, Callable[[], bytes]]], workdir: str) -> None:
+    bulk.status = "running"
+    bulk.started_at = time.time()
+    try:
+        with ThreadPoolExecutor(max_workers=max(BULK_WORKERS, 1), thread_name_prefix="ingest-bulk") as pool:
+            # Small PDFs go to the extraction pool too, so files are extracted side by side;
+            # the indexes are saved once for the whole upload, not per file
+            list(pool.map(lambda item: _run(*item, parallel=True, flush=False), work))
+    finally:
+        _flush_indexes()
+        shutil.rmtree(workdir, ignore_errors=True)
+        bulk.status = "done"
+        bulk.finished_at = time.time()
+        snapshot = bulk.snapshot()
+        metrics.observe("ingest.bulk_seconds", bulk.finished_at - bulk.started_at)
+        logger.info("Bulk ingestion %s: %d done, %d failed of %d files in %.1fs", bulk.job_id,
+                    snapshot["files_done"], snapshot["files_failed"], snapshot["files_total"],
+                    bulk.finished_at - bulk.started_at)
+
+
+def submit_bulk(uploads: list[tuple[str, str]], workdir: str) -> BulkJob:
+    """
+    Queue (filename, path) uploads — PDFs or ZIPs of PDFs saved under
+    `workdir` — for ingestion as one job. `workdir` is removed when the
+    job finishes.
+    """
+    bulk = BulkJob()
+    try:
+        work = _collect(bulk, uploads)
+    except BaseException:
+        shutil.rmtree(workdir, ignore_errors=True)
+        raise
+    _bulk_jobs.put(bulk.job_id, bulk)
+    metrics.increment("ingest.bulk_jobs_submitted")
+    metrics.increment("ingest.bulk_files", len(work))
+    threading.Thread(target=_run_bulk, args=(bulk, work, workdir), name=f"ingest-bulk-{bulk.job_id}",
+                     daemon=True).start()
+    return bulk
+
+
+def get_bulk_job(job_id: str) -> BulkJob | None:
+    return _bulk_jobs.get(job_id)
+
+
+# ── Library re-index ─────────────────────────────────────────────────────────
+
+class ReindexJob:
+    """Progress of a re-index of the whole library from the text cache."""
+
+    def __init__(self, reembed: bool):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.status = "queued"  # queued, running, done, failed
+        self.reembed = reembed
+        self.chunk_size = doc_processor.CHUNK_SIZE
+        self.chunk_overlap = doc_processor.CHUNK_OVERLAP
+        self.docs_total = 0
+        self.docs_done = 0
+        self.docs_skipped = 0  # no cached text (indexed before the cache existed)
+        self.docs_failed = 0
+        self.num_chunks = 0
+        self.chunks_indexed = 0
+        self.chunks_reused = 0
+        self.chunks_deleted = 0
+        self.failures: list[dict[str, str]] = []
+        self.error: str | None = None
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self._lock = threading.Lock()
+
+    def add(self, **counts: int) -> None:
+        with self._lock:
+            for name, n in counts.items():
+                setattr(self, name, getattr(self, name) + n)
+
+    def fail(self, doc: dict[str, Any], error: str) -> None:
+        with self._lock:
+            self.docs_failed += 1
+            self.failures.append({"doc_id": doc["doc_id"], "name": doc["name"], "error": error})
+
+    def snapshot(self) -> dict[str, Any]:
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = round((self.finished_at or time.time()) - self.started_at, 3)
+        with self._lock:
+            return {
+                "job_id": self.job_id,
+                "status": self.status,
+                "reembed": self.reembed,
+                "chunk_size": self.chunk_size,
+                "chunk_overlap": self.chunk_overlap,
+                "docs_total": self.docs_total,
+                "docs_done": self.docs_done,
+                "docs_skipped": self.docs_skipped,
+                "docs_failed": self.docs_failed,
+                "num_chunks": self.num_chunks,
+                "chunks_indexed": self.chunks_indexed,
+                "chunks_reused": self.chunks_reused,
+                "chunks_deleted": self.chunks_deleted,
+                "failures": list(self.failures),
+                "error": self.error,
+                "elapsed_seconds": elapsed,
+            }
+
+
+def reindex_document(
+    doc: dict[str, Any], reembed: bool = False, job: ReindexJob | None = None, flush: bool = True
+) -> dict[str, int] | None:
+    """
+    Re-chunk and re-embed one catalog document from its cached text.
+    Returns the index_document stats, or None if its text is not cached.
+    `flush=False` leaves saving the indexes to the caller.
+    """
+    pages = text_cache.get(doc["content_hash"]) if doc["content_hash"] else None
+    if pages is None:
+        return None
+
+    last = {"num_chunks": 0, "embedded": 0, "reused": 0}
+
+    def on_progress(stats: dict[str, int]) -> None:
+        if job is not None:
+            job.add(
+                num_chunks=stats["num_chunks"] - last["num_chunks"],
+                chunks_indexed=stats["embedded"] - last["embedded"],
+                chunks_reused=stats["reused"] - last["reused"],
+            )
+        last.update((k, stats[k]) for k in last)
+
+    chunks = ((span.text, span.metadata()) for span in doc_processor.iter_spans(pages))
+    stats = knowledge_base.index_document(
+        doc["doc_id"], doc["name"], chunks, on_progress=on_progress, reembed=reembed, flush=flush
+    )
+    on_progress(stats)
+    if doc_catalog.get_document(doc["doc_id"]) is None:
+        # Deleted while it was being re-indexed; do not resurrect its chunks
+        knowledge_base.delete_document(doc["doc_id"], doc["name"])
+    else:
+        doc_catalog.upsert_document(
+            doc["doc_id"], doc["name"], stats["num_chunks"], doc["entities"],
+            content_hash=doc["content_hash"],
+        )
+    return stats
+
+
+def _run_reindex(job: ReindexJob) -> None:
+    global _reindex_active
+    job.status = "running"
+    job.started_at = time.time()
+    try:
+        docs = doc_catalog.list_documents()
+        job.docs_total = len(docs)
+
+        def one(doc: dict[str, Any]) -> None:
+            try:
+                stats = reindex_document(doc, job.reembed, job, flush=False)
+            except Exception as e:
+                logger.exception("Re-indexing %s failed", doc["name"])
+                job.fail(doc, str(e))
+                return
+            if stats is None:
+                job.add(docs_skipped=1)
+            else:
+                job.add(docs_done=1, chunks_deleted=stats["deleted"])
+
+        with ThreadPoolExecutor(max_workers=max(REINDEX_WORKERS, 1), thread_name_prefix="reindex") as pool:
+            list(pool.map(one, docs))
+        job.status = "done"
+    except Exception as e:
+        logger.exception("Library re-index failed")
+        job.status, job.error = "failed", f"Re-index error: {e}"
+    finally:
+        _flush_indexes()
+        job.finished_at = time.time()
+        with _reindex_lock:
+            _reindex_active = None
+        metrics.increment(f"ingest.reindex_{job.status}")
+        metrics.observe("ingest.reindex_seconds", job.finished_at - job.started_at)
+        logger.info("Re-indexed %d/%d documents (%d skipped, %d failed) in %.1fs",
+                    job.docs_done, job.docs_total, job.docs_skipped, job.docs_failed,
+                    job.finished_at - job.started_at)
+
+
+def submit_reindex(reembed: bool = False) -> ReindexJob:
+    """
+    Start re-indexing the library from cached text on a background thread.
+    Raises ValueError if a re-index is already running.
+    """
+    global _reindex_active
+    with _reindex_lock:
+        if _reindex_active is not None:
+            raise ValueError(f"A re-index is already running (job {_reindex_active.job_id}).")
+        job = _reindex_active = ReindexJob(reembed)
+    _reindex_jobs.put(job.job_id, job)
+    threading.Thread(target=_run_reindex, args=(job,), name=f"reindex-{job.job_id}", daemon=True).start()
+    return job
+
+
+def get_reindex_job(job_id: str) -> ReindexJob | None:
+    return _reindex_jobs.get(job_id)
@@ -1,97 +1,754 @@
 """
-Knowledge base — ChromaDB-backed vector store for document search.
+Knowledge base — vector store for document search.
+
+Embeddings are kept in a pluggable vector store (services.vector_store),
+chosen with KB_VECTOR_BACKEND: the persistent ChromaDB collection
+("chroma", default) or an exact memory-mapped NumPy index ("numpy", with
+KB_VECTOR_DTYPE float32 or int8). One store is opened per process and
+shared by every call; `warmup()` opens it and loads the embedding model at
+application startup so the first search does not pay for it.
+
+Ingestion embeds chunks in batches of KB_EMBED_BATCH_SIZE on a pool of
+KB_EMBED_WORKERS threads (ONNX inference releases the GIL) and writes each
+batch into the store as soon as it is ready. Documents indexed at the same
+time share one batching queue, so the short tail batches of many small
+documents are merged into full batches.
+
+Searches reuse cached query embeddings and cached results keyed on
+(normalized query, top_k, collection version); any write to the store
+bumps the version and drops the result cache.
+
+Next to the vectors a BM25 inverted index (services.lexical_index) is
+maintained, giving `search` three modes: "vector" (embeddings), "lexical"
+(exact terms such as gene symbols or compound IDs) and "hybrid"
+(reciprocal-rank fusion of both). A list of queries is searched in one
+call: uncached query embeddings are computed in one batch and sent to
+the store as a single multi-query request.
+
+Searches can be scoped to some documents and a chunk-index range; the
+scope is pushed down as a `where` clause (and a metadata filter on
+the lexical index), so only the relevant subset is scored.
+
+Chunks carry their page and [start, end) offsets in the document text
+kept by services.text_cache, so `get_context` can return the text around
+a hit without touching the PDF.
+
+Chunk ids are content-addressed (doc_id + chunk hash). Re-indexing a
+revised document (an upload with revision_of=<doc_id>) embeds only the
+chunks whose text changed, re-labels the unchanged ones and deletes the
+ones that disappeared.
 """
 
 from __future__ import annotations
 
+import hashlib
+import logging
 import os
-import chromadb
-from chromadb.config import Settings
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, NamedTuple
 
-# ── Initialize ChromaDB ─────────────────────────────────────────────────────
+from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+
+from services import doc_catalog, metrics, text_cache
+from services.cache import LRUCache
+from services.lexical_index import LexicalIndex
+from services.vector_store import ChromaStore, NumpyStore, VectorStore
+
+logger = logging.getLogger("lab-copilot.kb")
+
+# ── Initialize the vector store ─────────────────────────────────────────────
 
 _chroma_path = os.getenv("CHROMA_DB_PATH", "./chroma_db")
+_COLLECTION_NAME = "lab_docs"
+
+KB_VECTOR_BACKEND = os.getenv("KB_VECTOR_BACKEND", "chroma")  # chroma, numpy
+KB_VECTOR_DTYPE = os.getenv("KB_VECTOR_DTYPE", "float32")  # float32, int8 (numpy backend)
+
+KB_EMBED_BATCH_SIZE = int(os.getenv("KB_EMBED_BATCH_SIZE", "64"))
+KB_EMBED_WORKERS = int(os.getenv("KB_EMBED_WORKERS", str(min(4, os.cpu_count() or 1))))
+# How long a partial batch waits for chunks from other documents being indexed
+KB_EMBED_LINGER_MS = float(os.getenv("KB_EMBED_LINGER_MS", "20"))
+KB_QUERY_CACHE_SIZE = int(os.getenv("KB_QUERY_CACHE_SIZE", "1024"))
+KB_RESULT_CACHE_SIZE = int(os.getenv("KB_RESULT_CACHE_SIZE", "256"))
+KB_CONTEXT_CHARS = int(os.getenv("KB_CONTEXT_CHARS", "1000"))
+
+_RATE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+SEARCH_MODES = ("vector", "lexical", "hybrid")
+_RRF_K = 60  # standard reciprocal-rank-fusion damping constant
 
+_lock = threading.Lock()
+_store: VectorStore | None = None
+_embedding_function = None
+_embed_executor: ThreadPoolExecutor | None = None
+_batcher: _EmbedBatcher | None = None
 
-def _get_client() -> chromadb.ClientAPI:
-    return chromadb.PersistentClient(path=_chroma_path)
+# Query embeddings only depend on the text; results also on the stored chunks
+_query_embeddings = LRUCache(maxsize=KB_QUERY_CACHE_SIZE)
+_search_results = LRUCache(maxsize=KB_RESULT_CACHE_SIZE)
+_collection_version = 0
+_lexical: LexicalIndex | None = None
 
 
-def _get_collection(client: chromadb.ClientAPI):
-    return client.get_or_create_collection(
-        name="lab_docs",
-        metadata={"hnsw:space": "cosine"},
-    )
+def _open_store() -> VectorStore:
+    if KB_VECTOR_BACKEND == "chroma":
+        return ChromaStore(_chroma_path, _COLLECTION_NAME, _embedding_function)
+    if KB_VECTOR_BACKEND == "numpy":
+        return NumpyStore(os.path.join(_chroma_path, "numpy_index"), KB_VECTOR_DTYPE)
+    raise ValueError(f"Unsupported KB_VECTOR_BACKEND: {KB_VECTOR_BACKEND}. Use chroma or numpy")
+
+
+def _get_store() -> VectorStore:
+    """Return the shared vector store, opening it on first use."""
+    global _store, _embedding_function
+    if _store is not None:
+        return _store
+    with _lock:
+        if _store is None:
+            t0 = time.perf_counter()
+            _embedding_function = DefaultEmbeddingFunction()
+            _store = _open_store()
+            metrics.observe("kb.open_seconds", time.perf_counter() - t0)
+    return _store
+
+
+def _get_lexical() -> LexicalIndex:
+    """
+    Return the shared lexical index, loading it from disk on first use (or
+    rebuilding it from the vector store if it predates the index).
+    """
+    global _lexical
+    if _lexical is not None:
+        return _lexical
+    store = _get_store()
+    with _lock:
+        if _lexical is None:
+            index = LexicalIndex(os.path.join(_chroma_path, "lexical_index.pkl"))
+            if not index.load() and store.count() > 0:
+                index.add(*store.get_all())
+                index.save()
+            _lexical = index
+    return _lexical
+
+
+def warmup() -> float:
+    """
+    Open the vector store and embed a dummy string so the embedding model is
+    loaded before the first request. Returns the elapsed seconds.
+    """
+    t0 = time.perf_counter()
+    _get_store()
+    _get_lexical()
+    _backfill_catalog()
+    _embedding_function(["warmup"])
+    elapsed = time.perf_counter() - t0
+    metrics.observe("kb.warmup_seconds", elapsed)
+    logger.info("Knowledge base ready in %.2fs (%s backend, %s)", elapsed, KB_VECTOR_BACKEND, _chroma_path)
+    return elapsed
+
+
+def _backfill_catalog() -> int:
+    """
+    Register documents indexed before the catalog existed, so they can be
+    listed, scoped and deleted like any other. Runs only while the catalog
+    is empty and the store is not. Their chunks get the doc_id metadata
+    scoping filters on; the doc_id is the "<doc_id>_chunk_<n>" id prefix.
+    Returns the number of documents added.
+    """
+    store = _get_store()
+    if doc_catalog.count() or store.count() == 0:
+        return 0
+    ids, texts, metadatas = store.get_all()
+    documents: dict[str, list[Any]] = {}  # doc_id -> [name, chunk count]
+    relabeled: list[tuple[str, str, dict[str, Any]]] = []
+    for chunk_id, text, meta in zip(ids, texts, metadatas):
+        meta = dict(meta or {})
+        if not meta.get("doc_id"):
+            meta["doc_id"] = chunk_id.rsplit("_chunk_", 1)[0]
+            relabeled.append((chunk_id, text, meta))
+        documents.setdefault(meta["doc_id"], [meta.get("document", "unknown"), 0])[1] += 1
+
+    if relabeled:
+        lexical = _get_lexical()
+        for start in range(0, len(relabeled), max(KB_EMBED_BATCH_SIZE, 1)):
+            batch = relabeled[start:start + max(KB_EMBED_BATCH_SIZE, 1)]
+            store.update_metadata([c for c, _, _ in batch], [m for _, _, m in batch])
+            lexical.add([c for c, _, _ in batch], [t for _, t, _ in batch], [m for _, _, m in batch])
+        flush()
+        _invalidate()
+    for doc_id, (name, num_chunks) in documents.items():
+        doc_catalog.upsert_document(doc_id, name, num_chunks, [])
+    logger.info("Catalog backfilled with %d documents (%d chunks relabeled)", len(documents), len(relabeled))
+    return len(documents)
+
+
+def _invalidate() -> None:
+    """Call after any write to the store."""
+    global _collection_version
+    with _lock:
+        _collection_version += 1
+    _search_results.clear()
 
 
 # ── Add document chunks ─────────────────────────────────────────────────────
 
+def _get_executor() -> ThreadPoolExecutor:
+    global _embed_executor
+    with _lock:
+        if _embed_executor is None:
+            _embed_executor = ThreadPoolExecutor(
+                max_workers=max(KB_EMBED_WORKERS, 1),
+                thread_name_prefix="kb-embed",
+            )
+    return _embed_executor
+
+
+class _EmbedBatcher:
+    """
+    One embedding queue for every concurrent `index_document` call.
+    Requests are merged into batches of up to KB_EMBED_BATCH_SIZE texts: a
+    full batch is dispatched at once, a partial one after waiting up to
+    KB_EMBED_LINGER_MS for more. Each request gets a future for its own
+    slice of the result.
+    """
+
+    def __init__(self, executor: ThreadPoolExecutor, batch_size: int, linger: float):
+        self._executor = executor
+        self._batch_size = max(batch_size, 1)
+        self._linger = linger
+        self._cond = threading.Condition()
+        self._pending: deque[tuple[list[str], Future]] = deque()
+        self._size = 0
+        threading.Thread(target=self._dispatch, name="kb-embed-batcher", daemon=True).start()
+
+    def submit(self, texts: list[str]) -> Future:
+        future: Future = Future()
+        with self._cond:
+            self._pending.append((texts, future))
+            self._size += len(texts)
+            self._cond.notify()
+        return future
+
+    def _dispatch(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                deadline = time.monotonic() + self._linger
+                while self._size < self._batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                group: list[tuple[list[str], Future]] = []
+                taken = 0
+                while self._pending and (not group or taken + len(self._pending[0][0]) <= self._batch_size):
+                    texts, future = self._pending.popleft()
+                    group.append((texts, future))
+                    taken += len(texts)
+                self._size -= taken
+            metrics.observe("kb.embed_batch_size", taken, _RATE_BUCKETS)
+            self._executor.submit(self._embed, group)
+
+    @staticmethod
+    def _embed(group: list[tuple[list[str], Future]]) -> None:
+        try:
+            embeddings = _embedding_function([t for texts, _ in group for t in texts])
+        except BaseException as e:
+            for _, future in group:
+                future.set_exception(e)
+            return
+        offset = 0
+        for texts, future in group:
+            future.set_result(embeddings[offset:offset + len(texts)])
+            offset += len(texts)
+
+
+def _get_batcher() -> _EmbedBatcher:
+    global _batcher
+    executor = _get_executor()
+    with _lock:
+        if _batcher is None:
+            _batcher = _EmbedBatcher(executor, KB_EMBED_BATCH_SIZE, KB_EMBED_LINGER_MS / 1000)
+    return _batcher
+
+
+def _embed_batches(
+    batches: Iterator[tuple[Any, list[str]]],
+) -> Iterator[tuple[Any, list[str], list]]:
+    """
+    Embed (tag, texts) batches concurrently and yield them in order as
+    (tag, texts, embeddings), each as soon as it and its predecessors are
+    done. At most 2 × KB_EMBED_WORKERS batches are in flight, so memory
+    stays bounded however long the document is.
+    """
+    _get_store()
+    batcher = _get_batcher()
+    window = max(KB_EMBED_WORKERS, 1) * 2
+    pending: deque = deque()
+    for tag, texts in batches:
+        pending.append((tag, texts, batcher.submit(texts)))
+        while pending and (len(pending) >= window or pending[0][2].done()):
+            tag, texts, future = pending.popleft()
+            yield tag, texts, future.result()
+    while pending:
+        tag, texts, future = pending.popleft()
+        yield tag, texts, future.result()
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def _document_chunk_ids(doc_id: str, doc_name: str | None = None) -> list[str]:
+    """
+    Ids of every stored chunk of a document. Chunks indexed before doc_id was
+    recorded in metadata are found by name and their "<doc_id>_" id prefix.
+    """
+    where: dict[str, Any] = {"doc_id": doc_id}
+    if doc_name:
+        where = {"$or": [{"doc_id": doc_id}, {"document": doc_name}]}
+    ids = _get_store().get_ids(where)
+    return [i for i in ids if i.startswith(f"{doc_id}_")]
+
+
+def _chunk_metadata(
+    doc_id: str, doc_name: str, index: int, digest: str, extra: dict[str, Any] | None = None
+) -> dict[str, Any]:
+    meta = {"doc_id": doc_id, "document": doc_name, "chunk_index": index, "chunk_hash": digest}
+    if extra:
+        meta.update(extra)
+    return meta
+
+
+def index_document(
+    doc_id: str,
+    doc_name: str,
+    chunks: Iterable[str | tuple[str, dict[str, Any]]],
+    on_progress: Callable[[dict[str, int]], None] | None = None,
+    reembed: bool = False,
+    flush: bool = True,
+) -> dict[str, int]:
+    """
+    Bring the stored chunks of `doc_id` in line with `chunks`.
+
+    `chunks` may be a generator; it is consumed batch by batch, so chunking
+    upstream overlaps with embedding. A chunk is its text, or (text, extra
+    metadata) such as its page and offsets in the document text. Only
+    chunks whose content hash is not already stored are embedded
+    (searchable as each batch lands); unchanged chunks keep their vectors
+    and get their metadata refreshed; chunks no longer present are deleted
+    once the stream ends. `reembed=True` embeds every chunk again (after an
+    embedding-model change), overwriting the stored vectors in place. If
+    indexing fails, the chunks it added are removed again.
+
+    `on_progress(stats)` is called after every batch. `flush=False` leaves
+    saving the store sidecar and the BM25 index to a later `flush()`, so a
+    job indexing many documents writes them once. Returns {num_chunks,
+    embedded, reused, deleted}.
+    """
+    store = _get_store()
+    lexical = _get_lexical()
+    t0 = time.perf_counter()
+
+    existing = set(_document_chunk_ids(doc_id, doc_name))
+    reusable = set() if reembed else existing
+    seen: set[str] = set()
+    occurrences: dict[str, int] = {}
+    stats = {"num_chunks": 0, "embedded": 0, "reused": 0, "deleted": 0}
+    batch_size = max(KB_EMBED_BATCH_SIZE, 1)
+
+    def refresh(kept: list[tuple[str, dict[str, Any], str]]) -> None:
+        # Positions may have shifted; no re-embedding needed
+        ids = [chunk_id for chunk_id, _, _ in kept]
+        metadatas = [meta for _, meta, _ in kept]
+        store.update_metadata(ids, metadatas)
+        lexical.add(ids, [text for _, _, text in kept], metadatas)
+        stats["reused"] += len(kept)
+        if on_progress:
+            on_progress(dict(stats))
+
+    def new_batches() -> Iterator[tuple[list[tuple[str, dict[str, Any]]], list[str]]]:
+        new: list[tuple[str, dict[str, Any], str]] = []
+        kept: list[tuple[str, dict[str, Any], str]] = []
+        for index, chunk in enumerate(chunks):
+            text, extra = (chunk, None) if isinstance(chunk, str) else chunk
+            digest = chunk_hash(text)
+            # Content-addressed ids; repeated identical chunks get an occurrence suffix
+            n = occurrences.get(digest, 0)
+            occurrences[digest] = n + 1
+            chunk_id = f"{doc_id}_{digest}" if n == 0 else f"{doc_id}_{digest}_{n}"
+            seen.add(chunk_id)
+            stats["num_chunks"] += 1
+            entry = (chunk_id, _chunk_metadata(doc_id, doc_name, index, digest, extra), text)
+            if chunk_id in reusable:
+                kept.append(entry)
+                if len(kept) >= batch_size:
+                    refresh(kept)
+                    kept = []
+            else:
+                new.append(entry)
+                if len(new) >= batch_size:
+                    yield [(c, m) for c, m, _ in new], [t for _, _, t in new]
+                    new = []
+        if kept:
+            refresh(kept)
+        if new:
+            yield [(c, m) for c, m, _ in new], [t for _, _, t in new]
+
+    added: list[str] = []
+    try:
+        for tags, texts, embeddings in _embed_batches(new_batches()):
+            batch_ids = [chunk_id for chunk_id, _ in tags]
+            batch_meta = [meta for _, meta in tags]
+            store.upsert(batch_ids, embeddings, texts, batch_meta)
+            lexical.add(batch_ids, texts, batch_meta)
+            added.extend(i for i in batch_ids if i not in existing)
+            _invalidate()  # each batch is searchable as soon as it lands
+            stats["embedded"] += len(batch_ids)
+            if on_progress:
+                on_progress(dict(stats))
+    except BaseException:
+        # Do not leave this run's new chunks mixed in with the stored ones
+        if added:
+            store.delete(added)
+            lexical.remove(added)
+            _invalidate()
+            if flush:
+                store.flush()
+                lexical.save()
+        raise
+
+    stale = sorted(existing - seen)
+    if stale:
+        store.delete(stale)
+        lexical.remove(stale)
+        stats["deleted"] = len(stale)
+    if stats["reused"] or stale:
+        _invalidate()
+    if flush:
+        store.flush()
+        lexical.save()
+
+    elapsed = time.perf_counter() - t0
+    embedded = stats["embedded"]
+    rate = embedded / elapsed if elapsed > 0 else float(embedded)
+    metrics.increment("kb.chunks_indexed", embedded)
+    metrics.increment("kb.chunks_reused", stats["reused"])
+    metrics.increment("kb.chunks_deleted", len(stale))
+    metrics.observe("kb.ingest_seconds", elapsed)
+    if embedded:
+        metrics.observe("kb.ingest_chunks_per_second", rate, _RATE_BUCKETS)
+    logger.info("Indexed %s: %d embedded, %d reused, %d deleted in %.2fs (%.1f chunks/s)",
+                doc_name, embedded, stats["reused"], len(stale), elapsed, rate)
+    return stats
+
+
+def flush() -> None:
+    """
+    Persist pending writes: the vector store's sidecar and the BM25 index.
+    Both are rewritten whole, so bulk jobs call this once at the end rather
+    than once per document. A no-op when nothing changed.
+    """
+    if _store is not None:
+        _store.flush()
+    if _lexical is not None:
+        _lexical.save()
+
+
 def add_document(doc_id: str, doc_name: str, chunks: list[str]) -> int:
     """
-    Embed and store document chunks in ChromaDB.
-    Returns the number of chunks stored.
+    Embed and store document chunks in ChromaDB (incrementally, see
+    `index_document`). Returns the number of chunks in the document.
     """
     if not chunks:
         return 0
+    return index_document(doc_id, doc_name, chunks)["num_chunks"]
 
-    client = _get_client()
-    collection = _get_collection(client)
 
-    ids = [f"{doc_id}_chunk_{i}" for i in range(len(chunks))]
-    metadatas = [{"document": doc_name, "chunk_index": i} for i in range(len(chunks))]
+# ── Delete documents ─────────────────────────────────────────────────────────
 
-    collection.add(
-        documents=chunks,
-        ids=ids,
-        metadatas=metadatas,
-    )
-    return len(chunks)
+def delete_document(doc_id: str, doc_name: str | None = None) -> int:
+    """Remove every chunk of a document in one batch. Returns chunks deleted."""
+    ids = _document_chunk_ids(doc_id, doc_name)
+    if ids:
+        store = _get_store()
+        store.delete(ids)
+        store.flush()
+        lexical = _get_lexical()
+        lexical.remove(ids)
+        lexical.save()
+        _invalidate()
+        metrics.increment("kb.chunks_deleted", len(ids))
+    return len(ids)
 
 
 # ── Search ───────────────────────────────────────────────────────────────────
 
-def search(query: str, top_k: int = 5) -> list[dict]:
+def _normalize_query(query: str) -> str:
+    # The default MiniLM model is uncased, so case folding is lossless
+    return " ".join(query.lower().split())
+
+
+def _embed_queries(normalized: list[str]) -> list[list[float]]:
+    """Embeddings for each query; the uncached ones are embedded in one batch."""
+    embeddings = [_query_embeddings.get(q) for q in normalized]
+    missing = list(dict.fromkeys(q for q, e in zip(normalized, embeddings) if e is None))
+    if missing:
+        _get_store()
+        fresh = dict(zip(missing, _embedding_function(missing)))
+        for q, embedding in fresh.items():
+            _query_embeddings.put(q, embedding)
+        embeddings = [fresh[q] if e is None else e for q, e in zip(normalized, embeddings)]
+    return embeddings
+
+
+def _hit(text: str, metadata: dict | None, score: float) -> dict:
+    metadata = metadata or {}
+    return {
+        "text": text,
+        "document": metadata.get("document", "unknown"),
+        "score": round(score, 4),
+        # Where the chunk came from; None for chunks indexed before offsets were kept
+        "doc_id": metadata.get("doc_id"),
+        "page": metadata.get("page"),
+        "start": metadata.get("start"),
+        "end": metadata.get("end"),
+    }
+
+
+class _Scope(NamedTuple):
+    """Subset of chunks a search covers; the empty scope is the whole library."""
+
+    doc_ids: tuple[str, ...] = ()
+    chunk_start: int | None = None  # inclusive
+    chunk_end: int | None = None  # inclusive
+    first_page: int | None = None  # chunks overlapping these pages (inclusive)
+    last_page: int | None = None
+
+    def where(self) -> dict[str, Any] | None:
+        clauses: list[dict[str, Any]] = []
+        if self.doc_ids:
+            clauses.append({"doc_id": {"$in": list(self.doc_ids)}})
+        if self.chunk_start is not None:
+            clauses.append({"chunk_index": {"$gte": self.chunk_start}})
+        if self.chunk_end is not None:
+            clauses.append({"chunk_index": {"$lte": self.chunk_end}})
+        if self.first_page is not None:
+            clauses.append({"page_end": {"$gte": self.first_page}})
+        if self.last_page is not None:
+            clauses.append({"page": {"$lte": self.last_page}})
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+    def accepts(self, metadata: dict[str, Any]) -> bool:
+        if self.doc_ids and metadata.get("doc_id") not in self.doc_ids:
+            return False
+        index = metadata.get("chunk_index", 0)
+        if self.chunk_start is not None and index < self.chunk_start:
+            return False
+        if self.chunk_end is not None and index > self.chunk_end:
+            return False
+        if self.first_page is not None and metadata.get("page_end", -1) < self.first_page:
+            return False
+        if self.last_page is not None and metadata.get("page", self.last_page + 1) > self.last_page:
+            return False
+        return True
+
+
+_WHOLE_LIBRARY = _Scope()
+
+
+def _resolve_scope(
+    documents: list[str] | None,
+    chunk_range: tuple[int | None, int | None] | None,
+    page_range: tuple[int | None, int | None] | None = None,
+) -> _Scope:
+    """Turn document ids/names into catalog doc_ids; unknown ones raise ValueError."""
+    doc_ids: list[str] = []
+    if documents:
+        catalog = doc_catalog.list_documents()
+        by_id = {d["doc_id"] for d in catalog}
+        unknown = []
+        for ref in documents:
+            matches = [ref] if ref in by_id else [d["doc_id"] for d in catalog if d["name"] == ref]
+            if not matches:
+                unknown.append(ref)
+            doc_ids.extend(m for m in matches if m not in doc_ids)
+        if unknown:
+            known = ", ".join(sorted({d["name"] for d in catalog})) or "none"
+            raise ValueError(f"Unknown document(s): {', '.join(unknown)}. Indexed documents: {known}")
+    start, end = chunk_range or (None, None)
+    first_page, last_page = page_range or (None, None)
+    return _Scope(tuple(sorted(doc_ids)), start, end, first_page, last_page)
+
+
+def _vector_search(
+    normalized: list[str], n: int, scope: _Scope = _WHOLE_LIBRARY,
+) -> list[list[tuple[str, dict]]]:
+    """Top-n (chunk_id, hit) per query by cosine similarity, in one query call."""
+    # The store's query handles an empty index; counting here too would cost
+    # a second collection.count() per search
+    matches = _get_store().query(_embed_queries(normalized), n, where=scope.where())
+    return [
+        [(chunk_id, _hit(text, metadata, similarity)) for chunk_id, similarity, text, metadata in ranked]
+        for ranked in matches
+    ]
+
+
+def _lexical_search(normalized: str, n: int, scope: _Scope = _WHOLE_LIBRARY) -> list[tuple[str, dict]]:
+    """Top-n (chunk_id, hit) by BM25 score."""
+    accept = scope.accepts if scope != _WHOLE_LIBRARY else None
+    return [
+        (chunk_id, _hit(text, metadata, score))
+        for chunk_id, score, text, metadata in _get_lexical().search(normalized, n, accept)
+    ]
+
+
+def _fuse(ranked_lists: list[list[tuple[str, dict]]], top_k: int) -> list[tuple[str, dict]]:
+    """Reciprocal-rank fusion; the hit's score becomes the fused RRF score."""
+    fused: dict[str, float] = {}
+    hits: dict[str, dict] = {}
+    for ranked in ranked_lists:
+        for rank, (chunk_id, hit) in enumerate(ranked):
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (_RRF_K + rank + 1)
+            hits.setdefault(chunk_id, hit)
+    best = sorted(fused.items(), key=lambda kv: kv[1], reverse=True)[:top_k]
+    return [(chunk_id, {**hits[chunk_id], "score": round(score, 4)}) for chunk_id, score in best]
+
+
+def _rank(normalized: list[str], n: int, mode: str, scope: _Scope) -> list[list[tuple[str, dict]]]:
+    """Uncached top-n (chunk_id, hit) per query; vector lookups share one call."""
+    if mode == "vector":
+        return _vector_search(normalized, n, scope)
+    if mode == "lexical":
+        return [_lexical_search(q, n, scope) for q in normalized]
+    candidates = max(n * 4, 20)
+    vector = _vector_search(normalized, candidates, scope)
+    return [
+        _fuse([vector[i], _lexical_search(q, candidates, scope)], n)
+        for i, q in enumerate(normalized)
+    ]
+
+
+def search(
+    query: str | list[str],
+    top_k: int = 5,
+    mode: str = "vector",
+    dedupe: bool = False,
+    documents: list[str] | None = None,
+    chunk_range: tuple[int | None, int | None] | None = None,
+    page_range: tuple[int | None, int | None] | None = None,
+) -> list[dict] | list[list[dict]]:
     """
-    Semantic search across all indexed documents.
-    Returns list of {text, document, score}.
+    Search across all indexed documents.
+
+    mode: "vector" (semantic), "lexical" (BM25 over exact terms) or
+    "hybrid" (reciprocal-rank fusion of both).
+    Returns list of {text, document, score, doc_id, page, start, end}.
+
+    `query` may also be a list of queries: they are embedded in one batch
+    and sent to Chroma as a single multi-query call, and one result list is
+    returned per query. With `dedupe`, a chunk is only returned for the
+    first query that finds it, and later queries are backfilled from
+    deeper in their ranking.
+
+    `documents` (doc ids or names), `chunk_range` (inclusive chunk-index
+    bounds, either may be None) and `page_range` (inclusive page bounds)
+    restrict the search to that subset.
     """
-    client = _get_client()
-    collection = _get_collection(client)
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unsupported search mode: {mode}. Use one of {SEARCH_MODES}")
+    if isinstance(query, str):
+        return search([query], top_k=top_k, mode=mode, documents=documents,
+                      chunk_range=chunk_range, page_range=page_range)[0]
+
+    t0 = time.perf_counter()
+    scope = _resolve_scope(documents, chunk_range, page_range)
+    normalized = [_normalize_query(q) for q in query]
+    # Deduping can drop up to top_k hits per earlier query, so look deeper
+    n = top_k * len(normalized) if dedupe else top_k
+    ranked: dict[str, list[tuple[str, dict]]] = {}
+    misses: list[str] = []
+    for q in dict.fromkeys(normalized):
+        cached = _search_results.get((q, n, mode, scope, _collection_version))
+        if cached is None:
+            misses.append(q)
+        else:
+            ranked[q] = cached
+    metrics.increment("kb.search_cache_hits", len(ranked))
 
-    if collection.count() == 0:
-        return []
+    if misses:
+        version = _collection_version
+        for q, hits in zip(misses, _rank(misses, n, mode, scope)):
+            _search_results.put((q, n, mode, scope, version), hits)
+            ranked[q] = hits
 
-    results = collection.query(
-        query_texts=[query],
-        n_results=min(top_k, collection.count()),
-    )
+    seen: set[str] = set()
+    grouped: list[list[dict]] = []
+    for q in normalized:
+        hits = []
+        for chunk_id, hit in ranked[q]:
+            if dedupe:
+                if chunk_id in seen:
+                    continue
+                seen.add(chunk_id)
+            hits.append(dict(hit))
+            if len(hits) == top_k:
+                break
+        grouped.append(hits)
+
+    metrics.increment("kb.search_queries", len(normalized))
+    if scope != _WHOLE_LIBRARY:
+        metrics.increment("kb.search_scoped")
+    metrics.observe(f"kb.search_seconds.{mode}", time.perf_counter() - t0)
+    return grouped
+
+
+# ── Context around a chunk ──────────────────────────────────────────────────
+
+def get_context(doc_id: str, start: int, end: int, chars: int = KB_CONTEXT_CHARS) -> dict[str, Any]:
+    """
+    The text at [start, end) of a document (offsets from a search hit) plus
+    up to `chars` characters on either side, trimmed to whole words. Read
+    from the text cache, not the PDF. Raises ValueError for unknown
+    documents, documents without cached text and out-of-range offsets.
+    """
+    doc = doc_catalog.get_document(doc_id)
+    if doc is None:
+        raise ValueError(f"Document not found: {doc_id}")
+    text = text_cache.get_text(doc["content_hash"]) if doc["content_hash"] else None
+    if text is None:
+        raise ValueError(f"No cached text for {doc['name']}; re-upload it to enable context lookups.")
+    if not 0 <= start <= end <= len(text):
+        raise ValueError(f"Offsets {start}-{end} are outside {doc['name']} (0-{len(text)}).")
 
-    hits: list[dict] = []
-    if results and results["documents"]:
-        for i, doc_text in enumerate(results["documents"][0]):
-            distance = results["distances"][0][i] if results["distances"] else 0.0
-            metadata = results["metadatas"][0][i] if results["metadatas"] else {}
-            hits.append({
-                "text": doc_text,
-                "document": metadata.get("document", "unknown"),
-                "score": round(1 - distance, 4),  # cosine similarity
-            })
-    return hits
+    chars = max(chars, 0)
+    lo, hi = max(start - chars, 0), min(end + chars, len(text))
+    if lo > 0:
+        # Drop the partial word at the cut
+        breaks = [i for i in (text.find(" ", lo, start), text.find("\n", lo, start)) if i >= 0]
+        lo = min(breaks) + 1 if breaks else start
+    if hi < len(text):
+        hi = max(text.rfind(" ", end, hi), text.rfind("\n", end, hi), end)
+    metrics.increment("kb.context_lookups")
+    return {
+        "doc_id": doc_id,
+        "document": doc["name"],
+        "start": start,
+        "end": end,
+        "before": text[lo:start].lstrip(),
+        "text": text[start:end],
+        "after": text[end:hi].rstrip(),
+    }
 
 
 # ── List documents ───────────────────────────────────────────────────────────
 
 def list_documents() -> list[str]:
-    """Return names of all indexed documents."""
-    client = _get_client()
-    collection = _get_collection(client)
-    if collection.count() == 0:
-        return []
-    # Get unique document names from metadata
-    all_meta = collection.get(include=["metadatas"])
-    names: set[str] = set()
-    if all_meta and all_meta["metadatas"]:
-        for m in all_meta["metadatas"]:
-            if m and "document" in m:
-                names.add(m["document"])
-    return sorted(names)
+    """Return names of all indexed documents (from the document catalog)."""
+    return sorted({d["name"] for d in doc_catalog.list_documents()})
@@ -1,41 +1,83 @@
 """
 LLM service — Mistral API integration with tool/function calling.
+
+Chat turns use the client's async streaming API: `chat_stream` yields tool,
+plot/table and answer-token events as they happen (served over SSE by
+/api/chat/stream), and `chat_async` collects them into one response for
+/api/chat/message. Neither holds a thread while waiting on Mistral.
+
+The tool calls of one model response cannot depend on each other's
+results, so they run concurrently on a pool of LLM_TOOL_WORKERS threads
+(searches release the GIL in ONNX and NumPy; pandas code runs in the
+sandbox's worker processes). Tool messages are still sent back in the
+order the model asked for them, and per-tool timings are returned with
+the response. The model reads a summary of each result (services/
+tool_results: plots described, tables cut to a schema and a sample) while
+the UI gets the full plot and table. Time to first token is recorded in
+/metrics.
 """
 
 from __future__ import annotations
 
+import asyncio
 import json
+import logging
 import os
-from typing import Any
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator
 
 from mistralai import Mistral
 
 import store
+from services import doc_catalog, history, metrics, tool_results
+from services.cache import LRUCache
 from services.data_engine import (
     filter_data,
     aggregate_data,
     describe_data,
     generate_plot,
 )
-from services.knowledge_base import search as kb_search
+from services.knowledge_base import KB_CONTEXT_CHARS, get_context as kb_get_context, search as kb_search
 from services.sandbox import execute_code
 
+logger = logging.getLogger("lab-copilot.llm")
+
 # mistral client
 
 _api_key = os.getenv("MISTRAL_API_KEY", "")
 _model = "mistral-large-latest"
 
+LLM_TOOL_WORKERS = int(os.getenv("LLM_TOOL_WORKERS", "4"))
+
+_tool_executor: ThreadPoolExecutor | None = None
+_tool_executor_lock = threading.Lock()
+
+
+_client: Mistral | None = None
+
 
 def _get_client() -> Mistral:
+    # One client per process: its HTTP connection pools are reused across turns
+    global _client
     if not _api_key:
         raise RuntimeError(
             "MISTRAL_API_KEY is not set. Add it to backend/.env"
         )
-    return Mistral(api_key=_api_key)
+    if _client is None:
+        _client = Mistral(api_key=_api_key)
+    return _client
 
 
 # tool definitions for Mistral function calling 
 
+# Shared by every tool that reads a dataset
+_DATASET_ID_PARAM = {
+    "type": "string",
+    "description": "Optional dataset id to use instead of the active dataset, e.g. the dataset_id of a derived result returned by execute_pandas_code.",
+}
+
 TOOLS = [
     {
         "type": "function",
@@ -48,7 +90,8 @@ TOOLS = [
                     "conditions": {
                         "type": "string",
                         "description": "Pandas query string for filtering rows",
-                    }
+                    },
+                    "dataset_id": _DATASET_ID_PARAM,
                 },
                 "required": ["conditions"],
             },
@@ -75,6 +118,7 @@ TOOLS = [
                         "enum": ["mean", "sum", "count", "min", "max", "median", "std"],
                         "description": "Aggregation function",
                     },
+                    "dataset_id": _DATASET_ID_PARAM,
                 },
                 "required": ["group_column", "value_column", "agg_func"],
             },
@@ -87,7 +131,9 @@ TOOLS = [
             "description": "Get summary statistics (count, mean, std, min, max, etc.) for the active dataset.",
             "parameters": {
                 "type": "object",
-                "properties": {},
+                "properties": {
+                    "dataset_id": _DATASET_ID_PARAM,
+                },
             },
         },
     },
@@ -116,6 +162,7 @@ TOOLS = [
                         "type": "string",
                         "description": "Chart title",
                     },
+                    "dataset_id": _DATASET_ID_PARAM,
                 },
                 "required": ["plot_type", "x_column"],
             },
@@ -125,7 +172,7 @@ TOOLS = [
         "type": "function",
         "function": {
             "name": "search_documents",
-            "description": "Search uploaded research papers / PDF documents for information related to a query. Uses semantic search.",
+            "description": "Search uploaded research papers / PDF documents for information related to a query. Uses semantic search by default; use lexical or hybrid mode for exact identifiers. To look up several sub-questions, pass them together in `queries` instead of calling this tool repeatedly.",
             "parameters": {
                 "type": "object",
                 "properties": {
@@ -133,12 +180,66 @@ TOOLS = [
                         "type": "string",
                         "description": "Search query",
                     },
+                    "queries": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Several search queries run in one batch; results are grouped per query",
+                    },
+                    "dedupe": {
+                        "type": "boolean",
+                        "description": "With queries: return each passage only once, under the first query that finds it",
+                    },
                     "top_k": {
                         "type": "integer",
                         "description": "Number of results to return (default 5)",
                     },
+                    "mode": {
+                        "type": "string",
+                        "enum": ["vector", "lexical", "hybrid"],
+                        "description": "vector = semantic (default); lexical = exact terms such as gene symbols, compound IDs or assay codes; hybrid = both combined",
+                    },
+                    "documents": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Only search these documents (names or doc ids). Use when the question is about specific papers.",
+                    },
+                    "chunk_start": {
+                        "type": "integer",
+                        "description": "Only search chunks from this index on (inclusive)",
+                    },
+                    "chunk_end": {
+                        "type": "integer",
+                        "description": "Only search chunks up to this index (inclusive)",
+                    },
+                    "page_start": {
+                        "type": "integer",
+                        "description": "Only search from this page on (inclusive)",
+                    },
+                    "page_end": {
+                        "type": "integer",
+                        "description": "Only search up to this page (inclusive)",
+                    },
+                },
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_document_context",
+            "description": "Read the text surrounding a search_documents result, e.g. when a passage is cut off or its context is needed. Pass the result's doc_id, start and end.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "doc_id": {"type": "string", "description": "doc_id of the search result"},
+                    "start": {"type": "integer", "description": "start offset of the search result"},
+                    "end": {"type": "integer", "description": "end offset of the search result"},
+                    "chars": {
+                        "type": "integer",
+                        "description": "Characters of context on each side (default 1000)",
+                    },
                 },
-                "required": ["query"],
+                "required": ["doc_id", "start", "end"],
             },
         },
     },
@@ -146,14 +247,15 @@ TOOLS = [
         "type": "function",
         "function": {
             "name": "execute_pandas_code",
-            "description": "Execute custom Pandas/Plotly Python code on the active dataset. The DataFrame is available as `df`. Store results in `result` variable and/or Plotly figures in `fig` variable.",
+            "description": "Execute custom Pandas/Plotly Python code on the active dataset. The DataFrame is available as `df`. Store results in `result` variable and/or Plotly figures in `fig` variable. Large DataFrame results are saved as a derived dataset; the response includes its dataset_id and a preview.",
             "parameters": {
                 "type": "object",
                 "properties": {
                     "code": {
                         "type": "string",
                         "description": "Python code to execute. Use `df` for the DataFrame. Put results in `result` (any type) or `fig` (Plotly figure).",
-                    }
+                    },
+                    "dataset_id": _DATASET_ID_PARAM,
                 },
                 "required": ["code"],
             },
@@ -163,26 +265,19 @@ TOOLS = [
 
 
 # build system prompt
-
-def _build_system_prompt() -> str:
-    dataset_info = ""
-    if store.active_dataset_id and store.active_dataset_id in store.data_frames:
-        df = store.data_frames[store.active_dataset_id]
-        meta = store.data_meta.get(store.active_dataset_id, {})
-        dataset_info = (
-            f"\n\nCurrently loaded dataset: '{meta.get('filename', 'unknown')}'\n"
-            f"Columns: {list(df.columns)}\n"
-            f"Shape: {df.shape[0]} rows × {df.shape[1]} columns\n"
-            f"Data types: {dict(df.dtypes.astype(str))}\n"
-            f"Sample (first 3 rows):\n{df.head(3).to_string()}\n"
-        )
-
-    doc_info = ""
-    doc_names = [m["name"] for m in store.document_meta.values()]
-    if doc_names:
-        doc_info = f"\n\nUploaded documents: {doc_names}\n"
-
-    return f"""You are Lab Co-Pilot, a helpful assistant for laboratory researchers.
+#
+# The instructions are a constant prefix, byte-identical on every turn so the
+# provider can reuse its cached prefix; the dataset and document sections
+# follow it and are cached by (active dataset, dataset version, catalog
+# version), so a turn only rebuilds them after an upload or a deletion.
+
+PROMPT_MAX_COLUMNS = int(os.getenv("PROMPT_MAX_COLUMNS", "60"))
+PROMPT_SAMPLE_COLUMNS = int(os.getenv("PROMPT_SAMPLE_COLUMNS", "12"))
+PROMPT_SAMPLE_ROWS = int(os.getenv("PROMPT_SAMPLE_ROWS", "3"))
+PROMPT_SAMPLE_CELL_CHARS = int(os.getenv("PROMPT_SAMPLE_CELL_CHARS", "40"))
+PROMPT_MAX_DOCUMENTS = int(os.getenv("PROMPT_MAX_DOCUMENTS", "50"))
+
+_SYSTEM_PROMPT = """You are Lab Co-Pilot, a helpful assistant for laboratory researchers.
 You help users analyze experimental data, create visualizations, and answer questions about uploaded research documents.
 
 You have access to the following tools:
@@ -191,6 +286,7 @@ You have access to the following tools:
 - describe_data: Get summary statistics
 - generate_plot: Create charts (bar, pie, scatter, line, histogram, box)
 - search_documents: Search uploaded PDF documents
+- get_document_context: Read the text around a search result
 - execute_pandas_code: Run custom Pandas code on the dataset
 
 Guidelines:
@@ -198,20 +294,93 @@ Guidelines:
 - When the user asks questions about their data, use the data tools.
 - When the user asks about research papers or scientific topics, use search_documents.
 - For complex analyses, use execute_pandas_code.
+- Large results from execute_pandas_code are saved as derived datasets; pass their dataset_id to later tool calls instead of recomputing them.
 - Always explain your results in clear, non-technical language.
 - If no dataset is loaded, tell the user to upload one first.
-{dataset_info}{doc_info}"""
+"""
+
+_prompts = LRUCache(maxsize=16)
+
+
+def _clip(value: Any) -> str:
+    text = str(value)
+    if len(text) <= PROMPT_SAMPLE_CELL_CHARS:
+        return text
+    return text[:PROMPT_SAMPLE_CELL_CHARS - 3] + "..."
+
+
+def _dataset_section(file_id: str) -> str:
+    df = store.data_frames[file_id]
+    meta = store.data_meta.get(file_id, {})
+    n_cols = df.shape[1]
+
+    shown = [f"{col} ({dtype})" for col, dtype in zip(df.columns[:PROMPT_MAX_COLUMNS], df.dtypes.astype(str))]
+    columns = ", ".join(shown)
+    if n_cols > PROMPT_MAX_COLUMNS:
+        columns += f", ... and {n_cols - PROMPT_MAX_COLUMNS} more (use describe_data to see all)"
+
+    # Header names are capped like the cells; the full names are listed above
+    sample = df.iloc[:PROMPT_SAMPLE_ROWS, :PROMPT_SAMPLE_COLUMNS]
+    sample = sample.set_axis([_clip(col) for col in sample.columns], axis=1).to_string(
+        max_colwidth=PROMPT_SAMPLE_CELL_CHARS,
+    )
+    sample_note = f", first {PROMPT_SAMPLE_COLUMNS} columns" if n_cols > PROMPT_SAMPLE_COLUMNS else ""
+
+    return (
+        f"\nCurrently loaded dataset: '{meta.get('filename', 'unknown')}'\n"
+        f"Shape: {df.shape[0]} rows × {n_cols} columns\n"
+        f"Columns (dtype): {columns}\n"
+        f"Sample (first {PROMPT_SAMPLE_ROWS} rows{sample_note}):\n{sample}\n"
+    )
+
+
+def _documents_section() -> str:
+    doc_names = [d["name"] for d in doc_catalog.list_documents()]
+    if not doc_names:
+        return ""
+    more = len(doc_names) - PROMPT_MAX_DOCUMENTS
+    listed = doc_names[:PROMPT_MAX_DOCUMENTS]
+    suffix = f" ... and {more} more (search_documents covers all of them)" if more > 0 else ""
+    return f"\nUploaded documents ({len(doc_names)}): {listed}{suffix}\n"
+
+
+def _build_system_prompt() -> str:
+    file_id = store.active_dataset_id
+    if file_id not in store.data_frames:
+        file_id = None
+    key = (file_id, store.data_versions.get(file_id), doc_catalog.version())
+
+    prompt = _prompts.get(key)
+    if prompt is None:
+        metrics.increment("chat.system_prompt_builds")
+        dataset_info = _dataset_section(file_id) if file_id else ""
+        prompt = _SYSTEM_PROMPT + dataset_info + _documents_section()
+        _prompts.put(key, prompt)
+    return prompt
 
 
 # tool execution 
 
+def _resolve_dataset(args: dict[str, Any]) -> tuple[str | None, Any]:
+    """Return (file_id, DataFrame) for the tool's dataset_id or the active dataset."""
+    fid = args.get("dataset_id") or store.active_dataset_id
+    if not fid or fid not in store.data_frames:
+        return fid, None
+    return fid, store.data_frames[fid]
+
+
 def _execute_tool(name: str, args: dict[str, Any]) -> dict[str, Any]:
     """Execute a tool call and return the result."""
 
-    if name == "filter_data":
-        if not store.active_dataset_id:
+    if name in ("filter_data", "aggregate_data", "describe_data",
+                "generate_plot", "execute_pandas_code"):
+        fid, df = _resolve_dataset(args)
+        if df is None:
+            if args.get("dataset_id"):
+                return {"error": f"Unknown dataset_id: {args['dataset_id']}"}
             return {"error": "No dataset loaded."}
-        df = store.data_frames[store.active_dataset_id]
+
+    if name == "filter_data":
         result = filter_data(df, args["conditions"])
         return {
             "data": result.head(50).fillna("").to_dict(orient="records"),
@@ -220,9 +389,6 @@ def _execute_tool(name: str, args: dict[str, Any]) -> dict[str, Any]:
         }
 
     elif name == "aggregate_data":
-        if not store.active_dataset_id:
-            return {"error": "No dataset loaded."}
-        df = store.data_frames[store.active_dataset_id]
         result = aggregate_data(
             df,
             args["group_column"],
@@ -236,15 +402,9 @@ def _execute_tool(name: str, args: dict[str, Any]) -> dict[str, Any]:
         }
 
     elif name == "describe_data":
-        if not store.active_dataset_id:
-            return {"error": "No dataset loaded."}
-        df = store.data_frames[store.active_dataset_id]
         return describe_data(df)
 
     elif name == "generate_plot":
-        if not store.active_dataset_id:
-            return {"error": "No dataset loaded."}
-        df = store.data_frames[store.active_dataset_id]
         plot_json = generate_plot(
             df,
             plot_type=args["plot_type"],
@@ -255,41 +415,215 @@ def _execute_tool(name: str, args: dict[str, Any]) -> dict[str, Any]:
         return {"plot_json": plot_json, "plot_type": args["plot_type"]}
 
     elif name == "search_documents":
-        results = kb_search(args["query"], top_k=args.get("top_k", 5))
-        return {"results": results}
+        options = {
+            "top_k": args.get("top_k", 5),
+            "mode": args.get("mode", "vector"),
+            "documents": args.get("documents") or None,
+            "chunk_range": (args.get("chunk_start"), args.get("chunk_end")),
+            "page_range": (args.get("page_start"), args.get("page_end")),
+        }
+        try:
+            if not args.get("queries"):
+                if not args.get("query"):
+                    return {"error": "Provide query or queries."}
+                return {"results": kb_search(args["query"], **options)}
+            queries = ([args["query"]] if args.get("query") else []) + list(args["queries"])
+            grouped = kb_search(queries, dedupe=bool(args.get("dedupe", False)), **options)
+        except ValueError as e:  # unknown document or mode
+            return {"error": str(e)}
+        return {"groups": [{"query": q, "results": r} for q, r in zip(queries, grouped)]}
+
+    elif name == "get_document_context":
+        try:
+            return kb_get_context(
+                args["doc_id"], int(args["start"]), int(args["end"]),
+                int(args.get("chars", KB_CONTEXT_CHARS)),
+            )
+        except ValueError as e:  # unknown document, no cached text or bad offsets
+            return {"error": str(e)}
 
     elif name == "execute_pandas_code":
-        if not store.active_dataset_id:
-            return {"error": "No dataset loaded."}
-        df = store.data_frames[store.active_dataset_id]
-        return execute_code(args["code"], df)
+        return execute_code(args["code"], df, dataset_id=fid)
 
     else:
         return {"error": f"Unknown tool: {name}"}
 
 
-# ── Main chat function ───────────────────────────────────────────────────────
+_TOOL_NAMES = frozenset(tool["function"]["name"] for tool in TOOLS)
 
-def chat(user_message: str) -> dict[str, Any]:
+
+def _get_tool_executor() -> ThreadPoolExecutor:
+    global _tool_executor
+    with _tool_executor_lock:
+        if _tool_executor is None:
+            _tool_executor = ThreadPoolExecutor(
+                max_workers=max(LLM_TOOL_WORKERS, 1),
+                thread_name_prefix="llm-tool",
+            )
+    return _tool_executor
+
+
+def _call_tool(name: str, args: dict[str, Any]) -> tuple[dict[str, Any], str, int]:
     """
-    Process a user message:
-    1. Send to Mistral with tools
-    2. Execute any tool calls
-    3. Return final response with optional plot/table
+    Run a tool and serialize what the model reads back: (full result,
+    summarized JSON for the tool message, length of the full result's JSON).
     """
-    client = _get_client()
+    result = _execute_tool(name, args)
+    full_chars = len(json.dumps(result, default=str))
+    return result, json.dumps(tool_results.compact(result), default=str), full_chars
 
-    # Build messages
-    messages = [{"role": "system", "content": _build_system_prompt()}]
 
-    # Add conversation history (last 20 messages)
-    for h in store.conversation_history[-20:]:
-        messages.append({"role": h["role"], "content": h["content"]})
+async def _run_tools(
+    calls: list[tuple[str, dict[str, Any]]],
+) -> AsyncIterator[tuple[int, tuple[dict[str, Any], str, int], float]]:
+    """
+    Run (name, args) tool calls concurrently on the tool pool and yield
+    (position, `_call_tool` output, seconds) for each as it finishes.
+    """
+    loop = asyncio.get_running_loop()
+    executor = _get_tool_executor()
+
+    async def run(position: int, fn_name: str, fn_args: dict[str, Any]) -> tuple[int, Any, float]:
+        started = time.perf_counter()
+        outcome = await loop.run_in_executor(executor, _call_tool, fn_name, fn_args)
+        seconds = time.perf_counter() - started
+        if fn_name in _TOOL_NAMES:  # names come from the model; keep metric keys bounded
+            metrics.observe(f"chat.tool_seconds.{fn_name}", seconds)
+        return position, outcome, seconds
+
+    tasks = [asyncio.ensure_future(run(i, name, args)) for i, (name, args) in enumerate(calls)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        for task in tasks:
+            task.cancel()
+
 
+# ── Main chat function ───────────────────────────────────────────────────────
+
+def _start_turn(user_message: str) -> list[dict[str, Any]]:
+    """Build the messages for Mistral and record the user message in history."""
+    messages = [{"role": "system", "content": _build_system_prompt()}]
+    messages.extend(history.context())  # recent turns within the token budget, older ones summarized
     messages.append({"role": "user", "content": user_message})
+    history.add_user(user_message)
+    return messages
+
+
+def _payloads(tool_result: dict[str, Any]) -> dict[str, Any]:
+    """Plot and/or table carried by a tool result, for the UI."""
+    found: dict[str, Any] = {}
+    if tool_result.get("plot_json"):
+        found["plot_json"] = tool_result["plot_json"]
+    if isinstance(tool_result.get("data"), list):
+        found["table_data"] = tool_result["data"]
+        found["table_columns"] = tool_result.get("columns", [])
+    inner = tool_result.get("result")
+    if isinstance(inner, dict) and "data" in inner:
+        found["table_data"] = inner["data"]
+        found["table_columns"] = inner.get("columns", [])
+    return found
+
+
+def _tool_message(fn_name: str, tool_call_id: str | None, content: str) -> dict[str, Any]:
+    return {
+        "role": "tool",
+        "name": fn_name,
+        "content": content,
+        "tool_call_id": tool_call_id,
+    }
+
+
+def _prompt_chars(messages: list[dict[str, Any]]) -> int:
+    return sum(len(m.get("content") or "") for m in messages)
+
+
+def _end_turn(response_data: dict[str, Any]) -> None:
+    history.add_assistant(
+        response_data["text"],
+        plot_json=response_data["plot_json"],
+        table_data=response_data["table_data"],
+        table_columns=response_data["table_columns"],
+    )
 
-    # Store user message in history
-    store.conversation_history.append({"role": "user", "content": user_message})
+
+def _delta_text(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):  # content chunks; only text is streamed
+        return "".join(getattr(chunk, "text", "") or "" for chunk in content)
+    return ""
+
+
+async def _stream_completion(
+    client: Mistral,
+    messages: list[Any],
+    tools: list[dict[str, Any]] | None = None,
+) -> AsyncIterator[tuple[str, Any]]:
+    """
+    One streamed Mistral completion: yields ("token", text) as text arrives,
+    then ("tool_calls", [call, ...]) with the assembled tool calls (possibly
+    none) once the stream ends.
+    """
+    kwargs: dict[str, Any] = {"tools": tools} if tools else {}
+    stream = await client.chat.stream_async(model=_model, messages=messages, **kwargs)
+    # Fragments of one call share its index when the server sends one. ToolCall.index
+    # defaults to 0, so an unset index is no evidence; fall back to the call id, then
+    # to the position within the delta. Calls keep the order they first appeared in.
+    calls: dict[tuple[str, Any], dict[str, Any]] = {}
+    async with stream:
+        async for event in stream:
+            if not event.data.choices:
+                continue
+            delta = event.data.choices[0].delta
+            text = _delta_text(delta.content)
+            if text:
+                yield "token", text
+            for position, call in enumerate(delta.tool_calls or []):
+                call_id = call.id if isinstance(call.id, str) and call.id != "null" else None
+                if "index" in call.model_fields_set and isinstance(call.index, int):
+                    key: tuple[str, Any] = ("index", call.index)
+                elif call_id is not None:
+                    key = ("id", call_id)
+                else:
+                    key = ("position", position)
+                entry = calls.setdefault(
+                    key, {"id": None, "type": "function", "function": {"name": "", "arguments": ""}}
+                )
+                if call_id is not None:
+                    entry["id"] = call_id
+                if call.function.name:
+                    entry["function"]["name"] = call.function.name
+                arguments = call.function.arguments
+                entry["function"]["arguments"] += (
+                    json.dumps(arguments) if isinstance(arguments, dict) else arguments or ""
+                )
+    yield "tool_calls", list(calls.values())
+
+
+async def chat_stream(user_message: str) -> AsyncIterator[dict[str, Any]]:
+    """
+    Process a user message with Mistral's async streaming API, yielding
+    events as they happen:
+
+      {"type": "tool_call", "name", "arguments"}
+      {"type": "tool_result", "name", "seconds", "error"}
+      {"type": "plot", "plot_json"}
+      {"type": "table", "table_data", "table_columns"}
+      {"type": "token", "text"}
+      {"type": "error", "message"}
+      {"type": "done", "text", "plot_json", "table_data", "table_columns",
+                       "tool_timings", "tools_seconds", "time_to_first_token", "seconds"}
+
+    Tool results (and their plot/table events) are yielded as each tool
+    finishes; `tool_timings` lists every call in request order. The turn
+    is recorded in the history even if the consumer stops early.
+    """
+    client = _get_client()
+    t0 = time.perf_counter()
+    # Building the prompt can query the catalog, render a dataset sample and walk the history
+    messages = await asyncio.to_thread(_start_turn, user_message)
 
     response_data: dict[str, Any] = {
         "text": "",
@@ -297,70 +631,115 @@ def chat(user_message: str) -> dict[str, Any]:
         "table_data": None,
         "table_columns": None,
     }
+    parts: list[str] = []
+    first_token: float | None = None
+    tool_timings: list[dict[str, Any]] = []
+    tools_seconds: float | None = None
+
+    def token(text: str) -> dict[str, Any]:
+        nonlocal first_token
+        if first_token is None:
+            first_token = time.perf_counter() - t0
+            metrics.observe("chat.time_to_first_token_seconds", first_token)
+        parts.append(text)
+        return {"type": "token", "text": text}
 
     try:
-        # First LLM call — may include tool calls
-        response = client.chat.complete(
-            model=_model,
-            messages=messages,
-            tools=TOOLS,
-        )
-
-        assistant_msg = response.choices[0].message
-
-        # Process tool calls if any
-        if assistant_msg.tool_calls:
-            # Add assistant message with tool calls to messages
-            messages.append(assistant_msg)
-
-            for tool_call in assistant_msg.tool_calls:
-                fn_name = tool_call.function.name
-                fn_args = json.loads(tool_call.function.arguments)
-
-                tool_result = _execute_tool(fn_name, fn_args)
-
-                # Extract plot/table from tool result
-                if "plot_json" in tool_result and tool_result["plot_json"]:
-                    response_data["plot_json"] = tool_result["plot_json"]
-
-                if "data" in tool_result and isinstance(tool_result["data"], list):
-                    response_data["table_data"] = tool_result["data"]
-                    response_data["table_columns"] = tool_result.get("columns", [])
-
-                if "result" in tool_result and isinstance(tool_result.get("result"), dict):
-                    inner = tool_result["result"]
-                    if "data" in inner:
-                        response_data["table_data"] = inner["data"]
-                        response_data["table_columns"] = inner.get("columns", [])
-
-                # Add tool result to messages
-                messages.append({
-                    "role": "tool",
-                    "name": fn_name,
-                    "content": json.dumps(tool_result, default=str),
-                    "tool_call_id": tool_call.id,
-                })
-
-            # Second LLM call — generate final response with tool results
-            response = client.chat.complete(
-                model=_model,
-                messages=messages,
-            )
-            response_data["text"] = response.choices[0].message.content or ""
-
-        else:
-            response_data["text"] = assistant_msg.content or ""
-
-    except Exception as e:
-        response_data["text"] = f"I encountered an error: {str(e)}"
+        try:
+            # First LLM call — may include tool calls
+            tool_calls: list[dict[str, Any]] = []
+            async for kind, value in _stream_completion(client, messages, tools=TOOLS):
+                if kind == "token":
+                    yield token(value)
+                else:
+                    tool_calls = value
+
+            if tool_calls:
+                messages.append({"role": "assistant", "content": "".join(parts), "tool_calls": tool_calls})
+
+                calls = []
+                for call in tool_calls:
+                    fn_name = call["function"]["name"]
+                    fn_args = json.loads(call["function"]["arguments"] or "{}")
+                    calls.append((fn_name, fn_args))
+                    yield {"type": "tool_call", "name": fn_name, "arguments": fn_args}
+
+                started = time.perf_counter()
+                results: list[Any] = [None] * len(calls)
+                async for position, outcome, seconds in _run_tools(calls):
+                    results[position] = (outcome, seconds)
+                    tool_result = outcome[0]
+                    yield {
+                        "type": "tool_result",
+                        "name": calls[position][0],
+                        "seconds": round(seconds, 4),
+                        "error": tool_result.get("error"),
+                    }
+                    found = _payloads(tool_result)
+                    if "plot_json" in found:
+                        yield {"type": "plot", "plot_json": found["plot_json"]}
+                    if "table_data" in found:
+                        yield {"type": "table", "table_data": found["table_data"],
+                               "table_columns": found["table_columns"]}
+                tools_seconds = time.perf_counter() - started
+
+                # Back in request order: the model matches tool messages to its calls
+                full_chars = 0
+                for call, (fn_name, _), ((tool_result, content, size), seconds) in zip(tool_calls, calls, results):
+                    response_data.update(_payloads(tool_result))
+                    tool_timings.append({"name": fn_name, "seconds": round(seconds, 4),
+                                         "error": tool_result.get("error")})
+                    messages.append(_tool_message(fn_name, call["id"], content))
+                    full_chars += size
+
+                prompt_chars = _prompt_chars(messages)
+                sent_chars = sum(len(m["content"]) for m in messages[-len(calls):])
+                logger.info(
+                    "Follow-up prompt: %d chars (tool results %d, summarized from %d; %d without summaries)",
+                    prompt_chars, sent_chars, full_chars, prompt_chars - sent_chars + full_chars,
+                )
+                metrics.observe("chat.tool_result_chars", full_chars, metrics.BYTES_BUCKETS)
+                metrics.observe("chat.tool_result_sent_chars", sent_chars, metrics.BYTES_BUCKETS)
+
+                # Second LLM call — generate final response with tool results
+                async for kind, value in _stream_completion(client, messages):
+                    if kind == "token":
+                        yield token(value)
+
+            response_data["text"] = "".join(parts)
+
+        except Exception as e:
+            response_data["text"] = f"I encountered an error: {str(e)}"
+            metrics.increment("chat.errors")
+            yield {"type": "error", "message": str(e)}
+    finally:
+        if not response_data["text"]:
+            response_data["text"] = "".join(parts)  # consumer went away mid-answer
+        # Recording gzips the plot / table payload to disk; keep that off the event loop.
+        # The thread finishes the write even if this await is cancelled.
+        await asyncio.to_thread(_end_turn, response_data)
+        metrics.observe("chat.response_seconds", time.perf_counter() - t0)
+
+    yield {
+        "type": "done",
+        **response_data,
+        "tool_timings": tool_timings,
+        "tools_seconds": round(tools_seconds, 4) if tools_seconds is not None else None,
+        "time_to_first_token": round(first_token, 4) if first_token is not None else None,
+        "seconds": round(time.perf_counter() - t0, 4),
+    }
 
-    # Store assistant response in history
-    store.conversation_history.append({
-        "role": "assistant",
-        "content": response_data["text"],
-        "plot_json": response_data["plot_json"],
-        "table_data": response_data["table_data"],
-        "table_columns": response_data["table_columns"],
-    })
 
-    return response_data
+async def chat_async(user_message: str) -> dict[str, Any]:
+    """
+    Process a user message without holding a thread for the LLM latency:
+    1. Send to Mistral with tools
+    2. Execute any tool calls
+    3. Return final response with optional plot/table
+    """
+    result: dict[str, Any] = {}
+    async for event in chat_stream(user_message):
+        if event["type"] == "done":
+            result = event
+    keys = ("text", "plot_json", "table_data", "table_columns", "tool_timings", "tools_seconds")
+    return {key: result.get(key) for key in keys}
@@ -0,0 +1,81 @@
+"""
+In-process metrics — counters and histograms exposed at /metrics.
+"""
+
+from __future__ import annotations
+
+import bisect
+import threading
+from typing import Any
+
+# Bucket upper bounds for latencies (1 ms … 100 s) and sizes (1 KB … 4 GB)
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 25.0, 50.0, 100.0)
+BYTES_BUCKETS = tuple(float(2 ** p) for p in range(10, 34, 2))
+
+
+class Histogram:
+    """Cumulative-bucket histogram with count / sum / min / max."""
+
+    def __init__(self, buckets: tuple[float, ...] = SECONDS_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot = +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min: float | None = None
+        self.max: float | None = None
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def snapshot(self) -> dict[str, Any]:
+        cumulative = 0
+        buckets: dict[str, int] = {}
+        for bound, n in zip([*map(str, self.buckets), "+Inf"], self.counts):
+            cumulative += n
+            buckets[bound] = cumulative
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.sum / self.count if self.count else None,
+            "buckets": buckets,
+        }
+
+
+_lock = threading.Lock()
+_counters: dict[str, float] = {}
+_histograms: dict[str, Histogram] = {}
+
+
+def increment(name: str, value: float = 1) -> None:
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(name: str, value: float, buckets: tuple[float, ...] = SECONDS_BUCKETS) -> None:
+    """Record `value` in histogram `name` (created with `buckets` on first use)."""
+    with _lock:
+        hist = _histograms.get(name)
+        if hist is None:
+            hist = _histograms[name] = Histogram(buckets)
+        hist.observe(value)
+
+
+def snapshot() -> dict[str, Any]:
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "histograms": {name: h.snapshot() for name, h in _histograms.items()},
+        }
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
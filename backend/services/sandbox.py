@@ -1,88 +1,156 @@
 """
 Restricted sandbox for executing LLM-generated Pandas/Plotly code.
+
+Code runs in a pool of pre-forked worker processes rather than in the API
+process. Workers are forked from a server that has already imported pandas
+and plotly, so a snippet never pays the import cost. Each execution is bounded by:
+
+  - a wall-clock timeout, enforced by the parent killing the worker,
+  - a CPU-time limit (RLIMIT_CPU / SIGXCPU inside the worker),
+  - an address-space limit (RLIMIT_AS inside the worker; shared frames
+    attached from the parent are mapped on top of it, not counted in it).
+
+The DataFrame is exported once into a shared-memory segment and attached by
+the workers, so large datasets are not pickled through the pipe on every call.
+Workers map the column buffers read-only and hand each snippet a shallow
+copy-on-write view, so a snippet can modify its `df` freely without a
+per-call deep copy and without touching the shared data.
+
+Compiled code objects are cached by source hash in each worker, and results
+of snippets that only read `df` are memoized per (source hash, dataset version).
+
+Every execution reports wall time, CPU time, peak RSS, result size and
+serialized output size under `metrics`; these also feed the process-wide
+counters in services.metrics and a per-snippet cost table.
+
+Results too large to return inline (more than SANDBOX_PREVIEW_ROWS rows) are
+registered in the store as derived datasets with lineage back to their
+source; the response carries the new dataset id and a bounded preview.
+Running the same snippet on the same dataset version again replaces its
+derived dataset rather than adding another, and at most SANDBOX_MAX_DERIVED
+derived datasets (SANDBOX_DERIVED_MB in total) are kept: the least recently
+produced ones are dropped from the store and their exports released.
 """
 
 from __future__ import annotations
 
+import ast
+import atexit
+import hashlib
+import mmap
+import multiprocessing as mp
+import os
+import pickle
+import queue
+import re
 import signal
+import sys
+import threading
+import time
 import traceback
-from typing import Any
+import uuid
+import weakref
+from collections import OrderedDict
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Connection
+from multiprocessing.shared_memory import SharedMemory
+from types import CodeType
+from typing import Any, Callable, NamedTuple
 
 import pandas as pd
 import plotly.express as px
 import plotly.io as pio
 
+import store
+from services import metrics
+from services.cache import LRUCache
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None  # type: ignore[assignment]
+
+try:
+    import _posixshmem
+except ImportError:  # Windows: attach through SharedMemory
+    _posixshmem = None
+
+# ── Configuration ────────────────────────────────────────────────────────────
+
+SANDBOX_WORKERS = int(os.getenv("SANDBOX_WORKERS", "2"))
+SANDBOX_MEMORY_MB = int(os.getenv("SANDBOX_MEMORY_MB", "2048"))
+SANDBOX_CPU_SECONDS = int(os.getenv("SANDBOX_CPU_SECONDS", "10"))
+SANDBOX_RESULT_CACHE_SIZE = int(os.getenv("SANDBOX_RESULT_CACHE_SIZE", "128"))
+SANDBOX_RESULT_CACHE_MB = int(os.getenv("SANDBOX_RESULT_CACHE_MB", "256"))
+SANDBOX_PREVIEW_ROWS = int(os.getenv("SANDBOX_PREVIEW_ROWS", "100"))
+SANDBOX_MAX_DERIVED = int(os.getenv("SANDBOX_MAX_DERIVED", "20"))
+SANDBOX_DERIVED_MB = int(os.getenv("SANDBOX_DERIVED_MB", "1024"))
+
+# How many shared DataFrames a worker keeps attached between calls
+_WORKER_FRAME_CACHE = 4
+
 
 class SandboxTimeout(Exception):
     pass
 
 
-def _timeout_handler(signum, frame):
-    raise SandboxTimeout("Code execution timed out (10s limit).")
+_SAFE_BUILTINS: dict[str, Any] = {
+    "range": range,
+    "len": len,
+    "int": int,
+    "float": float,
+    "str": str,
+    "list": list,
+    "dict": dict,
+    "tuple": tuple,
+    "set": set,
+    "bool": bool,
+    "True": True,
+    "False": False,
+    "None": None,
+    "abs": abs,
+    "round": round,
+    "min": min,
+    "max": max,
+    "sum": sum,
+    "sorted": sorted,
+    "enumerate": enumerate,
+    "zip": zip,
+    "map": map,
+    "filter": filter,
+    "print": print,
+    "isinstance": isinstance,
+    "type": type,
+}
 
 
-def execute_code(
-    code: str,
-    df: pd.DataFrame,
-    timeout_seconds: int = 10,
-) -> dict[str, Any]:
-    """
-    Execute LLM-generated Python code in a restricted namespace.
+# ── Code execution (runs inside a worker) ────────────────────────────────────
 
-    The code has access to:
-      - `df` (the current DataFrame)
-      - `pd` (pandas)
-      - `px` (plotly.express)
+def _enable_copy_on_write() -> None:
+    """Copy-on-Write is always on from pandas 3.0; opt in on older versions."""
+    if int(pd.__version__.split(".")[0]) < 3:
+        pd.set_option("mode.copy_on_write", True)
 
-    It should produce either:
-      - `result` — a DataFrame, dict, string, or number
-      - `fig` — a Plotly figure
 
-    Returns: {"result": ..., "plot_json": ..., "error": ...}
+def _sandbox_view(df: pd.DataFrame) -> pd.DataFrame:
     """
+    A per-execution view of `df` that shares its buffers.
+
+    Under Copy-on-Write, any write through the view copies only the affected
+    column block first, so the attached frame is never modified.
+    """
+    return df.copy(deep=False)
+
+
+def _run_code(code: str | CodeType, df: pd.DataFrame) -> dict[str, Any]:
+    """Execute `code` against `df` and collect `result` / `fig`."""
     allowed_globals: dict[str, Any] = {
-        "__builtins__": {
-            "range": range,
-            "len": len,
-            "int": int,
-            "float": float,
-            "str": str,
-            "list": list,
-            "dict": dict,
-            "tuple": tuple,
-            "set": set,
-            "bool": bool,
-            "True": True,
-            "False": False,
-            "None": None,
-            "abs": abs,
-            "round": round,
-            "min": min,
-            "max": max,
-            "sum": sum,
-            "sorted": sorted,
-            "enumerate": enumerate,
-            "zip": zip,
-            "map": map,
-            "filter": filter,
-            "print": print,
-            "isinstance": isinstance,
-            "type": type,
-        },
+        "__builtins__": _SAFE_BUILTINS,
         "pd": pd,
         "px": px,
-        "df": df.copy(),
+        "df": df,
     }
     local_vars: dict[str, Any] = {}
-
-    # Set a timeout (Unix only)
-    old_handler = None
-    try:
-        old_handler = signal.signal(signal.SIGALRM, _timeout_handler)
-        signal.alarm(timeout_seconds)
-    except (AttributeError, ValueError):
-        pass  # Windows or non-main thread — skip alarm
-
     output: dict[str, Any] = {"result": None, "plot_json": None, "error": None}
 
     try:
@@ -95,27 +163,723 @@ def execute_code(
 
         if "result" in local_vars:
             res = local_vars["result"]
+            output["metrics"] = {"result_bytes": _result_bytes(res)}
+            if isinstance(res, pd.Series) and len(res) > SANDBOX_PREVIEW_ROWS:
+                res = res.to_frame(name=res.name if res.name is not None else "value").reset_index()
             if isinstance(res, pd.DataFrame):
                 output["result"] = {
-                    "data": res.head(100).fillna("").to_dict(orient="records"),
+                    "data": res.head(SANDBOX_PREVIEW_ROWS).fillna("").to_dict(orient="records"),
                     "columns": list(res.columns),
                     "row_count": len(res),
                 }
+                if len(res) > SANDBOX_PREVIEW_ROWS:
+                    output["frame"] = res  # materialized by the parent
             elif isinstance(res, pd.Series):
                 output["result"] = res.to_dict()
             else:
                 output["result"] = res
 
     except SandboxTimeout:
-        output["error"] = "Code execution timed out (10s limit)."
+        output["error"] = "Code execution exceeded the sandbox CPU time limit."
+    except MemoryError:
+        output["error"] = f"Code execution exceeded the memory limit ({SANDBOX_MEMORY_MB} MB)."
     except Exception:
         output["error"] = traceback.format_exc()
+
+    return output
+
+
+# Worker-local: each worker compiles a given snippet at most once
+_code_cache = LRUCache(maxsize=256)
+
+
+def _compile_cached(digest: str, code: str) -> CodeType:
+    code_obj = _code_cache.get(digest)
+    if code_obj is None:
+        code_obj = compile(code, "<sandbox>", "exec")
+        _code_cache.put(digest, code_obj)
+    return code_obj
+
+
+def _result_bytes(res: Any) -> int:
+    """In-memory size of a snippet's `result` object."""
+    try:
+        if isinstance(res, pd.DataFrame):
+            return int(res.memory_usage(deep=True).sum())
+        if isinstance(res, pd.Series):
+            return int(res.memory_usage(deep=True))
+        return sys.getsizeof(res)
+    except Exception:
+        return 0
+
+
+def _reset_peak_rss() -> None:
+    """Reset the kernel's high-water mark so VmHWM covers one execution (Linux)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_bytes() -> int:
+    try:
+        with open("/proc/self/status") as f:
+            match = re.search(r"VmHWM:\s+(\d+)\s+kB", f.read())
+        if match:
+            return int(match.group(1)) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return 0
+    # Lifetime peak; kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _cpu_limit_handler(signum, frame):
+    raise SandboxTimeout("CPU time limit exceeded.")
+
+
+def _memory_budget(memory_mb: int) -> int | None:
+    """The worker's address-space budget: its current size plus `memory_mb`."""
+    if resource is None or memory_mb <= 0:
+        return None
+    baseline = 0
+    try:
+        with open("/proc/self/statm") as f:
+            baseline = int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    return baseline + memory_mb * 1024 * 1024
+
+
+def _apply_memory_limit(limit: int | None) -> None:
+    """Set RLIMIT_AS to `limit` bytes (None leaves it alone)."""
+    if resource is None or limit is None:
+        return
+    try:
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    except (ValueError, OSError):
+        pass
+
+
+def _set_cpu_limit(seconds: int | None) -> None:
+    """Arm (or disarm, with None) a CPU budget for the next execution."""
+    if resource is None or not hasattr(signal, "SIGXCPU"):
+        return
+    try:
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        if seconds is None:
+            soft = hard
+        else:
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            soft = int(usage.ru_utime + usage.ru_stime) + 1 + seconds
+            if hard != resource.RLIM_INFINITY:
+                soft = min(soft, hard)
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+    except (ValueError, OSError):
+        pass
+
+
+def _picklable(output: dict[str, Any]) -> bytes:
+    """Pickle the output, falling back to repr() for exotic result objects."""
+    try:
+        return pickle.dumps(output, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        output["result"] = repr(output.get("result"))
+        return pickle.dumps(output, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+# ── Shared-memory DataFrame transport ────────────────────────────────────────
+
+class _FrameHandle(NamedTuple):
+    """What a worker needs to rebuild a DataFrame from shared memory."""
+    shm_name: str
+    meta_len: int
+    spans: tuple[tuple[int, int], ...]  # (offset, length) of each raw buffer
+
+
+class _SharedFrame:
+    """
+    A DataFrame exported into one shared-memory segment.
+
+    Layout: [pickle stream][buffer 0][buffer 1]... The pickle stream uses
+    protocol 5 with out-of-band buffers, so column data is laid out raw and
+    the worker maps it back without unpickling the arrays.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        buffers: list[pickle.PickleBuffer] = []
+        meta = pickle.dumps(df, protocol=5, buffer_callback=buffers.append)
+        raws = [b.raw() for b in buffers]
+        size = len(meta) + sum(r.nbytes for r in raws)
+
+        self.shm = SharedMemory(create=True, size=max(size, 1))
+        self.shm.buf[: len(meta)] = meta
+        offset = len(meta)
+        spans = []
+        for raw in raws:
+            self.shm.buf[offset: offset + raw.nbytes] = raw
+            spans.append((offset, raw.nbytes))
+            offset += raw.nbytes
+        self.handle = _FrameHandle(self.shm.name, len(meta), tuple(spans))
+
+    def release(self) -> None:
+        try:
+            self.shm.close()
+            self.shm.unlink()
+        except FileNotFoundError:
+            # Already removed externally; stop the resource tracker from retrying
+            if _posixshmem is not None:
+                resource_tracker.unregister(self.shm._name, "shared_memory")
+        except BufferError:
+            pass
+
+
+_exports: dict[int, _SharedFrame] = {}
+_exports_lock = threading.Lock()
+
+
+def _release_export(key: int, expected: _SharedFrame | None = None) -> None:
+    """Drop the export under `key` (only if it is still `expected`, when given)."""
+    with _exports_lock:
+        shared = _exports.get(key)
+        if shared is None or (expected is not None and shared is not expected):
+            return
+        del _exports[key]
+    shared.release()
+
+
+def _export_frame(df: pd.DataFrame) -> _SharedFrame:
+    """Return the shared-memory export of `df`, creating it on first use."""
+    key = id(df)
+    with _exports_lock:
+        shared = _exports.get(key)
+        if shared is None:
+            shared = _SharedFrame(df)
+            _exports[key] = shared
+            weakref.finalize(df, _release_export, key)
+    return shared
+
+
+class FrameLost(Exception):
+    """The shared-memory segment of a frame no longer exists."""
+
+
+class _Mapping:
+    """
+    A read-only mapping of a frame's segment, opened directly rather than
+    through SharedMemory: SharedMemory unlinks the segment when mapping it
+    fails (e.g. ENOMEM under RLIMIT_AS), which would delete the parent's
+    export, and registers it with the resource tracker.
+    """
+
+    def __init__(self, name: str, memory_limit: Callable[[int], None]):
+        if _posixshmem is None:
+            self._shm = SharedMemory(name=name)
+            self.size = self._shm.size
+            self.buf = self._shm.buf
+            return
+        self._shm = None
+        try:
+            fd = _posixshmem.shm_open("/" + name, os.O_RDONLY, mode=0o600)
+        except FileNotFoundError:
+            raise FrameLost(name) from None
+        try:
+            self.size = os.fstat(fd).st_size
+            memory_limit(self.size)  # make room in RLIMIT_AS before mapping
+            self._mmap = mmap.mmap(fd, self.size, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        self.buf = memoryview(self._mmap)
+
+    def close(self) -> None:
+        self.buf.release()
+        if self._shm is not None:
+            self._shm.close()
+        else:
+            self._mmap.close()
+
+
+class _AttachedFrames:
+    """
+    Worker-side LRU of DataFrames attached from shared memory.
+
+    Mapped segments are not counted against the worker's memory budget:
+    RLIMIT_AS is kept at `budget` plus the size of the attached segments,
+    and the least recently used frame is detached before a new one is
+    mapped.
+    """
+
+    def __init__(self, capacity: int = _WORKER_FRAME_CACHE, budget: int | None = None):
+        self._capacity = capacity
+        self._budget = budget
+        self._frames: OrderedDict[str, tuple[_Mapping, pd.DataFrame]] = OrderedDict()
+        self._apply_limit()
+
+    def _apply_limit(self, extra: int = 0) -> None:
+        if self._budget is not None:
+            mapped = sum(mapping.size for mapping, _ in self._frames.values())
+            _apply_memory_limit(self._budget + mapped + extra)
+
+    def get(self, handle: _FrameHandle) -> pd.DataFrame:
+        entry = self._frames.get(handle.shm_name)
+        if entry is not None:
+            self._frames.move_to_end(handle.shm_name)
+            return entry[1]
+
+        while len(self._frames) >= self._capacity:
+            self._detach(self._frames.popitem(last=False)[1])
+        try:
+            mapping = _Mapping(handle.shm_name, self._apply_limit)
+        except BaseException:
+            self._apply_limit()
+            raise
+        buffers: list[memoryview] = []
+        try:
+            buffers = [mapping.buf[off: off + n] for off, n in handle.spans]
+            df = pickle.loads(mapping.buf[: handle.meta_len], buffers=buffers)
+        except BaseException:
+            buffers.clear()
+            self._close(mapping)
+            self._apply_limit()
+            raise
+        self._frames[handle.shm_name] = (mapping, df)
+        return df
+
+    def clear(self) -> None:
+        while self._frames:
+            self._detach(self._frames.popitem()[1])
+
+    def _detach(self, entry: tuple[_Mapping, pd.DataFrame]) -> None:
+        mapping, df = entry
+        del entry, df
+        self._close(mapping)
+        self._apply_limit()
+
+    @staticmethod
+    def _close(mapping: _Mapping) -> None:
+        try:
+            mapping.close()
+        except BufferError:
+            pass  # a leaked object still views the segment; freed at exit
+
+
+# ── Worker process ───────────────────────────────────────────────────────────
+
+def _worker_main(conn: Connection, memory_mb: int) -> None:
+    """Serve execution requests until the pipe closes."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent handles Ctrl+C
+    if hasattr(signal, "SIGXCPU"):
+        signal.signal(signal.SIGXCPU, _cpu_limit_handler)
+    _enable_copy_on_write()
+
+    frames = _AttachedFrames(budget=_memory_budget(memory_mb))
+    try:
+        _serve(conn, frames)
     finally:
+        frames.clear()
+
+
+def _serve(conn: Connection, frames: _AttachedFrames) -> None:
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, OSError):
+            return
+        if task is None:
+            return
+
+        digest, code, handle, cpu_seconds = task
+        try:
+            df = frames.get(handle)
+            code_obj = _compile_cached(digest, code)
+        except FrameLost:
+            output = {"result": None, "plot_json": None, "frame_lost": True,
+                      "error": "The dataset's shared memory segment is gone."}
+        except Exception:
+            output = {"result": None, "plot_json": None,
+                      "error": f"Could not prepare sandbox: {traceback.format_exc()}"}
+        else:
+            _reset_peak_rss()
+            wall0, cpu0 = time.perf_counter(), time.process_time()
+            _set_cpu_limit(cpu_seconds)
+            try:
+                output = _run_code(code_obj, _sandbox_view(df))
+            finally:
+                _set_cpu_limit(None)
+            output["metrics"] = {
+                **output.get("metrics", {}),
+                "wall_seconds": time.perf_counter() - wall0,
+                "cpu_seconds": time.process_time() - cpu0,
+                "peak_rss_bytes": _peak_rss_bytes(),
+            }
+        conn.send_bytes(_picklable(output))
+
+
+def _mp_context():
+    """Prefer a fork server preloaded with this module (warm imports)."""
+    if "forkserver" in mp.get_all_start_methods():
+        ctx = mp.get_context("forkserver")
+        ctx.set_forkserver_preload([__name__])
+        return ctx
+    return mp.get_context("spawn")
+
+
+class _Worker:
+    def __init__(self, ctx, memory_mb: int):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(child_conn, memory_mb),
+            name="sandbox-worker",
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+
+    def stop(self) -> None:
         try:
-            signal.alarm(0)
-            if old_handler is not None:
-                signal.signal(signal.SIGALRM, old_handler)
-        except (AttributeError, ValueError):
+            self.conn.send(None)
+        except (OSError, ValueError):
             pass
+        self.process.join(timeout=1)
+        self.kill()
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=1)
+        self.conn.close()
+
 
+class SandboxPool:
+    """A fixed-size pool of sandbox workers; dead or hung workers are replaced."""
+
+    def __init__(self, size: int = SANDBOX_WORKERS, memory_mb: int = SANDBOX_MEMORY_MB):
+        self._ctx = _mp_context()
+        self._memory_mb = memory_mb
+        self._idle: queue.Queue[_Worker] = queue.Queue()
+        self._workers: set[_Worker] = set()
+        self._lock = threading.Lock()
+        for _ in range(max(size, 1)):
+            self._idle.put(self._spawn())
+
+    def _spawn(self) -> _Worker:
+        worker = _Worker(self._ctx, self._memory_mb)
+        with self._lock:
+            self._workers.add(worker)
+        return worker
+
+    def _replace(self, worker: _Worker) -> None:
+        worker.kill()
+        with self._lock:
+            self._workers.discard(worker)
+        self._idle.put(self._spawn())
+
+    def run(
+        self,
+        digest: str,
+        code: str,
+        shared: _SharedFrame,
+        timeout_seconds: float,
+        cpu_seconds: int,
+    ) -> tuple[dict[str, Any], int]:
+        """Run one snippet; returns (output, size of the pickled output)."""
+        try:
+            worker = self._idle.get(timeout=timeout_seconds)
+        except queue.Empty:
+            return {"result": None, "plot_json": None,
+                    "error": "Sandbox is busy; try again shortly."}, 0
+
+        healthy = False
+        try:
+            worker.conn.send((digest, code, shared.handle, cpu_seconds))
+            if not worker.conn.poll(timeout_seconds):
+                return {"result": None, "plot_json": None,
+                        "error": f"Code execution timed out ({timeout_seconds}s limit)."}, 0
+            payload = worker.conn.recv_bytes()
+            healthy = True
+            return pickle.loads(payload), len(payload)
+        except (EOFError, OSError):
+            worker.process.join(timeout=1)
+            return {"result": None, "plot_json": None,
+                    "error": f"Sandbox worker crashed (exit code {worker.process.exitcode})."}, 0
+        finally:
+            if healthy:
+                self._idle.put(worker)
+            else:
+                self._replace(worker)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            workers = list(self._workers)
+            self._workers.clear()
+        for worker in workers:
+            worker.stop()
+
+
+_pool: SandboxPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> SandboxPool:
+    """Return the process-wide sandbox pool, starting it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SandboxPool()
+        return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
+
+
+atexit.register(shutdown_pool)
+
+
+# ── Result memoization ───────────────────────────────────────────────────────
+
+# Calls whose result depends on more than the contents of `df`
+_NONDETERMINISTIC_CALLS = {
+    "sample", "shuffle", "random", "rand", "randn", "randint", "choice",
+    "now", "today", "utcnow",
+}
+
+
+def _binds_df(target: ast.AST) -> bool:
+    """True if an assignment/deletion target is `df` or reaches into it."""
+    if isinstance(target, (ast.Tuple, ast.List)):
+        return any(_binds_df(t) for t in target.elts)
+    if isinstance(target, ast.Starred):
+        return _binds_df(target.value)
+    while isinstance(target, (ast.Attribute, ast.Subscript)):
+        target = target.value
+    return isinstance(target, ast.Name) and target.id == "df"
+
+
+def _reads_df_only(tree: ast.AST) -> bool:
+    """
+    Conservatively decide whether a snippet only reads `df` and is
+    deterministic, i.e. its output is a function of (source, dataset).
+    """
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Assign, ast.Delete)):
+            if any(_binds_df(t) for t in node.targets):
+                return False
+        elif isinstance(node, (ast.AugAssign, ast.AnnAssign, ast.NamedExpr,
+                               ast.For, ast.comprehension)):
+            if _binds_df(node.target):
+                return False
+        elif isinstance(node, ast.Call):
+            if any(kw.arg == "inplace" for kw in node.keywords):
+                return False
+            func = node.func
+            name = func.attr if isinstance(func, ast.Attribute) else getattr(func, "id", None)
+            if name in _NONDETERMINISTIC_CALLS:
+                return False
+    return True
+
+
+# digest -> True/False (memoizable) for snippets that parse
+_analysis_cache = LRUCache(maxsize=512)
+
+_result_cache = LRUCache(
+    maxsize=SANDBOX_RESULT_CACHE_SIZE,
+    max_weight=SANDBOX_RESULT_CACHE_MB * 1024 * 1024,
+    weigh=lambda entry: entry[1],
+)
+
+
+def _analyze(digest: str, code: str) -> bool:
+    """Parse once per digest; raises SyntaxError for invalid code."""
+    memoizable = _analysis_cache.get(digest)
+    if memoizable is None:
+        memoizable = _reads_df_only(ast.parse(code, "<sandbox>", "exec"))
+        _analysis_cache.put(digest, memoizable)
+    return memoizable
+
+
+# ── Derived datasets ─────────────────────────────────────────────────────────
+
+def _evict_derived(key: tuple, entry: tuple[str, int]) -> None:
+    frame = store.drop_data_frame(entry[0])
+    if frame is not None:
+        _release_export(id(frame))
+    metrics.increment("sandbox.derived_evicted")
+
+
+# (source hash, source dataset id, source version) -> (derived file_id, bytes)
+_derived = LRUCache(
+    maxsize=SANDBOX_MAX_DERIVED,
+    max_weight=SANDBOX_DERIVED_MB * 1024 * 1024,
+    weigh=lambda entry: entry[1],
+    on_evict=_evict_derived,
+)
+_derived_lock = threading.Lock()
+
+
+def _materialize(output: dict[str, Any], code: str, digest: str, dataset_id: str | None) -> bool:
+    """
+    Register a large result frame as a dataset and point the output at it.
+    Returns True if the output carried a frame.
+    """
+    frame = output.pop("frame", None)
+    if frame is None:
+        return False
+    nbytes = int(frame.memory_usage(deep=True).sum())
+    if nbytes > SANDBOX_DERIVED_MB * 1024 * 1024:
+        output["result"]["note"] = (f"The full result ({nbytes // 2**20} MB) is larger than "
+                                    f"SANDBOX_DERIVED_MB and was not kept; only the preview is returned.")
+        return True
+
+    key = (digest, dataset_id, store.data_versions.get(dataset_id) if dataset_id else None)
+    source = store.data_meta.get(dataset_id, {}).get("filename", "sandbox") if dataset_id else "sandbox"
+    with _derived_lock:
+        previous = _derived.get(key)
+        # Same snippet on the same data: replace that dataset instead of adding one
+        file_id = previous[0] if previous and previous[0] in store.data_frames else uuid.uuid4().hex[:12]
+        replaced = store.data_frames.get(file_id)
+        store.put_data_frame(file_id, frame, {
+            "filename": f"derived from {source}",
+            "columns": [str(c) for c in frame.columns],
+            "row_count": len(frame),
+            "derived_from": dataset_id,
+            "code": code,
+        })
+        _derived.put(key, (file_id, nbytes))
+    if replaced is not None:
+        _release_export(id(replaced))
+    output["result"]["dataset_id"] = file_id
+    output["result"]["derived_from"] = dataset_id
+    return True
+
+
+# ── Resource accounting ──────────────────────────────────────────────────────
+
+# digest -> aggregated cost of that snippet, so expensive code can be found
+_snippet_stats = LRUCache(maxsize=256)
+_snippet_lock = threading.Lock()
+
+
+def _record(digest: str, code: str, output: dict[str, Any]) -> None:
+    m = output["metrics"]
+    metrics.increment("sandbox.executions")
+    if output.get("cached"):
+        metrics.increment("sandbox.cache_hits")
+        return
+    if output.get("error"):
+        metrics.increment("sandbox.errors")
+    metrics.observe("sandbox.wall_seconds", m.get("wall_seconds", 0.0))
+    metrics.observe("sandbox.cpu_seconds", m.get("cpu_seconds", 0.0))
+    metrics.observe("sandbox.peak_rss_bytes", m.get("peak_rss_bytes", 0), metrics.BYTES_BUCKETS)
+    metrics.observe("sandbox.result_bytes", m.get("result_bytes", 0), metrics.BYTES_BUCKETS)
+    metrics.observe("sandbox.output_bytes", m.get("output_bytes", 0), metrics.BYTES_BUCKETS)
+
+    with _snippet_lock:
+        stats = _snippet_stats.get(digest)
+        if stats is None:
+            stats = {"digest": digest[:12], "code": code[:200], "runs": 0, "errors": 0,
+                     "wall_seconds": 0.0, "cpu_seconds": 0.0, "max_peak_rss_bytes": 0}
+            _snippet_stats.put(digest, stats)
+        stats["runs"] += 1
+        stats["errors"] += bool(output.get("error"))
+        stats["wall_seconds"] += m.get("wall_seconds", 0.0)
+        stats["cpu_seconds"] += m.get("cpu_seconds", 0.0)
+        stats["max_peak_rss_bytes"] = max(stats["max_peak_rss_bytes"], m.get("peak_rss_bytes", 0))
+
+
+def snippet_stats(limit: int = 20) -> list[dict[str, Any]]:
+    """The most CPU-hungry snippets seen recently."""
+    with _snippet_lock:
+        rows = [dict(v) for v in _snippet_stats.values()]
+    rows.sort(key=lambda r: r["cpu_seconds"], reverse=True)
+    return rows[:limit]
+
+
+# ── Public entry point ───────────────────────────────────────────────────────
+
+def execute_code(
+    code: str,
+    df: pd.DataFrame,
+    timeout_seconds: int = 10,
+    dataset_id: str | None = None,
+) -> dict[str, Any]:
+    """
+    Execute LLM-generated Python code in a sandbox worker process.
+
+    The code has access to:
+      - `df` (the current DataFrame)
+      - `pd` (pandas)
+      - `px` (plotly.express)
+
+    It should produce either:
+      - `result` — a DataFrame, dict, string, or number
+      - `fig` — a Plotly figure
+
+    When `dataset_id` is given and the snippet only reads `df`, the output is
+    memoized per (source hash, dataset version). A result with more than
+    SANDBOX_PREVIEW_ROWS rows is stored as a derived dataset; `result` then
+    holds a preview plus `dataset_id` / `derived_from`.
+
+    Returns: {"result": ..., "plot_json": ..., "error": ..., "cached": bool,
+              "metrics": {wall_seconds, cpu_seconds, peak_rss_bytes,
+                          result_bytes, output_bytes}}
+    """
+    digest = hashlib.sha256(code.encode("utf-8")).hexdigest()
+    try:
+        memoizable = _analyze(digest, code)
+    except SyntaxError as e:
+        output = {"result": None, "plot_json": None, "cached": False, "metrics": {},
+                  "error": "".join(traceback.format_exception_only(type(e), e))}
+        _record(digest, code, output)
+        return output
+
+    memo_key = None
+    if memoizable and dataset_id is not None and dataset_id in store.data_versions:
+        memo_key = (digest, dataset_id, store.data_versions[dataset_id])
+        hit = _result_cache.get(memo_key)
+        result = hit[0].get("result") if hit is not None else None
+        derived_id = result.get("dataset_id") if isinstance(result, dict) else None
+        if derived_id is not None and derived_id not in store.data_frames:
+            hit = None  # its derived dataset has been evicted; run it again
+        if hit is not None:
+            output = {**hit[0], "cached": True}
+            _record(digest, code, output)
+            return output
+
+    shared = _export_frame(df)
+    t0 = time.perf_counter()
+    output, size = get_pool().run(digest, code, shared, timeout_seconds, SANDBOX_CPU_SECONDS)
+    if output.pop("frame_lost", False):
+        # The segment was removed behind our back (e.g. /dev/shm cleaned):
+        # export the frame again instead of handing out the dead handle
+        metrics.increment("sandbox.frames_reexported")
+        _release_export(id(df), shared)
+        shared = _export_frame(df)
+        output, size = get_pool().run(digest, code, shared, timeout_seconds, SANDBOX_CPU_SECONDS)
+    output["metrics"] = {
+        "wall_seconds": time.perf_counter() - t0,  # kept if the worker never answered
+        "cpu_seconds": 0.0,
+        "peak_rss_bytes": 0,
+        "result_bytes": 0,
+        **output.get("metrics", {}),
+        "output_bytes": size,
+    }
+    materialized = _materialize(output, code, digest, dataset_id)
+    if memo_key is not None and output.get("error") is None:
+        # Weigh what is cached: the pickled size still included the popped frame
+        weight = len(pickle.dumps(output, protocol=pickle.HIGHEST_PROTOCOL)) if materialized else size
+        _result_cache.put(memo_key, (output, weight))
+    output = {**output, "cached": False}
+    _record(digest, code, output)
     return output
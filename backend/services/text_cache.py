@@ -0,0 +1,149 @@
+"""
+Extracted-text cache — the text of every ingested PDF, keyed by content hash.
+
+Extraction is the slowest step of ingestion and the only one that needs the
+original PDF. Keeping its output lets the library be re-chunked and
+re-embedded (new CHUNK_SIZE / CHUNK_OVERLAP, a new embedding model, a
+different vector backend) without the PDFs and without re-parsing them.
+
+Each entry is one gzip-compressed JSON-lines file with a line per page:
+
+    {"page": 3, "start": 1042, "end": 1530, "text": "..."}
+
+where [start, end) are the page's character offsets in the page texts
+joined by blank lines — the exact text the chunker sees. Entries are
+written page by page as a document streams through ingestion, under
+TEXT_CACHE_PATH (default: next to the vector store) fanned out by the
+first two hex digits of the hash; a temp file and an atomic rename mean a
+reader never sees a partial entry.
+
+`get_text` returns a document's whole joined text, the coordinate space of
+the chunk offsets stored with every chunk; the last TEXT_CACHE_MEMORY_DOCS
+texts read are kept in memory, since context lookups cluster on the
+documents a conversation is about.
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import logging
+import os
+import tempfile
+from typing import Iterable
+
+from services import metrics
+from services.cache import LRUCache
+
+logger = logging.getLogger("lab-copilot.text-cache")
+
+TEXT_CACHE_PATH = os.getenv(
+    "TEXT_CACHE_PATH",
+    os.path.join(os.getenv("CHROMA_DB_PATH", "./chroma_db"), "text_cache"),
+)
+
+TEXT_CACHE_MEMORY_DOCS = int(os.getenv("TEXT_CACHE_MEMORY_DOCS", "8"))
+
+_SEPARATOR = "\n\n"
+
+_texts = LRUCache(maxsize=TEXT_CACHE_MEMORY_DOCS)
+
+
+def _entry_path(content_hash: str) -> str:
+    return os.path.join(TEXT_CACHE_PATH, content_hash[:2], f"{content_hash}.json.gz")
+
+
+class Writer:
+    """Stream the pages of one PDF into its cache entry; `commit()` publishes it."""
+
+    def __init__(self, content_hash: str):
+        self.content_hash = content_hash
+        self._path = _entry_path(content_hash)
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        fd, self._tmp = tempfile.mkstemp(dir=os.path.dirname(self._path), suffix=".tmp")
+        self._raw = os.fdopen(fd, "wb")
+        self._file = gzip.open(self._raw, "wt", encoding="utf-8", compresslevel=6)
+        self._length = 0
+        self._pages = 0
+
+    def add(self, page_number: int, text: str) -> None:
+        if self._pages:
+            self._length += len(_SEPARATOR)
+        start, self._length = self._length, self._length + len(text)
+        self._file.write(json.dumps({"page": page_number, "start": start, "end": self._length, "text": text}))
+        self._file.write("\n")
+        self._pages += 1
+
+    def _close(self) -> None:
+        # GzipFile does not close a file object it was handed
+        try:
+            self._file.close()
+        finally:
+            self._raw.close()
+
+    def commit(self) -> int:
+        """Publish the entry; returns its size in bytes."""
+        self._close()
+        os.replace(self._tmp, self._path)
+        size = os.path.getsize(self._path)
+        metrics.increment("text_cache.writes")
+        metrics.observe("text_cache.entry_bytes", size, metrics.BYTES_BUCKETS)
+        return size
+
+    def abort(self) -> None:
+        self._close()
+        if os.path.exists(self._tmp):
+            os.unlink(self._tmp)
+
+
+def put(content_hash: str, pages: Iterable[tuple[int, str]]) -> int:
+    """Store the (page number, text) pairs of a PDF; returns the bytes written."""
+    writer = Writer(content_hash)
+    try:
+        for page_number, text in pages:
+            writer.add(page_number, text)
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.commit()
+
+
+def get(content_hash: str) -> list[tuple[int, str]] | None:
+    """The cached (page number, text) pairs, or None if not cached."""
+    try:
+        with gzip.open(_entry_path(content_hash), "rt", encoding="utf-8") as f:
+            pages = [json.loads(line) for line in f]
+    except FileNotFoundError:
+        metrics.increment("text_cache.misses")
+        return None
+    except (OSError, ValueError) as e:  # truncated or corrupt: treat as missing
+        logger.warning("Unreadable text cache entry %s: %s", content_hash, e)
+        metrics.increment("text_cache.misses")
+        return None
+    metrics.increment("text_cache.hits")
+    return [(page["page"], page["text"]) for page in pages]
+
+
+def get_text(content_hash: str) -> str | None:
+    """The page texts joined by blank lines (what chunk offsets index), or None."""
+    text = _texts.get(content_hash)
+    if text is None:
+        pages = get(content_hash)
+        if pages is None:
+            return None
+        text = _SEPARATOR.join(page_text for _, page_text in pages)
+        _texts.put(content_hash, text)
+    return text
+
+
+def contains(content_hash: str) -> bool:
+    return os.path.exists(_entry_path(content_hash))
+
+
+def delete(content_hash: str) -> bool:
+    _texts.pop(content_hash)
+    try:
+        os.unlink(_entry_path(content_hash))
+        return True
+    except FileNotFoundError:
+        return False
@@ -0,0 +1,197 @@
+"""
+Tool-result summaries — what the model reads back after a tool call.
+
+The UI gets the full result of a tool: the Plotly figure and up to 50 table
+rows. The model needs much less, because it only has to talk about the
+result. Sending the figure JSON back (often megabytes of coordinates) costs
+tokens and latency on the follow-up completion and can overflow the context
+window. `compact` rewrites a result for the model:
+
+  - a plot becomes a description: chart type, title, axis titles and, per
+    trace, the point count with min / max / mean of numeric data or the
+    category count and the first few categories
+  - a table becomes its schema (column names and value types), the row
+    count and the first TOOL_RESULT_SAMPLE_ROWS rows
+  - anything else is bounded: strings are clipped to TOOL_RESULT_MAX_CHARS
+    and lists / dicts to TOOL_RESULT_MAX_ITEMS entries
+
+Errors, search hits and document context pass through except for those
+bounds. Only dicts are rewritten; the result the UI sees is never modified.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import math
+import os
+from typing import Any
+
+import numpy as np
+
+TOOL_RESULT_SAMPLE_ROWS = int(os.getenv("TOOL_RESULT_SAMPLE_ROWS", "10"))
+TOOL_RESULT_MAX_ITEMS = int(os.getenv("TOOL_RESULT_MAX_ITEMS", "50"))
+TOOL_RESULT_MAX_CHARS = int(os.getenv("TOOL_RESULT_MAX_CHARS", "4000"))
+TOOL_RESULT_CELL_CHARS = int(os.getenv("TOOL_RESULT_CELL_CHARS", "200"))
+
+# Trace keys holding the plotted data, in the order they are described
+_DATA_KEYS = ("x", "y", "z", "labels", "values")
+_MAX_CATEGORIES = 10
+
+
+# ── Plots ────────────────────────────────────────────────────────────────────
+
+def _array(value: Any) -> list[Any] | np.ndarray | None:
+    """A trace's data: a list, or a Plotly typed array ({"dtype", "bdata"})."""
+    if isinstance(value, dict) and "bdata" in value:
+        try:
+            return np.frombuffer(base64.b64decode(value["bdata"]), dtype=np.dtype(value["dtype"])).ravel()
+        except (TypeError, ValueError):
+            return None
+    if isinstance(value, list):
+        return value
+    return None
+
+
+def _round(value: float) -> float | None:
+    return round(float(value), 4) if math.isfinite(value) else None
+
+
+def _describe_values(values: list[Any] | np.ndarray) -> dict[str, Any]:
+    numeric = values if isinstance(values, np.ndarray) else None
+    if numeric is None:
+        try:
+            numeric = np.asarray(values, dtype=float)
+        except (TypeError, ValueError):
+            numeric = None
+    if numeric is not None and numeric.size:
+        finite = numeric[np.isfinite(numeric)] if numeric.dtype.kind == "f" else numeric
+        summary: dict[str, Any] = {"count": int(numeric.size)}
+        if finite.size:
+            summary.update(min=_round(finite.min()), max=_round(finite.max()), mean=_round(finite.mean()))
+        return summary
+
+    categories = list(dict.fromkeys(str(v) for v in values))
+    return {
+        "count": len(values),
+        "categories": len(categories),
+        "first_categories": [_clip(c, TOOL_RESULT_CELL_CHARS) for c in categories[:_MAX_CATEGORIES]],
+    }
+
+
+def _title(obj: Any) -> str | None:
+    if isinstance(obj, dict):
+        obj = obj.get("text")
+    return obj if isinstance(obj, str) and obj else None
+
+
+def describe_plot(plot_json: str) -> dict[str, Any]:
+    """A compact description of a Plotly figure's JSON."""
+    try:
+        figure = json.loads(plot_json)
+    except (TypeError, ValueError):
+        return {"error": "Unreadable figure."}
+
+    layout = figure.get("layout") or {}
+    description: dict[str, Any] = {"title": _title(layout.get("title"))}
+    for axis in ("xaxis", "yaxis"):
+        title = _title((layout.get(axis) or {}).get("title"))
+        if title:
+            description[f"{axis}_title"] = title
+
+    traces = []
+    for trace in (figure.get("data") or [])[:TOOL_RESULT_MAX_ITEMS]:
+        summary: dict[str, Any] = {"type": trace.get("type", "scatter")}
+        if trace.get("name"):
+            summary["name"] = _clip(str(trace["name"]), TOOL_RESULT_CELL_CHARS)
+        for key in _DATA_KEYS:
+            values = _array(trace.get(key))
+            if values is not None:
+                summary[key] = _describe_values(values)
+        traces.append(summary)
+    description["traces"] = traces
+    if len(figure.get("data") or []) > len(traces):
+        description["traces_total"] = len(figure["data"])
+    return description
+
+
+# ── Tables ───────────────────────────────────────────────────────────────────
+
+def _value_type(values: list[Any]) -> str:
+    kinds = {type(v).__name__ for v in values if v not in ("", None)}
+    if not kinds:
+        return "empty"
+    if kinds <= {"int", "float"} and "float" in kinds:
+        return "float"
+    return kinds.pop() if len(kinds) == 1 else "mixed"
+
+
+def _table(rows: list[dict[str, Any]], columns: list[Any], row_count: int | None) -> dict[str, Any]:
+    shown = rows[:TOOL_RESULT_SAMPLE_ROWS]
+    names = list(columns) or (list(rows[0]) if rows else [])
+    schema = [
+        {"name": str(name), "type": _value_type([row.get(name) for row in rows])}
+        for name in names[:TOOL_RESULT_MAX_ITEMS]
+    ]
+    table: dict[str, Any] = {
+        "columns": schema,
+        "row_count": row_count if row_count is not None else len(rows),
+        "sample": [
+            {key: _bound(value) for key, value in list(row.items())[:TOOL_RESULT_MAX_ITEMS]}
+            for row in shown
+        ],
+    }
+    if len(names) > len(schema):
+        table["columns_total"] = len(names)
+    if table["row_count"] > len(shown):
+        table["note"] = f"Sample of {len(shown)} rows; the user sees the table in the UI."
+    return table
+
+
+# ── Everything else ──────────────────────────────────────────────────────────
+
+def _clip(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    return text[:limit] + f"... [{len(text) - limit} more characters]"
+
+
+def _bound(value: Any, limit: int = TOOL_RESULT_CELL_CHARS) -> Any:
+    if isinstance(value, str):
+        return _clip(value, limit)
+    if isinstance(value, dict):
+        items = list(value.items())
+        bounded = {str(k): _bound(v, TOOL_RESULT_MAX_CHARS) for k, v in items[:TOOL_RESULT_MAX_ITEMS]}
+        if len(items) > TOOL_RESULT_MAX_ITEMS:
+            bounded["..."] = f"{len(items) - TOOL_RESULT_MAX_ITEMS} more entries"
+        return bounded
+    if isinstance(value, (list, tuple)):
+        bounded = [_bound(v, TOOL_RESULT_MAX_CHARS) for v in value[:TOOL_RESULT_MAX_ITEMS]]
+        if len(value) > TOOL_RESULT_MAX_ITEMS:
+            bounded.append(f"... {len(value) - TOOL_RESULT_MAX_ITEMS} more items")
+        return bounded
+    return value
+
+
+def _compact_dict(result: dict[str, Any]) -> dict[str, Any]:
+    data = result.get("data")
+    is_table = isinstance(data, list) and all(isinstance(row, dict) for row in data)
+    out: dict[str, Any] = {}
+    for key, value in result.items():
+        if key == "plot_json":
+            if value:
+                out["plot"] = describe_plot(value)
+        elif key == "data" and is_table:
+            out["table"] = _table(data, result.get("columns") or [], result.get("row_count"))
+        elif key in ("columns", "row_count") and is_table:
+            continue  # folded into "table"
+        elif key == "result" and isinstance(value, dict):
+            out[key] = _compact_dict(value)
+        else:
+            out[key] = _bound(value, TOOL_RESULT_MAX_CHARS)
+    return out
+
+
+def compact(result: dict[str, Any]) -> dict[str, Any]:
+    """The version of a tool result to send back to the model."""
+    return _compact_dict(result)
@@ -0,0 +1,457 @@
+"""
+Vector stores — where the knowledge base keeps chunk embeddings.
+
+Two interchangeable backends, selected with KB_VECTOR_BACKEND:
+
+- "chroma" (default): the persistent ChromaDB collection (HNSW index).
+- "numpy": an in-process exact index. Normalized embeddings live in a
+  memory-mapped .npy matrix (float32, or int8 with a per-row scale) next to
+  a pickled sidecar holding ids, texts and metadata. A query is one batched
+  matrix product plus a partial sort. Results are exact, and for small and
+  medium libraries the index opens faster and uses less memory than
+  the Chroma stack.
+
+Both accept Chroma-style `where` filters ($and, $or, $eq, $ne, $in, $nin,
+$gt, $gte, $lt, $lte) and return cosine similarities.
+"""
+
+from __future__ import annotations
+
+import operator
+import os
+import pickle
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Iterable, Sequence
+
+import numpy as np
+
+# (chunk_id, cosine similarity, text, metadata)
+Match = tuple[str, float, str, dict[str, Any]]
+
+
+class VectorStore(ABC):
+    """Chunk embeddings with their text and metadata, keyed by chunk id."""
+
+    @abstractmethod
+    def count(self) -> int: ...
+
+    @abstractmethod
+    def upsert(
+        self,
+        ids: list[str],
+        embeddings: Sequence[Sequence[float]],
+        documents: list[str],
+        metadatas: list[dict[str, Any]],
+    ) -> None: ...
+
+    @abstractmethod
+    def update_metadata(self, ids: list[str], metadatas: list[dict[str, Any]]) -> None: ...
+
+    @abstractmethod
+    def delete(self, ids: list[str]) -> None: ...
+
+    @abstractmethod
+    def get_ids(self, where: dict[str, Any] | None = None) -> list[str]: ...
+
+    @abstractmethod
+    def get_all(self) -> tuple[list[str], list[str], list[dict[str, Any]]]:
+        """Every stored (ids, documents, metadatas)."""
+
+    @abstractmethod
+    def query(
+        self,
+        embeddings: Sequence[Sequence[float]],
+        n: int,
+        where: dict[str, Any] | None = None,
+    ) -> list[list[Match]]:
+        """Top-n matches per query embedding, best first."""
+
+    def flush(self) -> None:
+        """Persist pending writes (no-op for stores that write through)."""
+
+
+# ── ChromaDB ─────────────────────────────────────────────────────────────────
+
+class ChromaStore(VectorStore):
+    """Persistent ChromaDB collection with cosine HNSW index."""
+
+    def __init__(self, path: str, name: str, embedding_function: Any = None):
+        import chromadb
+
+        self._client = chromadb.PersistentClient(path=path)
+        self._collection = self._client.get_or_create_collection(
+            name=name,
+            metadata={"hnsw:space": "cosine"},
+            embedding_function=embedding_function,
+        )
+
+    def count(self) -> int:
+        return self._collection.count()
+
+    def upsert(self, ids, embeddings, documents, metadatas) -> None:
+        self._collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def update_metadata(self, ids, metadatas) -> None:
+        self._collection.update(ids=ids, metadatas=metadatas)
+
+    def delete(self, ids) -> None:
+        self._collection.delete(ids=ids)
+
+    def get_ids(self, where=None) -> list[str]:
+        return self._collection.get(where=where, include=[])["ids"]
+
+    def get_all(self):
+        stored = self._collection.get(include=["documents", "metadatas"])
+        return stored["ids"], stored["documents"], stored["metadatas"]
+
+    def query(self, embeddings, n, where=None) -> list[list[Match]]:
+        count = self.count()
+        if count == 0 or len(embeddings) == 0:
+            return [[] for _ in embeddings]
+        results = self._collection.query(
+            query_embeddings=embeddings,
+            n_results=min(n, count),
+            where=where,
+        )
+        matches: list[list[Match]] = []
+        for q in range(len(embeddings)):
+            ids = results["ids"][q]
+            documents = results["documents"][q] if results["documents"] else [""] * len(ids)
+            distances = results["distances"][q] if results["distances"] else [1.0] * len(ids)
+            metadatas = results["metadatas"][q] if results["metadatas"] else [{}] * len(ids)
+            matches.append([
+                (ids[i], 1 - distances[i], documents[i], metadatas[i] or {})  # cosine similarity
+                for i in range(len(ids))
+            ])
+        return matches
+
+
+# ── Memory-mapped NumPy ──────────────────────────────────────────────────────
+
+_OPERATORS = {
+    "$eq": operator.eq,
+    "$ne": operator.ne,
+    "$in": lambda value, operand: value in operand,
+    "$nin": lambda value, operand: value not in operand,
+    "$gt": lambda value, operand: value is not None and value > operand,
+    "$gte": lambda value, operand: value is not None and value >= operand,
+    "$lt": lambda value, operand: value is not None and value < operand,
+    "$lte": lambda value, operand: value is not None and value <= operand,
+}
+
+
+def matches_where(metadata: dict[str, Any], where: dict[str, Any]) -> bool:
+    """Evaluate a Chroma-style `where` filter against one metadata dict."""
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, c) for c in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, c) for c in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for op, operand in condition.items():
+                if op not in _OPERATORS:
+                    raise ValueError(f"Unsupported filter operator: {op}")
+                if not _OPERATORS[op](value, operand):
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+def _doc_ids_in(where: dict[str, Any]) -> set[Any] | None:
+    """The doc_ids a filter restricts matches to, or None if it does not."""
+    for key, condition in where.items():
+        if key == "$and":
+            for clause in condition:
+                doc_ids = _doc_ids_in(clause)
+                if doc_ids is not None:
+                    return doc_ids
+        elif key == "doc_id":
+            if not isinstance(condition, dict):
+                return {condition}
+            if "$eq" in condition:
+                return {condition["$eq"]}
+            if "$in" in condition:
+                return set(condition["$in"])
+    return None
+
+
+class NumpyStore(VectorStore):
+    """
+    Exact cosine search over a memory-mapped embedding matrix.
+
+    Rows are L2-normalized on insert. With dtype "int8" each row is stored as
+    round(v * 127 / max|v|) plus a float32 scale, a quarter of the float32
+    size, and scores are dequantized block by block at query time. Deletes
+    move the last row into the freed slot, so the matrix stays dense. A
+    `where` filter selects rows before scoring, and a doc_id → rows index
+    finds a document's rows without evaluating the filter on every chunk.
+
+    The committed matrix is never written in place. The first write after a
+    `flush()` copies it to a new staging file, and `flush()` commits by
+    atomically replacing the sidecar, which names the matrix file it
+    describes. A crash between flushes leaves the last committed pair intact;
+    the orphaned staging file is removed on the next open.
+    """
+
+    DTYPES = ("float32", "int8")
+    _INITIAL_CAPACITY = 1024
+    _BLOCK_ROWS = 32768  # rows scored per matmul; bounds the int8 → float32 copy
+
+    def __init__(self, path: str, dtype: str = "float32"):
+        if dtype not in self.DTYPES:
+            raise ValueError(f"Unsupported vector dtype: {dtype}. Use one of {self.DTYPES}")
+        self.dtype = dtype
+        self._path = path
+        self._records_path = os.path.join(path, f"records.{dtype}.pkl")
+        os.makedirs(path, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._ids: list[str] = []
+        self._documents: list[str] = []
+        self._metadatas: list[dict[str, Any]] = []
+        self._rows: dict[str, int] = {}
+        self._doc_rows: dict[Any, set[int]] = {}  # doc_id -> rows, narrows scoped queries
+        self._vectors: np.ndarray | None = None  # memmap, capacity × dim
+        self._scales = np.ones(0, dtype=np.float32)  # int8 dequantization factors
+        self._committed: str | None = None  # matrix file named by the sidecar
+        self._staging: str | None = None  # matrix file written since the last flush
+        self._dirty = False
+        self._load()
+
+    # ── Persistence ──────────────────────────────────────────────────────
+
+    def _is_vectors_file(self, name: str) -> bool:
+        return name.startswith(f"vectors.{self.dtype}.") and name.endswith(".npy")
+
+    def _load(self) -> None:
+        if os.path.exists(self._records_path):
+            with open(self._records_path, "rb") as f:
+                state = pickle.load(f)
+            # Sidecars written before staging have no file name: the matrix had a fixed one
+            committed = state[4] if len(state) > 4 else f"vectors.{self.dtype}.npy"
+            if os.path.exists(os.path.join(self._path, committed)):
+                self._ids, self._documents, self._metadatas, scales = state[:4]
+                self._rows = {chunk_id: row for row, chunk_id in enumerate(self._ids)}
+                for row, meta in enumerate(self._metadatas):
+                    self._doc_rows.setdefault(meta.get("doc_id"), set()).add(row)
+                self._vectors = np.load(os.path.join(self._path, committed), mmap_mode="r")
+                self._scales = np.ones(len(self._vectors), dtype=np.float32)
+                self._scales[: len(scales)] = scales
+                self._committed = committed
+        for name in os.listdir(self._path):
+            if self._is_vectors_file(name) and name != self._committed:
+                self._remove(name)  # staged by a process that stopped before flushing
+
+    def _remove(self, name: str) -> None:
+        try:
+            os.remove(os.path.join(self._path, name))
+        except OSError:
+            pass  # still mapped (Windows); removed on the next open
+
+    def flush(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            if self._staging is not None:
+                self._vectors.flush()
+            committed = self._staging or self._committed
+            state = (
+                self._ids, self._documents, self._metadatas,
+                self._scales[: len(self._ids)].copy(), committed,
+            )
+            tmp = f"{self._records_path}.tmp"
+            with open(tmp, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._records_path)
+            if self._committed and self._committed != committed:
+                self._remove(self._committed)
+            self._committed, self._staging = committed, None
+            self._dirty = False
+
+    def _stage(self, rows: int, dim: int) -> None:
+        """Make `_vectors` a staging copy with room for `rows` rows."""
+        current = self._vectors
+        if current is not None and current.shape[1] != dim:
+            raise ValueError(f"Embedding dimension {dim} does not match the index ({current.shape[1]})")
+        if self._staging is not None and rows <= len(current):
+            return
+        if current is None:
+            capacity = max(self._INITIAL_CAPACITY, rows)
+        else:
+            capacity = max(rows, len(current) * 2) if rows > len(current) else len(current)
+        storage = np.int8 if self.dtype == "int8" else np.float32
+        name = f"vectors.{self.dtype}.{uuid.uuid4().hex[:12]}.npy"
+        staged = np.lib.format.open_memmap(
+            os.path.join(self._path, name), mode="w+", dtype=storage, shape=(capacity, dim)
+        )
+        if current is not None:
+            staged[: len(current)] = current
+        previous, self._vectors, self._staging = self._staging, staged, name
+        if previous is not None:
+            self._remove(previous)  # outgrown before it was committed
+        scales = np.ones(capacity, dtype=np.float32)
+        scales[: len(self._scales)] = self._scales[:capacity]
+        self._scales = scales
+
+    # ── Encoding ─────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _normalize(embeddings: Sequence[Sequence[float]]) -> np.ndarray:
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix[None, :]
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def _encode(self, normalized: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Return (stored rows, per-row dequantization scale)."""
+        if self.dtype == "float32":
+            return normalized, np.ones(len(normalized), dtype=np.float32)
+        peak = np.abs(normalized).max(axis=1)
+        peak[peak == 0] = 1.0
+        quantized = np.rint(normalized * (127.0 / peak)[:, None]).astype(np.int8)
+        return quantized, (peak / 127.0).astype(np.float32)
+
+    # ── Writes ───────────────────────────────────────────────────────────
+
+    def count(self) -> int:
+        return len(self._ids)
+
+    def _set_row(self, row: int, meta: dict[str, Any] | None, previous: dict[str, Any] | None) -> None:
+        """Keep `_doc_rows` in step with a row's metadata (None: row added / removed)."""
+        if previous is not None:
+            rows = self._doc_rows.get(previous.get("doc_id"))
+            if rows is not None:
+                rows.discard(row)
+                if not rows:
+                    del self._doc_rows[previous.get("doc_id")]
+        if meta is not None:
+            self._doc_rows.setdefault(meta.get("doc_id"), set()).add(row)
+
+    def upsert(self, ids, embeddings, documents, metadatas) -> None:
+        if not ids:
+            return
+        rows_data, scales = self._encode(self._normalize(embeddings))
+        with self._lock:
+            rows = []
+            for chunk_id, text, meta in zip(ids, documents, metadatas):
+                row = self._rows.get(chunk_id)
+                if row is None:
+                    row = len(self._ids)
+                    self._rows[chunk_id] = row
+                    self._ids.append(chunk_id)
+                    self._documents.append(text)
+                    self._metadatas.append(dict(meta))
+                    self._set_row(row, meta, None)
+                else:
+                    self._set_row(row, meta, self._metadatas[row])
+                    self._documents[row] = text
+                    self._metadatas[row] = dict(meta)
+                rows.append(row)
+            self._stage(len(self._ids), rows_data.shape[1])
+            self._vectors[rows] = rows_data
+            self._scales[rows] = scales
+            self._dirty = True
+
+    def update_metadata(self, ids, metadatas) -> None:
+        with self._lock:
+            for chunk_id, meta in zip(ids, metadatas):
+                row = self._rows.get(chunk_id)
+                if row is not None:
+                    self._set_row(row, meta, self._metadatas[row])
+                    self._metadatas[row] = dict(meta)
+            self._dirty = True
+
+    def delete(self, ids) -> None:
+        with self._lock:
+            if not any(chunk_id in self._rows for chunk_id in ids):
+                return
+            self._stage(len(self._ids), self._vectors.shape[1])
+            for chunk_id in ids:
+                row = self._rows.pop(chunk_id, None)
+                if row is None:
+                    continue
+                last = len(self._ids) - 1
+                self._set_row(row, None, self._metadatas[row])
+                if row != last:
+                    self._set_row(last, None, self._metadatas[last])
+                    self._set_row(row, self._metadatas[last], None)
+                    self._vectors[row] = self._vectors[last]
+                    self._scales[row] = self._scales[last]
+                    self._ids[row] = self._ids[last]
+                    self._documents[row] = self._documents[last]
+                    self._metadatas[row] = self._metadatas[last]
+                    self._rows[self._ids[row]] = row
+                self._ids.pop()
+                self._documents.pop()
+                self._metadatas.pop()
+            self._dirty = True
+
+    # ── Reads ────────────────────────────────────────────────────────────
+
+    def get_ids(self, where=None) -> list[str]:
+        with self._lock:
+            if not where:
+                return list(self._ids)
+            return [i for i, m in zip(self._ids, self._metadatas) if matches_where(m, where)]
+
+    def get_all(self):
+        with self._lock:
+            return list(self._ids), list(self._documents), [dict(m) for m in self._metadatas]
+
+    def _candidate_rows(self, where: dict[str, Any]) -> Iterable[int]:
+        """Rows that can match `where`: those of its documents if it names any, else all."""
+        doc_ids = _doc_ids_in(where)
+        if doc_ids is None:
+            return range(len(self._ids))
+        return sorted(row for doc_id in doc_ids for row in self._doc_rows.get(doc_id, ()))
+
+    def query(self, embeddings, n, where=None) -> list[list[Match]]:
+        if len(embeddings) == 0:
+            return []
+        queries = self._normalize(embeddings)
+        with self._lock:
+            count = len(self._ids)
+            if count == 0 or n <= 0:
+                return [[] for _ in range(len(queries))]
+
+            # Filter before scoring, so a narrow scope only reads and scores its own rows
+            selected = None
+            if where:
+                selected = np.fromiter(
+                    (row for row in self._candidate_rows(where) if matches_where(self._metadatas[row], where)),
+                    dtype=np.intp,
+                )
+                if len(selected) == 0:
+                    return [[] for _ in range(len(queries))]
+            candidates = count if selected is None else len(selected)
+
+            scores = np.empty((len(queries), candidates), dtype=np.float32)
+            for start in range(0, candidates, self._BLOCK_ROWS):
+                end = min(start + self._BLOCK_ROWS, candidates)
+                rows = slice(start, end) if selected is None else selected[start:end]
+                block = self._vectors[rows]
+                if self.dtype == "int8":
+                    scores[:, start:end] = (queries @ block.astype(np.float32).T) * self._scales[rows]
+                else:
+                    scores[:, start:end] = queries @ block.T
+
+            k = min(n, candidates)
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+            rows = top if selected is None else selected[top]  # back to matrix rows
+            return [
+                [
+                    (self._ids[j], float(scores[q, i]), self._documents[j], self._metadatas[j])
+                    for i, j in zip(top[q], rows[q])
+                ]
+                for q in range(len(queries))
+            ]
@@ -1,10 +1,13 @@
 """
 In-memory data store for the Lab Co-Pilot application.
-Holds uploaded DataFrames, conversation history, and document metadata.
+Holds uploaded DataFrames and conversation history. Document metadata is
+persisted in services.doc_catalog.
 """
 
 from __future__ import annotations
 
+import itertools
+
 import pandas as pd
 from typing import Any
 
@@ -15,22 +18,41 @@ data_frames: dict[str, pd.DataFrame] = {}
 # Metadata about uploaded data files (original filename, columns, row count)
 data_meta: dict[str, dict[str, Any]] = {}
 
+# Monotonic version per file_id, bumped whenever a frame is (re)registered.
+# Caches keyed on a dataset use (file_id, version) so they never go stale.
+data_versions: dict[str, int] = {}
+_version_counter = itertools.count(1)
+
 # The "active" dataset id that the chat/LLM will operate on by default
 active_dataset_id: str | None = None
 
-# ── Document store ───────────────────────────────────────────────────────────
-# Key = doc_id (str), Value = {"name": str, "num_chunks": int, "entities": [...]}
-document_meta: dict[str, dict[str, Any]] = {}
-
 # ── Chat history ─────────────────────────────────────────────────────────────
+# Managed by services.history: recent messages (plot/table payloads live on
+# disk, referenced by payload_id) and abbreviated lines for evicted ones
 conversation_history: list[dict[str, Any]] = []
+conversation_summary: list[str] = []
+
+
+def put_data_frame(file_id: str, df: pd.DataFrame, meta: dict[str, Any]) -> None:
+    """Register (or replace) a dataset and bump its version."""
+    data_frames[file_id] = df
+    data_meta[file_id] = meta
+    data_versions[file_id] = next(_version_counter)
+
+
+def drop_data_frame(file_id: str) -> pd.DataFrame | None:
+    """Forget a dataset; returns its frame, or None if it was not registered."""
+    data_meta.pop(file_id, None)
+    data_versions.pop(file_id, None)
+    return data_frames.pop(file_id, None)
 
 
 def clear_all() -> None:
     """Reset everything – useful for testing."""
     data_frames.clear()
     data_meta.clear()
-    document_meta.clear()
+    data_versions.clear()
     conversation_history.clear()
+    conversation_summary.clear()
     global active_dataset_id
     active_dataset_id = None
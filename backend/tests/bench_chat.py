@@ -0,0 +1,86 @@
+"""
+Chat latency benchmark — time until the user sees the answer start, for the
+blocking completion call vs the async streaming API, on the same prompts
+against the real Mistral API.
+
+Run (needs MISTRAL_API_KEY; each round makes two API calls per prompt):
+    cd backend
+    .venv/bin/python tests/bench_chat.py
+
+Set BENCH_ROUNDS to change the number of rounds (default 3).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from dotenv import load_dotenv  # noqa: E402
+
+load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
+
+from services import llm  # noqa: E402
+
+BENCH_ROUNDS = int(os.getenv("BENCH_ROUNDS", "3"))
+SEPARATOR = "=" * 70
+
+PROMPTS = [
+    "In two sentences, what does a Western blot measure?",
+    "List five common cell lines used in cancer research with one line each.",
+    "Explain the difference between IC50 and EC50 in a short paragraph.",
+]
+
+
+def blocking(client, prompt: str) -> float:
+    t0 = time.perf_counter()
+    client.chat.complete(model=llm._model, messages=[{"role": "user", "content": prompt}])
+    return time.perf_counter() - t0
+
+
+async def streamed(client, prompt: str) -> tuple[float, float]:
+    """(time to first token, total time)"""
+    t0 = time.perf_counter()
+    first = None
+    async for kind, _ in llm._stream_completion(client, [{"role": "user", "content": prompt}]):
+        if kind == "token" and first is None:
+            first = time.perf_counter() - t0
+    return first or 0.0, time.perf_counter() - t0
+
+
+def main() -> None:
+    client = llm._get_client()
+    print("\n🔬  Lab Co-Pilot — Chat Latency Benchmark")
+    print(f"    Model: {llm._model}   Prompts: {len(PROMPTS)}   Rounds: {BENCH_ROUNDS}")
+    print(f"\n{SEPARATOR}")
+    print(f"{'prompt':8s} {'blocking s':>12s} {'stream TTFT s':>15s} {'stream total s':>16s}")
+    print(SEPARATOR)
+
+    # Blocking calls first, then every streamed call on one event loop (the
+    # client's async connection pool belongs to the loop it was opened on)
+    blocked = [[blocking(client, p) for _ in range(BENCH_ROUNDS)] for p in PROMPTS]
+
+    async def stream_all() -> list[list[tuple[float, float]]]:
+        return [[await streamed(client, p) for _ in range(BENCH_ROUNDS)] for p in PROMPTS]
+
+    totals = [0.0, 0.0, 0.0]
+    for i, (block, runs) in enumerate(zip(blocked, asyncio.run(stream_all())), 1):
+        means = [
+            sum(block) / len(block),
+            sum(ttft for ttft, _ in runs) / len(runs),
+            sum(total for _, total in runs) / len(runs),
+        ]
+        totals = [t + m for t, m in zip(totals, means)]
+        print(f"{i:<8d} {means[0]:12.2f} {means[1]:15.2f} {means[2]:16.2f}")
+
+    print(SEPARATOR)
+    n = len(PROMPTS)
+    print(f"{'mean':8s} {totals[0] / n:12.2f} {totals[1] / n:15.2f} {totals[2] / n:16.2f}")
+    print("    blocking = whole answer before anything is shown; TTFT = first streamed token")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+PDF extraction benchmark — pages/second for pdfplumber (layout analysis) vs
+the pdfium fast path, each serial and on the extraction process pool, on a
+synthetic text-heavy multi-page PDF; and for reading the same pages back
+from the extracted-text cache, which is what a library re-index does.
+
+Run:
+    cd backend
+    .venv/bin/python tests/bench_pdf.py
+
+Set BENCH_PAGES to change the page count (default 200) and
+PDF_EXTRACT_WORKERS to change the pool size.
+"""
+
+from __future__ import annotations
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+os.environ["TEXT_CACHE_PATH"] = tempfile.mkdtemp(prefix="bench_text_cache_")
+
+from services import doc_processor, text_cache  # noqa: E402
+
+BENCH_PAGES = int(os.getenv("BENCH_PAGES", "200"))
+LINES_PER_PAGE = 50
+SEPARATOR = "=" * 70
+
+WORDS = ("expression regulation pathway binding assay inhibitor cell line "
+         "tumour response dose protein receptor signalling kinase mutation").split()
+
+
+def make_pdf(pages: list[list[str]]) -> bytes:
+    """Minimal PDF 1.4 writer: one Helvetica text stream per page."""
+    n = len(pages)
+    font = 3 + 2 * n
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{3 + 2 * i} 0 R' for i in range(n))}] /Count {n} >>",
+    ]
+    for i, lines in enumerate(pages):
+        escaped = (line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for line in lines)
+        stream = "BT /F1 9 Tf 40 760 Td 14 TL " + " ".join(f"({line}) '" for line in escaped) + " ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 {font} 0 R >> >> /Contents {4 + 2 * i} 0 R >>"
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects):
+        offsets.append(len(out))
+        out += f"{i + 1} 0 obj\n{obj}\nendobj\n".encode()
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def main() -> None:
+    rng = random.Random(0)
+    pages = [
+        [f"{p}.{i} GENE{rng.randint(1, 999)} " + " ".join(rng.choice(WORDS) for _ in range(12))
+         for i in range(LINES_PER_PAGE)]
+        for p in range(1, BENCH_PAGES + 1)
+    ]
+    pdf = make_pdf(pages)
+
+    print("\n🔬  Lab Co-Pilot — PDF Extraction Benchmark")
+    print(f"    Pages: {BENCH_PAGES}   Size: {len(pdf) / 2**20:.1f} MB   "
+          f"Workers: {doc_processor.PDF_EXTRACT_WORKERS}   CPUs: {os.cpu_count()}")
+    print(f"\n{SEPARATOR}")
+    print(f"{'extractor':28s} {'seconds':>10s} {'pages/s':>10s}")
+    print(SEPARATOR)
+
+    for name, layout, parallel in (
+        ("pdfplumber, serial", True, False),
+        ("pdfplumber, process pool", True, True),
+        ("pdfium, serial", False, False),
+        ("pdfium, process pool", False, True),
+    ):
+        if parallel:
+            list(doc_processor.iter_pages(make_pdf(pages[:1]), layout, parallel=True))  # start workers
+        t0 = time.perf_counter()
+        extracted = list(doc_processor.iter_pages(pdf, layout=layout, parallel=parallel))
+        elapsed = time.perf_counter() - t0
+        assert [n for n, _ in extracted] == list(range(1, BENCH_PAGES + 1))
+        print(f"{name:28s} {elapsed:10.2f} {BENCH_PAGES / elapsed:10.1f}")
+
+    try:
+        text_cache.put("bench", extracted)
+        t0 = time.perf_counter()
+        cached = text_cache.get("bench")
+        elapsed = time.perf_counter() - t0
+        assert cached == extracted
+        print(f"{'text cache read':28s} {elapsed:10.2f} {BENCH_PAGES / elapsed:10.1f}")
+    finally:
+        shutil.rmtree(text_cache.TEXT_CACHE_PATH, ignore_errors=True)
+
+    doc_processor.shutdown_extract_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Sandbox benchmark — measures the cost of handing a DataFrame to
+LLM-generated code and the end-to-end latency of `execute_code`.
+
+Run:
+    cd backend
+    .venv/bin/python tests/bench_sandbox.py
+
+Set BENCH_ROWS to change the dataset size (default 2,000,000 rows).
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import store  # noqa: E402
+from services import sandbox  # noqa: E402
+
+BENCH_ROWS = int(os.getenv("BENCH_ROWS", "2000000"))
+REPEAT = 5
+
+SEPARATOR = "=" * 70
+
+
+def make_frame(rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "sample": rng.integers(0, 1000, rows),
+        "gene_A": rng.random(rows),
+        "gene_B": rng.random(rows),
+        "dose": rng.normal(5, 2, rows),
+        "group": rng.choice(["ctrl", "treated"], rows),
+    })
+
+
+def measure(label: str, fn) -> None:
+    """Print the best wall time and the tracemalloc peak of `fn()`."""
+    times = []
+    peak = 0
+    for _ in range(REPEAT):
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - t0)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        del out
+    print(f"  {label:32s} best={min(times) * 1000:9.3f} ms   peak={peak / 2**20:9.2f} MB")
+
+
+def bench_handoff(df: pd.DataFrame) -> None:
+    print(f"\n{SEPARATOR}\nHandoff of the dataset to sandbox code\n{SEPARATOR}")
+    # What a worker sees: the frame attached read-only from shared memory
+    shared = sandbox._SharedFrame(df)
+    frames = sandbox._AttachedFrames()
+    attached = frames.get(shared.handle)
+
+    measure("before: df.copy()", lambda: attached.copy())
+    measure("after:  copy-on-write view", lambda: sandbox._sandbox_view(attached))
+
+    del attached
+    frames.clear()
+    shared.release()
+
+
+def bench_execute(df: pd.DataFrame) -> None:
+    print(f"\n{SEPARATOR}\nexecute_code end to end\n{SEPARATOR}")
+    snippet = "result = df.groupby('group')['gene_A'].mean()"
+
+    t0 = time.perf_counter()
+    sandbox.execute_code(snippet, df)
+    print(f"  first call (export + attach)     {(time.perf_counter() - t0) * 1000:9.3f} ms")
+
+    times = []
+    for _ in range(REPEAT):
+        t0 = time.perf_counter()
+        out = sandbox.execute_code(snippet, df)
+        times.append(time.perf_counter() - t0)
+    print(f"  warm call                        best={min(times) * 1000:9.3f} ms")
+    if out["error"]:
+        print(f"  ⚠️  snippet failed: {out['error']}")
+
+    store.put_data_frame("bench", df, {"filename": "bench"})
+    sandbox.execute_code(snippet, df, dataset_id="bench")
+    times = []
+    for _ in range(REPEAT):
+        t0 = time.perf_counter()
+        out = sandbox.execute_code(snippet, df, dataset_id="bench")
+        times.append(time.perf_counter() - t0)
+    print(f"  memoized call (cached={out['cached']})     best={min(times) * 1000:9.3f} ms")
+
+
+def main() -> None:
+    print("\n🔬  Lab Co-Pilot — Sandbox Benchmark")
+    df = make_frame(BENCH_ROWS)
+    size_mb = df.memory_usage(deep=True).sum() / 2**20
+    print(f"    Dataset: {len(df):,} rows, {size_mb:.1f} MB")
+
+    bench_handoff(df)
+    bench_execute(df)
+    sandbox.shutdown_pool()
+
+
+if __name__ == "__main__":
+    main()
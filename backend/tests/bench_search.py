@@ -0,0 +1,93 @@
+"""
+Document search benchmark — latency of each `knowledge_base.search` mode
+on a synthetic library whose chunks mention gene symbols and compound IDs,
+and of one batched multi-query search against the same queries run one by one.
+
+Run (uses a throwaway Chroma directory, not your real one):
+    cd backend
+    .venv/bin/python tests/bench_search.py
+
+Set BENCH_CHUNKS to change the library size (default 5,000 chunks).
+"""
+
+from __future__ import annotations
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+BENCH_CHUNKS = int(os.getenv("BENCH_CHUNKS", "5000"))
+QUERIES = 50
+SEPARATOR = "=" * 70
+
+# Point the knowledge base at a scratch directory before importing it
+os.environ["CHROMA_DB_PATH"] = tempfile.mkdtemp(prefix="bench_kb_")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from services import knowledge_base as kb  # noqa: E402
+
+WORDS = ("expression regulation pathway binding assay inhibitor cell line "
+         "tumour response dose protein receptor signalling kinase mutation").split()
+
+
+def make_library(n: int) -> tuple[list[str], list[str]]:
+    """Return (chunks, identifiers); chunk i mentions GENE{i} and CHEMBL{i}."""
+    rng = random.Random(0)
+    chunks, idents = [], []
+    for i in range(n):
+        filler = " ".join(rng.choice(WORDS) for _ in range(60))
+        chunks.append(f"GENE{i} was measured with compound CHEMBL{i}. {filler}")
+        idents.append(f"CHEMBL{i}")
+    return chunks, idents
+
+
+def main() -> None:
+    print("\n🔬  Lab Co-Pilot — Document Search Benchmark")
+    print(f"    Chunks: {BENCH_CHUNKS:,}   Chroma dir: {os.environ['CHROMA_DB_PATH']}")
+
+    chunks, idents = make_library(BENCH_CHUNKS)
+    t0 = time.perf_counter()
+    kb.add_document("bench", "bench.pdf", chunks)
+    print(f"    Indexed in {time.perf_counter() - t0:.1f}s")
+
+    queries = random.Random(1).sample(idents, QUERIES)
+
+    print(f"\n{SEPARATOR}")
+    print(f"{'mode':10s} {'p50 ms':>10s} {'p95 ms':>10s} {'hit@5':>8s}")
+    print(SEPARATOR)
+    for mode in kb.SEARCH_MODES:
+        times, found = [], 0
+        for q in queries:
+            kb._search_results.clear()  # measure the uncached path
+            t0 = time.perf_counter()
+            hits = kb.search(q, top_k=5, mode=mode)
+            times.append((time.perf_counter() - t0) * 1000)
+            found += any(q in h["text"].split() or f"{q}." in h["text"] for h in hits)
+        times.sort()
+        p50 = times[len(times) // 2]
+        p95 = times[int(len(times) * 0.95) - 1]
+        print(f"{mode:10s} {p50:10.3f} {p95:10.3f} {found / len(queries):8.2f}")
+
+    print(f"\n{SEPARATOR}")
+    print(f"{QUERIES} vector queries, uncached (query embeddings and results cleared)")
+    print(SEPARATOR)
+    kb._query_embeddings.clear()
+    kb._search_results.clear()
+    t0 = time.perf_counter()
+    for q in queries:
+        kb.search(q, top_k=5)
+    sequential = time.perf_counter() - t0
+
+    kb._query_embeddings.clear()
+    kb._search_results.clear()
+    t0 = time.perf_counter()
+    kb.search(queries, top_k=5)
+    batched = time.perf_counter() - t0
+    print(f"  one call per query : {sequential * 1000:10.1f} ms")
+    print(f"  one batched call   : {batched * 1000:10.1f} ms   ({sequential / batched:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Vector store benchmark — Chroma vs the memory-mapped NumPy index (float32
+and int8) on synthetic clustered embeddings: build time, reopen time, query
+latency (single and batched) and recall@10 against exact search.
+
+Run (uses throwaway directories, not your real index):
+    cd backend
+    .venv/bin/python tests/bench_vector_store.py
+
+Set BENCH_VECTORS to change the number of stored embeddings (default 20,000).
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from services.vector_store import ChromaStore, NumpyStore  # noqa: E402
+
+BENCH_VECTORS = int(os.getenv("BENCH_VECTORS", "20000"))
+DIM = 384  # all-MiniLM-L6-v2, the default embedding model
+QUERIES = 100
+BATCH = 32
+TOP_K = 10
+ADD_BATCH = 1000
+SEPARATOR = "=" * 78
+
+# Reopening runs in a fresh interpreter: Chroma caches clients per path, so an
+# in-process reopen would not touch the disk. Imports are excluded from the time.
+REOPEN_SCRIPT = """
+import sys, time
+import numpy as np
+sys.path.insert(0, {backend!r})
+from services.vector_store import ChromaStore, NumpyStore
+query = np.load({query!r})
+t0 = time.perf_counter()
+store = {factory}
+store.query(query, {k})
+print(time.perf_counter() - t0)
+"""
+
+
+def make_vectors(n: int, rng: np.random.Generator) -> np.ndarray:
+    """Unit vectors around 200 topic centres, like chunks from related papers."""
+    centres = rng.standard_normal((200, DIM)).astype(np.float32)
+    labels = rng.integers(0, len(centres), n)
+    vectors = centres[labels] + 0.8 * rng.standard_normal((n, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> list[set[int]]:
+    scores = queries @ vectors.T
+    return [set(np.argsort(-row)[:k]) for row in scores]
+
+
+def dir_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, f))
+        for root, _, files in os.walk(path)
+        for f in files
+    )
+
+
+def open_store(factory: str, path: str):
+    """`factory` is a constructor expression shared with REOPEN_SCRIPT."""
+    return eval(factory.format(path=path), {"ChromaStore": ChromaStore, "NumpyStore": NumpyStore})
+
+
+def reopen_seconds(factory: str, path: str, query: np.ndarray) -> float:
+    """Open the store at `path` in a new process and run one query."""
+    query_path = os.path.join(path, "query.npy")
+    np.save(query_path, query)
+    script = REOPEN_SCRIPT.format(
+        backend=os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."),
+        query=query_path,
+        factory=factory.format(path=path),
+        k=TOP_K,
+    )
+    out = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def bench(name: str, factory: str, vectors: np.ndarray, queries: np.ndarray, truth: list[set[int]]) -> None:
+    path = tempfile.mkdtemp(prefix=f"bench_{name}_")
+    try:
+        store = open_store(factory, path)
+        ids = [str(i) for i in range(len(vectors))]
+        t0 = time.perf_counter()
+        for start in range(0, len(vectors), ADD_BATCH):
+            end = start + ADD_BATCH
+            store.upsert(ids[start:end], vectors[start:end],
+                         [""] * len(ids[start:end]),
+                         [{"doc_id": "bench", "chunk_index": i} for i in range(start, min(end, len(ids)))])
+        store.flush()
+        build = time.perf_counter() - t0
+        del store
+
+        reopen = reopen_seconds(factory, path, queries[:1])
+        store = open_store(factory, path)
+        store.query(queries[:1], TOP_K)
+
+        single = []
+        found = 0
+        for q, expected in zip(queries, truth):
+            t0 = time.perf_counter()
+            hits = store.query(q[None, :], TOP_K)[0]
+            single.append((time.perf_counter() - t0) * 1000)
+            found += len(expected & {int(h[0]) for h in hits})
+        single.sort()
+
+        t0 = time.perf_counter()
+        for start in range(0, len(queries), BATCH):
+            store.query(queries[start:start + BATCH], TOP_K)
+        batched = (time.perf_counter() - t0) * 1000 / len(queries)
+
+        print(f"{name:14s} {build:8.2f} {reopen:9.3f} {single[len(single) // 2]:8.3f} "
+              f"{single[int(len(single) * 0.95) - 1]:8.3f} {batched:9.3f} "
+              f"{found / (len(truth) * TOP_K):8.3f} {dir_size(path) / 2**20:8.1f}")
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def main() -> None:
+    print("\n🔬  Lab Co-Pilot — Vector Store Benchmark")
+    print(f"    Vectors: {BENCH_VECTORS:,} × {DIM}   Queries: {QUERIES}   top-{TOP_K}")
+
+    rng = np.random.default_rng(0)
+    vectors = make_vectors(BENCH_VECTORS, rng)
+    queries = make_vectors(QUERIES, np.random.default_rng(1))
+    truth = exact_top_k(vectors, queries, TOP_K)
+
+    print(f"\n{SEPARATOR}")
+    print(f"{'backend':14s} {'build s':>8s} {'reopen s':>9s} {'p50 ms':>8s} {'p95 ms':>8s} "
+          f"{'batch ms':>9s} {'recall':>8s} {'disk MB':>8s}")
+    print(SEPARATOR)
+    bench("chroma", "ChromaStore({path!r}, 'bench')", vectors, queries, truth)
+    bench("numpy-float32", "NumpyStore({path!r}, 'float32')", vectors, queries, truth)
+    bench("numpy-int8", "NumpyStore({path!r}, 'int8')", vectors, queries, truth)
+    print(SEPARATOR)
+    print("    reopen s = open from disk in a new process + first query; batch ms = per-query")
+    print(f"    time in batches of {BATCH}; recall = recall@{TOP_K} vs exact search")
+
+
+if __name__ == "__main__":
+    main()